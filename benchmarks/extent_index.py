@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Compare the query plans and timings of GetMap-style dataset searches against one or more
+space-time extent relations (e.g. the space_time_view materialised view and a partitioned
+extent index table built with ``datacube-ows-update --schema --extent-index``).
+
+Uses the DATACUBE_OWS_CFG environment variable to find the OWS config file.
+"""
+import random
+import statistics
+import sys
+
+import click
+from datacube.utils import geometry
+from sqlalchemy import MetaData
+
+from datacube_ows.cube_pool import cube
+from datacube_ows.mv_index import (MVSelectOpts, get_sqlalc_engine,
+                                   get_st_view, mv_search_query)
+from datacube_ows.ows_configuration import get_config
+
+
+@click.command()
+@click.option("--relation", "relations", multiple=True, default=["space_time_view"], show_default=True,
+              help="Space-time extent relation to query (may be repeated to compare relations).")
+@click.option("--samples", default=50, show_default=True, help="Number of random tile queries per relation.")
+@click.option("--tile-degrees", default=0.5, show_default=True, help="Width and height of each tile query, in degrees.")
+@click.option("--seed", default=0, show_default=True, help="Random seed for choosing tiles and dates.")
+@click.option("--show-plan", is_flag=True, default=False, help="Print the query plan of the first query for each relation.")
+@click.argument("layer")
+def main(layer, relations, samples, tile_degrees, seed, show_plan):
+    """Benchmark dataset searches for LAYER against space-time extent relations."""
+    cfg = get_config()
+    lyr = cfg.product_index.get(layer)
+    if lyr is None or not lyr.ready or lyr.hide:
+        print(f"Sorry, unknown or unavailable layer: {layer}")
+        sys.exit(1)
+    queries = sample_queries(lyr, samples, tile_degrees, random.Random(seed))
+    tables = {name: get_st_view(MetaData(), name) for name in relations}
+    results = {name: [] for name in relations}
+    with cube() as dc:
+        engine = get_sqlalc_engine(dc.index)
+        with engine.connect() as conn:
+            for i, (date, geom) in enumerate(queries):
+                # Interleave relations, so caching effects are shared evenly.
+                for name, stv in tables.items():
+                    s, _, _ = mv_search_query(stv, MVSelectOpts.IDS, [date], geom, lyr.products)
+                    plan = explain(conn, s)
+                    if show_plan and i == 0:
+                        print(f"Plan for {name}:")
+                        print_plan(plan["Plan"])
+                    results[name].append(plan_stats(plan))
+    print(f"{samples} queries for layer {layer} ({tile_degrees} degree tiles):")
+    for name, stats in results.items():
+        print(f"  {name}: {summarise(stats)}")
+    return 0
+
+
+def sample_queries(lyr, samples, tile_degrees, rng):
+    """
+    Choose random tile queries within a layer's extent.
+
+    :return: A list of (date, EPSG:4326 geometry) tuples
+    """
+    ranges = lyr.ranges
+    times = ranges["times"]
+    lon, lat = ranges["lon"], ranges["lat"]
+    queries = []
+    for _ in range(samples):
+        x = rng.uniform(lon["min"], max(lon["min"], lon["max"] - tile_degrees))
+        y = rng.uniform(lat["min"], max(lat["min"], lat["max"] - tile_degrees))
+        geom = geometry.box(x, y, x + tile_degrees, y + tile_degrees, "EPSG:4326")
+        queries.append((times[rng.randrange(len(times))], geom))
+    return queries
+
+
+def explain(conn, s):
+    compiled = s.compile(dialect=conn.dialect)
+    result = conn.exec_driver_sql(
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + str(compiled),
+        compiled.params
+    )
+    return result.scalar()[0]
+
+
+def plan_stats(plan):
+    return {
+        "planning": plan["Planning Time"],
+        "execution": plan["Execution Time"],
+        "relations": len(list(relations_scanned(plan["Plan"]))),
+        "buffers": plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0),
+    }
+
+
+def relations_scanned(node):
+    if "Relation Name" in node:
+        yield node["Relation Name"]
+    for child in node.get("Plans", []):
+        yield from relations_scanned(child)
+
+
+def print_plan(node, depth=0):
+    label = node["Node Type"]
+    if "Relation Name" in node:
+        label += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    print(f"{'  ' * (depth + 1)}{label} (rows={node.get('Actual Rows')}, {node.get('Actual Total Time')}ms)")
+    for child in node.get("Plans", []):
+        print_plan(child, depth + 1)
+
+
+def summarise(stats):
+    def med(key):
+        return statistics.median(s[key] for s in stats)
+
+    def p95(key):
+        values = sorted(s[key] for s in stats)
+        return values[min(len(values) - 1, int(len(values) * 0.95))]
+    return (f"planning {med('planning'):.2f}ms (p95 {p95('planning'):.2f}ms), "
+            f"execution {med('execution'):.2f}ms (p95 {p95('execution'):.2f}ms), "
+            f"{med('relations'):.0f} relations scanned, {med('buffers'):.0f} buffers")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""
+Measure the per-search Python overhead of preparing a mv_search dataset query (everything
+up to handing the SQL and parameters to the database driver), comparing:
+
+* build: building the SQLAlchemy query and compiling it (as with no SQLAlchemy statement cache)
+* build+cache_key: building the SQLAlchemy query and generating its statement cache key
+  (the minimum work per execution with a warm SQLAlchemy statement cache)
+* cached: the mv_search query shape cache (SQL lookup and parameters, with the search geometry as WKB)
+
+Does not require a database.
+"""
+import datetime
+import statistics
+import timeit
+from types import SimpleNamespace
+
+import click
+from datacube.utils import geometry
+from psycopg2 import Binary
+from sqlalchemy.dialects.postgresql import psycopg2 as pg_dialect
+
+from datacube_ows.mv_index import (MVQueryCache, MVSelectOpts, _search_geom,
+                                   _time_term, mv_search_query, st_view)
+
+
+@click.command()
+@click.option("--iterations", default=2000, show_default=True, help="Number of searches per timing run.")
+@click.option("--repeat", default=5, show_default=True, help="Number of timing runs (the median is reported).")
+@click.option("--times", "n_times", default=1, show_default=True, help="Number of time values per search.")
+@click.option("--products", "n_products", default=1, show_default=True, help="Number of products per search.")
+@click.option("--crs", default="EPSG:3857", show_default=True, help="CRS of the search geometry.")
+def main(iterations, repeat, n_times, n_products, crs):
+    """Benchmark the Python overhead of preparing mv_search queries."""
+    dialect = pg_dialect.dialect()
+    cache = MVQueryCache()
+    products = [SimpleNamespace(id=i + 1) for i in range(n_products)]
+    times = [datetime.date(2020, 1, 1) + datetime.timedelta(days=16 * i) for i in range(n_times)]
+    geom = geometry.box(1000000, -4000000, 1100000, -3900000, "EPSG:3577").to_crs(crs)
+
+    def build():
+        s, _, _ = mv_search_query(st_view, MVSelectOpts.COUNT, times, geom, products)
+        compiled = s.compile(dialect=dialect)
+        return str(compiled), compiled.params
+
+    def build_cache_key():
+        s, _, _ = mv_search_query(st_view, MVSelectOpts.COUNT, times, geom, products)
+        return s._generate_cache_key()  # pylint: disable=protected-access
+
+    def cached():
+        g, _ = _search_geom(geom)
+        terms = [_time_term(t) for t in times]
+        query = cache.query(cache.shape(MVSelectOpts.COUNT, terms, True))
+        params = [[p.id for p in products]]
+        for term in terms:
+            params.extend(term)
+        params.append(Binary(g.geom.wkb))
+        return query.sql, tuple(params)
+
+    # The search geometry must be reprojected to EPSG:4326 on every path - time it separately.
+    def reproject():
+        return _search_geom(geom)
+
+    print(f"Python overhead per search ({n_times} times, {n_products} products, {crs} geometry):")
+    for name, func in (("reproject only", reproject),
+                       ("build", build),
+                       ("build+cache_key", build_cache_key),
+                       ("cached", cached)):
+        func()
+        runs = timeit.repeat(func, number=iterations, repeat=repeat)
+        per_call = statistics.median(runs) / iterations * 1e6
+        print(f"  {name:16} {per_call:8.1f}us")
+    return 0
+
+
+if __name__ == '__main__':
+    main()
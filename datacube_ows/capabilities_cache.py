@@ -0,0 +1,216 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import gzip
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import (Any, Callable, Hashable, MutableMapping, Optional, Tuple,
+                    Type, Union)
+
+from datacube_ows.cube_pool import cube
+from datacube_ows.ogc_exceptions import OGCException
+from datacube_ows.ogc_utils import cache_control_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class CachedDocument:
+    """
+    A rendered capabilities document, with pre-compressed variants and a strong ETag.
+    """
+    def __init__(self, body: Union[str, bytes], content_type: str, update_sequence: Optional[str]) -> None:
+        """
+        :param body: The rendered document
+        :param content_type: The document's content type
+        :param update_sequence: The update sequence the document was rendered for
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.body = body
+        self.content_type = content_type
+        self.update_sequence = update_sequence
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        # Pre-compressed variants, in order of preference.
+        self.encodings: MutableMapping[str, bytes] = OrderedDict()
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(body)
+        self.encodings["gzip"] = gzip.compress(body, mtime=0)
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """
+        :param if_none_match: The value of an If-None-Match request header (or None)
+        :return: True if the header matches this document's ETag
+        """
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+
+    def encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """
+        :param accept_encoding: The value of an Accept-Encoding request header (or None)
+        :return: The preferred pre-compressed encoding acceptable to the client, or None for identity.
+        """
+        if not accept_encoding:
+            return None
+        accepted = set()
+        for item in accept_encoding.split(","):
+            coding, _, params = item.partition(";")
+            params = params.replace(" ", "")
+            if params.startswith("q="):
+                try:
+                    if float(params[2:]) == 0.0:
+                        # Explicitly not acceptable
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+        for enc in self.encodings:
+            if enc in accepted or "*" in accepted:
+                return enc
+        return None
+
+
+class CapabilitiesCache:
+    """
+    Per-process cache of rendered capabilities documents.
+
+    Documents are keyed by service, version, base URL, locale and requested sections, and are re-rendered
+    when the time any layer's ranges were last updated (the update sequence) changes.
+
+    The cache is disabled unless configured.
+    """
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._docs: "OrderedDict[Hashable, CachedDocument]" = OrderedDict()
+        self._stamp: Optional[Tuple[Optional[str], float]] = None
+        self.configure(False)
+
+    def configure(self, enabled: bool, range_check_interval: int = 30, max_entries: int = 100) -> None:
+        """
+        (Re)configure the cache.
+
+        :param enabled: Whether the cache is enabled.
+        :param range_check_interval: Maximum time, in seconds, that the update sequence is re-used
+                                     before being re-read from the database.
+        :param max_entries: Maximum number of cached documents.
+        """
+        with self._lock:
+            self.enabled = enabled
+            self.range_check_interval = range_check_interval
+            self.max_entries = max_entries
+            self._docs.clear()
+            self._stamp = None
+            self.hits = 0
+            self.misses = 0
+
+    def update_sequence(self, lookup: Callable[[], Optional[Any]]) -> Optional[str]:
+        """
+        Return the time any layer's ranges were last updated, as an ISO format string.
+
+        Re-uses the previously read value for up to range_check_interval seconds.
+
+        :param lookup: Function returning the range update timestamp from the database.
+        """
+        now = monotonic()
+        with self._lock:
+            if self._stamp is not None and now - self._stamp[1] < self.range_check_interval:
+                return self._stamp[0]
+        stamp = lookup()
+        if stamp is not None:
+            stamp = stamp.isoformat()
+        with self._lock:
+            self._stamp = (stamp, now)
+        return stamp
+
+    def get(self, key: Hashable, update_sequence: Optional[str],
+            render: Callable[[Optional[str]], Tuple[Union[str, bytes], str]]) -> CachedDocument:
+        """
+        Return the cached document for a key, rendering it if it is not cached or is out of date.
+
+        :param key: Cache key
+        :param update_sequence: The current update sequence
+        :param render: Function taking the update sequence and returning a (body, content type) tuple.
+        """
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None and doc.update_sequence == update_sequence:
+                self._docs.move_to_end(key)
+                self.hits += 1
+                return doc
+            self.misses += 1
+        doc = CachedDocument(*render(update_sequence), update_sequence)
+        with self._lock:
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            while len(self._docs) > self.max_entries:
+                self._docs.popitem(last=False)
+        return doc
+
+    def clear(self) -> None:
+        with self._lock:
+            self._docs.clear()
+            self._stamp = None
+
+
+capabilities_cache = CapabilitiesCache()
+
+
+def capabilities_response(cfg: "datacube_ows.ows_configuration.OWSConfig",
+                          args: MutableMapping[str, Any],
+                          key: Hashable,
+                          render: Callable[[Optional[str]], Tuple[Union[str, bytes], str]],
+                          exception_class: Type[OGCException]) -> Tuple[Union[str, bytes], int, MutableMapping[str, str]]:
+    """
+    Build a GetCapabilities response, using the capabilities cache if it is enabled.
+
+    Handles the updatesequence request parameter and the If-None-Match and Accept-Encoding request headers.
+
+    :param cfg: The OWS configuration
+    :param args: The (lower-cased) request arguments
+    :param key: Cache key identifying the document (service, version, base URL, sections).  The locale is added.
+    :param render: Function taking the update sequence (or None) and returning a (body, content type) tuple.
+    :param exception_class: The OGCException subclass to raise for updatesequence errors.
+    :return: A Flask response tuple
+    """
+    headers = cache_control_headers(cfg.wms_cap_cache_age)
+    if not capabilities_cache.enabled:
+        body, content_type = render(None)
+        headers["Content-Type"] = content_type
+        return body, 200, cfg.response_headers(headers)
+
+    from datacube_ows.product_ranges import get_ranges_timestamp
+
+    def lookup():
+        with cube() as dc:
+            return get_ranges_timestamp(dc) if dc else None
+
+    update_sequence = capabilities_cache.update_sequence(lookup)
+    requested_sequence = args.get("updatesequence")
+    if update_sequence and requested_sequence:
+        if requested_sequence == update_sequence:
+            raise exception_class("Capabilities document has not changed since requested update sequence",
+                                  code=OGCException.CURRENT_UPDATE_SEQUENCE, locator="updatesequence parameter")
+        if requested_sequence > update_sequence:
+            raise exception_class("Requested update sequence is later than the current update sequence",
+                                  code=OGCException.INVALID_UPDATE_SEQUENCE, locator="updatesequence parameter")
+    if cfg.internationalised:
+        from flask_babel import get_locale
+        key = (key, str(get_locale()))
+    doc = capabilities_cache.get(key, update_sequence, render)
+    headers["Content-Type"] = doc.content_type
+    headers["ETag"] = doc.etag
+    headers["Vary"] = "Accept-Encoding"
+    if doc.matches(args.get("if_none_match")):
+        return b"", 304, cfg.response_headers(headers)
+    encoding = doc.encoding(args.get("accept_encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return doc.encodings[encoding], 200, cfg.response_headers(headers)
+    return doc.body, 200, cfg.response_headers(headers)
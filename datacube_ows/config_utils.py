@@ -12,12 +12,14 @@ from typing import (Any, Callable, Iterable, List, Mapping, MutableMapping,
 from urllib.parse import urlparse
 
 import fsspec
+import numpy
 from datacube.utils.masking import make_mask
 from flask_babel import gettext as _
 from xarray import DataArray
 
 from datacube_ows.config_toolkit import deepinherit
-from datacube_ows.ogc_utils import ConfigException, FunctionWrapper
+from datacube_ows.ogc_utils import (ConfigException, FunctionWrapper,
+                                    constant_band_value)
 
 _LOG = logging.getLogger(__name__)
 
@@ -137,6 +139,28 @@ def import_python_obj(path: str) -> RAW_CFG:
     return cast(RAW_CFG, obj)
 
 
+def parse_non_negative_int(cfg: CFG_DICT, entry: str, section: str, default: int = 0) -> int:
+    """
+    Read a non-negative integer entry from a config section.
+
+    :param cfg: The config section
+    :param entry: The name of the entry
+    :param section: The name of the section (for error messages)
+    :param default: The value to return if the entry is not present
+    :return: The integer value of the entry
+    """
+    raw = cfg.get(entry, default)
+    if isinstance(raw, float) and not raw.is_integer():
+        raise ConfigException(f"{entry} in {section} section must be an integer: {raw}")
+    try:
+        val = int(cast(Any, raw))
+    except (TypeError, ValueError):
+        raise ConfigException(f"{entry} in {section} section must be an integer: {raw}")
+    if val < 0:
+        raise ConfigException(f"{entry} in {section} section cannot be negative: {raw}")
+    return val
+
+
 class OWSConfigNotReady(ConfigException):
     """
     Exception raised when someone tries to use an OWSConfigEntry that isn't fully initialised yet.
@@ -899,6 +923,12 @@ class AbstractMaskRule(OWSConfigEntry):
         :param data: Raw flag data, assumed to be for this rule's flag band.
         :return: A boolean DataArray, True where the data matches this rule
         """
+        if constant_band_value(data) is not None:
+            # Constant band (e.g. default-filled flag band with no data): evaluate the rule
+            # for a single pixel and broadcast the result, without materialising a full mask.
+            pixel_mask = self.create_mask(data.isel({dim: 0 for dim in data.dims}))
+            return DataArray(numpy.broadcast_to(pixel_mask.values, data.shape),
+                             coords=data.coords, dims=data.dims)
         if self.values:
             mask: Optional[DataArray] = None
             for v in cast(List[int], self.values):
@@ -0,0 +1,102 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from threading import Lock
+from typing import Any, Mapping, Optional
+
+import numpy
+
+# Query profiler events that make up the cost of rendering a GetMap request, once the datasets have been counted.
+COST_EVENTS = ("fetch-datasets", "load-data", "build-masks", "combine-masks", "apply-style", "write")
+
+
+class LayerCostModel:
+    """
+    A thread-safe, per-process model of the time taken to render GetMap requests for a layer.
+
+    The cost (in seconds) of a request is modelled as a linear function of the number of datasets
+    read and the volume of data loaded:
+
+        cost = c0 + c1 * n_datasets + c2 * megabytes_loaded
+
+    The coefficients are fitted by exponentially weighted least squares to the measured costs of
+    recent requests, so the model tracks changes in load and storage performance over time.
+
+    Requests the model refuses are never measured, so a model that over-predicts could never correct
+    itself.  One in every explore_interval refused requests should therefore be served anyway (see explore()).
+    """
+    # Weight of each observation relative to the next - observations have a "half-life" of about 70 requests.
+    decay = 0.99
+    # One in this many requests that the model would refuse are served (and measured) anyway.
+    explore_interval = 20
+
+    def __init__(self, min_samples: int = 20) -> None:
+        """
+        :param min_samples: Number of observations required before the model makes predictions.
+        """
+        self._lock = Lock()
+        self.min_samples = min_samples
+        self._xtx = numpy.zeros((3, 3))
+        self._xty = numpy.zeros(3)
+        self._coefficients: Optional[numpy.ndarray] = None
+        self.samples = 0
+        self.refused = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.samples >= self.min_samples
+
+    @staticmethod
+    def _features(n_datasets: int, n_bytes: float) -> numpy.ndarray:
+        return numpy.array([1.0, float(n_datasets), n_bytes / 1e6])
+
+    def record(self, n_datasets: int, n_bytes: float, seconds: float) -> None:
+        """
+        Add an observation of the cost of a request.
+
+        :param n_datasets: The number of datasets read
+        :param n_bytes: The (estimated) number of bytes of data loaded
+        :param seconds: The time taken to read and render the data
+        """
+        x = self._features(n_datasets, n_bytes)
+        with self._lock:
+            self._xtx = self.decay * self._xtx + numpy.outer(x, x)
+            self._xty = self.decay * self._xty + x * seconds
+            self.samples += 1
+            # Minimum-norm solution, as the features may be collinear (e.g. for fixed-size tiles).
+            self._coefficients = numpy.linalg.lstsq(self._xtx, self._xty, rcond=None)[0]
+
+    def predict(self, n_datasets: int, n_bytes: float) -> Optional[float]:
+        """
+        :param n_datasets: The number of datasets the request would read
+        :param n_bytes: The number of bytes of data the request would load
+        :return: The predicted cost of the request in seconds, or None if the model has too few observations.
+        """
+        if not self.trained or self._coefficients is None:
+            return None
+        return max(0.0, float(self._features(n_datasets, n_bytes) @ self._coefficients))
+
+    def explore(self) -> bool:
+        """
+        Called for each request the model predicts will exceed its target.
+
+        :return: True if the request should be served anyway, so that its cost is measured.
+        """
+        with self._lock:
+            self.refused += 1
+            return self.refused % self.explore_interval == 0
+
+    def stats(self) -> Mapping[str, Any]:
+        """
+        :return: A dictionary of the number of observations, the number of requests the model would have refused,
+                and the current model coefficients.
+        """
+        with self._lock:
+            coefficients = None if self._coefficients is None else [float(c) for c in self._coefficients]
+        return {
+            "samples": self.samples,
+            "refused": self.refused,
+            "coefficients": coefficients,
+        }
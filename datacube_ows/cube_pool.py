@@ -5,8 +5,9 @@
 # SPDX-License-Identifier: Apache-2.0
 import logging
 from contextlib import contextmanager
-from threading import Lock
-from typing import Generator, MutableMapping, Optional
+from threading import Condition, Lock, local
+from time import monotonic
+from typing import Any, Generator, List, Mapping, MutableMapping, Optional
 
 from datacube import Datacube
 
@@ -26,6 +27,14 @@ class ODCInitException(Exception):
 class CubePool:
     """
     A Cube pool is a thread-safe resource pool for managing Datacube objects (which map to database connections).
+
+    Each pool holds one shared Datacube object (returned by get_cube()), and, if the pool is bounded
+    (max_size > 0), up to max_size further Datacube objects that are checked out for the exclusive use of
+    one thread at a time (with the cube() context manager).  If the pool is not bounded (the default),
+    cube() also returns the shared Datacube object.
+
+    The cube() context manager is re-entrant: nested calls in a thread that already holds a pooled
+    Datacube object are given the same object, rather than checking out a second one.
     """
     # _instances, global mapping of CubePools by app name
     _instances: MutableMapping[str, "CubePool"] = {}
@@ -34,6 +43,15 @@ class CubePool:
 
     _instance: Optional[Datacube] = None
 
+    # Pool sizing - see configure()
+    min_size: int = 0
+    max_size: int = 0
+    checkout_timeout: float = 30.0
+    check_on_borrow: bool = True
+
+    # Optional prometheus metrics, keyed by "wait", "in_use", "saturation" and "timeouts".
+    metrics: MutableMapping[str, Any] = {}
+
     def __new__(cls, app: str) -> "CubePool":
         """
         Construction of CubePools is managed. Constructing a cubepool for an app string that already has a cubepool
@@ -52,11 +70,42 @@ class CubePool:
         self.app: str = app
         if not self._cubes_lock_:
             self._cubes_lock: Lock = Lock()
+            self._pool_cond: Condition = Condition()
+            self._idle: List[Datacube] = []
+            self._size: int = 0
+            self.in_use: int = 0
+            self.timeouts: int = 0
+            # The pooled Datacube object held by each thread (via cube()), and the nesting depth.
+            self._held = local()
             self._cubes_lock_ = True
 
+    @classmethod
+    def configure(cls,
+                  min_size: int = 0,
+                  max_size: int = 0,
+                  checkout_timeout: float = 30.0,
+                  check_on_borrow: bool = True) -> None:
+        """
+        Configure the sizing of all cube pools.
+
+        :param min_size: The number of pooled Datacube objects to create when a pool is first used.
+        :param max_size: The maximum number of pooled Datacube objects per pool.  Zero means pools are not bounded,
+                and all threads share a single Datacube object.
+        :param checkout_timeout: Maximum time to wait for a pooled Datacube object, in seconds.
+        :param check_on_borrow: If true, check the database connection of pooled Datacube objects when checked out.
+        """
+        cls.min_size = min(min_size, max_size)
+        cls.max_size = max_size
+        cls.checkout_timeout = checkout_timeout
+        cls.check_on_borrow = check_on_borrow
+
+    @property
+    def bounded(self) -> bool:
+        return self.max_size > 0
+
     def get_cube(self) -> Optional[Datacube]:
         """
-        Return a Datacube object.  Either generating a new Datacube, or recycling an unassigned one already in the pool.
+        Return the shared Datacube object for this pool, creating it if necessary.
 
         :return:  a Datacube object (or None on error).
         """
@@ -72,6 +121,139 @@ class CubePool:
             self._cubes_lock.release()
         return self._instance
 
+    def checkout(self, timeout: Optional[float] = None) -> Optional[Datacube]:
+        """
+        Check out a Datacube object for the exclusive use of the caller.  Must be returned with checkin().
+
+        If the pool is not bounded, returns the shared Datacube object.
+
+        :param timeout: Maximum time to wait for a free Datacube object, in seconds.  Defaults to checkout_timeout.
+        :return: a Datacube object, or None if none was free before the timeout.
+        :raises: ODCInitException
+        """
+        if not self.bounded:
+            return self.get_cube()
+        if timeout is None:
+            timeout = self.checkout_timeout
+        start = monotonic()
+        dc: Optional[Datacube] = None
+        self._prefill()
+        with self._pool_cond:
+            while True:
+                if self._idle:
+                    dc = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve a slot, and create the cube outside the lock.
+                    self._size += 1
+                    break
+                remaining = timeout - (monotonic() - start)
+                if remaining <= 0 or not self._pool_cond.wait(remaining):
+                    if not self._idle and self._size >= self.max_size:
+                        self.timeouts += 1
+                        self._update_metrics(monotonic() - start, timed_out=True)
+                        _LOG.warning("Timed out after %.1fs waiting for a datacube from the %s pool",
+                                     monotonic() - start, self.app)
+                        return None
+            self.in_use += 1
+        self._update_metrics(monotonic() - start)
+        try:
+            if dc is not None and self.check_on_borrow and not self._alive(dc):
+                _LOG.warning("Discarding datacube with failed database connection from the %s pool", self.app)
+                self._close(dc)
+                dc = None
+            if dc is None:
+                dc = self._new_pooled_cube()
+        except ODCInitException:
+            with self._pool_cond:
+                self._size -= 1
+                self.in_use -= 1
+                self._pool_cond.notify()
+            self._update_metrics()
+            raise
+        return dc
+
+    def checkin(self, dc: Optional[Datacube]) -> None:
+        """
+        Return a Datacube object obtained from checkout() to the pool.
+
+        :param dc: The Datacube object (may be None, if checkout timed out)
+        """
+        if dc is None or dc is self._instance:
+            return
+        with self._pool_cond:
+            self._idle.append(dc)
+            self.in_use -= 1
+            self._pool_cond.notify()
+        self._update_metrics()
+
+    def _prefill(self) -> None:
+        # Reserve slots up to min_size, and create the cubes outside the lock so borrowers
+        # of existing cubes do not wait on database connection setup.
+        with self._pool_cond:
+            n = self.min_size - self._size
+            if n <= 0:
+                return
+            self._size += n
+        created: List[Datacube] = []
+        try:
+            for _ in range(n):
+                created.append(self._new_pooled_cube())
+        finally:
+            with self._pool_cond:
+                self._size -= n - len(created)
+                self._idle.extend(created)
+                self._pool_cond.notify_all()
+
+    def _new_pooled_cube(self) -> Datacube:
+        try:
+            return self._new_cube()
+        # pylint: disable=broad-except
+        except Exception as e:
+            _LOG.error("ODC initialisation failed: %s", str(e))
+            raise ODCInitException(e)
+
+    def _alive(self, dc: Datacube) -> bool:
+        try:
+            # pylint: disable=protected-access
+            with dc.index._db._engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            return True
+        # pylint: disable=broad-except
+        except Exception as e:
+            _LOG.debug("Datacube liveness check failed: %s", str(e))
+            return False
+
+    def _close(self, dc: Datacube) -> None:
+        try:
+            dc.close()
+        # pylint: disable=broad-except
+        except Exception:
+            pass
+
+    def _update_metrics(self, wait: Optional[float] = None, timed_out: bool = False) -> None:
+        if not self.metrics:
+            return
+        if wait is not None:
+            self.metrics["wait"].labels(app=self.app).observe(wait)
+        if timed_out:
+            self.metrics["timeouts"].labels(app=self.app).inc()
+        self.metrics["in_use"].labels(app=self.app).set(self.in_use)
+        self.metrics["saturation"].labels(app=self.app).set(self.in_use / self.max_size)
+
+    def stats(self) -> Mapping[str, int]:
+        """
+        :return: A dictionary of pool size and usage counters.
+        """
+        with self._pool_cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "max_size": self.max_size,
+                "timeouts": self.timeouts,
+            }
+
     def _new_cube(self) -> Datacube:
         return Datacube(app=self.app)
 
@@ -79,7 +261,7 @@ class CubePool:
 # Lowlevel CubePool API
 def get_cube(app: str = "ows") -> Optional[Datacube]:
     """
-    Obtain a Datacube object from the appropriate pool
+    Obtain the shared Datacube object from the appropriate pool
 
     :param app: The app pool to use - defaults to "ows".
     :return: a Datacube object (or None) in case of database error.
@@ -94,6 +276,10 @@ def cube(app: str = "ows") -> Generator[Optional["datacube.api.core.Datacube"],
     """
     Context manager for using a Datacube object from a pool.
 
+    If the pool is bounded, the Datacube object is checked out for the exclusive use of the caller,
+    and returned to the pool on exit.  Nested calls in the same thread yield the Datacube object
+    already checked out by the outermost call.
+
     E.g.
 
     with cube() as dc:
@@ -102,7 +288,25 @@ def cube(app: str = "ows") -> Generator[Optional["datacube.api.core.Datacube"],
 
 
     :param app: The pool to obtain the app from - defaults to "ows".
-    :return: A Datacube context manager.
+    :return: A Datacube context manager.  Yields None if the database is unavailable, or no pooled
+            Datacube object became free before the checkout timeout.
     :raises: ODCInitException
     """
-    yield get_cube(app)
+    pool = CubePool(app=app)
+    held = pool._held  # pylint: disable=protected-access
+    if getattr(held, "depth", 0):
+        held.depth += 1
+        try:
+            yield held.dc
+        finally:
+            held.depth -= 1
+        return
+    dc = pool.checkout()
+    if dc is not None:
+        held.dc, held.depth = dc, 1
+    try:
+        yield dc
+    finally:
+        if dc is not None:
+            held.dc, held.depth = None, 0
+        pool.checkin(dc)
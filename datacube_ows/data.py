@@ -6,9 +6,14 @@
 import json
 import logging
 import re
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from copy import copy
 from datetime import date, datetime, timedelta
-from itertools import chain
+from functools import lru_cache
+from itertools import chain, groupby
+from threading import Lock
 
 import datacube
 import numpy
@@ -18,19 +23,25 @@ from datacube.utils import geometry
 from datacube.utils.masking import mask_to_dict
 from flask import render_template
 from pandas import Timestamp
+from PIL import Image
 from rasterio.features import rasterize
 from rasterio.io import MemoryFile
 from rasterio.warp import Resampling
 
+from datacube_ows.cost_model import COST_EVENTS
 from datacube_ows.cube_pool import cube
-from datacube_ows.mv_index import MVSelectOpts, mv_search
+from datacube_ows.deadline import NO_DEADLINE, Deadline, RequestTimeout
+from datacube_ows.mv_index import MVSelectOpts, dataset_cache, mv_search
 from datacube_ows.ogc_exceptions import WMSException
-from datacube_ows.ogc_utils import (ConfigException, dataset_center_time,
-                                    solar_date, tz_for_geometry,
+from datacube_ows.ogc_utils import (ConfigException, constant_band,
+                                    dataset_center_time, encode_png,
+                                    mask_by_nan, solar_date, tz_for_geometry,
                                     xarray_image_as_png)
 from datacube_ows.ows_configuration import get_config
+from datacube_ows.product_ranges import get_range_timestamp
 from datacube_ows.query_profiler import QueryProfiler
-from datacube_ows.resource_limits import ResourceLimited
+from datacube_ows.resource_limits import RequestScale, ResourceLimited
+from datacube_ows.response_cache import get_map_cache_key, response_cache
 from datacube_ows.startup_utils import CredentialManager
 from datacube_ows.utils import default_to_utc, log_call
 from datacube_ows.wms_utils import (GetFeatureInfoParameters, GetMapParameters,
@@ -120,11 +131,88 @@ class ProductBandQuery:
         return cls(main_products, bands, manual_merge=manual_merge, main=True, fuse_func=fuse_func)
 
 
+class ReadExecutor:
+    """
+    Process-wide thread pool for concurrent data reads.
+
+    The pool is created on first use, sized by the global "concurrent_reads" configuration.
+    """
+    _pool = None
+    _lock = Lock()
+
+    @classmethod
+    def pool(cls, threads):
+        with cls._lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"ows_{cls.__name__}")
+        return cls._pool
+
+    @classmethod
+    def map(cls, func, items, threads=0, max_in_flight=0, deadline=NO_DEADLINE):
+        """
+        Apply func to each item, with up to max_in_flight calls running concurrently on the read pool.
+
+        Results are yielded in the original order of items.  If threads is less than 2, items
+        are processed serially in the calling thread.
+
+        If the deadline passes, RequestTimeout is raised and calls that have not yet started are cancelled.
+        (Calls that have already started run to completion in the pool, but their results are discarded.)
+
+        :param func: Function to call on each item
+        :param items: Iterable of items
+        :param threads: Size of the process-wide read pool.
+        :param max_in_flight: Maximum number of calls in flight at once (defaults to threads)
+        :param deadline: The request deadline
+        """
+        if threads < 2:
+            for item in items:
+                deadline.check("data read")
+                yield func(item)
+            return
+        if max_in_flight < 1:
+            max_in_flight = threads
+        pool = cls.pool(threads)
+        pending = deque()
+        try:
+            for item in items:
+                if len(pending) >= max_in_flight:
+                    yield cls._result(pending.popleft(), deadline)
+                deadline.check("data read")
+                pending.append(pool.submit(func, item))
+            while pending:
+                yield cls._result(pending.popleft(), deadline)
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+    @staticmethod
+    def _result(fut, deadline):
+        try:
+            return fut.result(timeout=deadline.remaining())
+        except FuturesTimeoutError:
+            fut.cancel()
+            raise RequestTimeout("data read")
+
+
+class QueryLoadExecutor(ReadExecutor):
+    """
+    Process-wide thread pool for concurrent loads of the separate product queries (e.g. main and flag products)
+    of a request.
+
+    Kept separate from the ReadExecutor pool, as query loads may themselves submit reads to the read pool.
+    """
+    _pool = None
+
+
 class DataStacker:
+    deadline = NO_DEADLINE
+
     @log_call
-    def __init__(self, product, geobox, times, resampling=None, style=None, bands=None, **kwargs):
+    def __init__(self, product, geobox, times, resampling=None, style=None, bands=None, deadline=None, **kwargs):
         super(DataStacker, self).__init__(**kwargs)
         self._product = product
+        if deadline is not None:
+            self.deadline = deadline
         self.cfg = product.global_cfg
         self._geobox = geobox
         self._resampling = resampling if resampling is not None else Resampling.nearest
@@ -150,6 +238,11 @@ class DataStacker:
             ]
         self.group_by = self._product.dataset_groupby()
         self.resource_limited = False
+        # If set, counts also fetch the matching dataset ids in the same index query.  Only set if the
+        # count cannot cause the request to be refused, so the ids are always needed.
+        self.count_with_ids = False
+        # Cached index search results for this request, keyed by (product ids, ignore_time)
+        self._search_cache = {}
 
     def needed_bands(self):
         return self._needed_bands
@@ -164,6 +257,7 @@ class DataStacker:
                  all_flag_bands=False,
                  all_time=False, point=None,
                  mode=MVSelectOpts.DATASETS):
+        self.deadline.check("dataset search")
         if mode == MVSelectOpts.EXTENT or all_time:
             # Not returning datasets - use main product only
             queries = [
@@ -196,11 +290,15 @@ class DataStacker:
                 qry_times = None
             else:
                 qry_times = times
-            result = mv_search(index,
-                               sel=mode,
-                               times=qry_times,
-                               geom=geom,
-                               products=query.products)
+            if point is None and not all_time:
+                # Standard request search - reuse the index search results for each product query.
+                result = self._cached_search(index, query, qry_times, geom, mode)
+            else:
+                result = mv_search(index,
+                                   sel=mode,
+                                   times=qry_times,
+                                   geom=geom,
+                                   products=query.products)
             if mode == MVSelectOpts.DATASETS:
                 result = datacube.Datacube.group_datasets(result, self.group_by)
                 if all_time:
@@ -214,6 +312,50 @@ class DataStacker:
                 return result
         return OrderedDict(results)
 
+    def _cached_search(self, index, query, times, geom, mode):
+        """
+        Search the index for a product query, caching the results for the life of this DataStacker.
+
+        The resource limit check, the query profiler and the data load do not hit the database
+        repeatedly for the same search.  Counts are queried with a plain COUNT, so that requests refused
+        by the resource limits never fetch the (potentially very long) list of matching dataset ids - unless
+        count_with_ids is set, in which case the count and ids are fetched with a single COUNT_IDS query.
+        Once the ids have been fetched, counts are served from them.  The union extent is only queried if an
+        EXTENT is requested.
+        """
+        key = (tuple(p.id for p in query.products), query.ignore_time)
+        cached = self._search_cache.setdefault(key, {})
+        if mode == MVSelectOpts.COUNT:
+            if "count" not in cached:
+                if self.count_with_ids:
+                    result = mv_search(index, sel=MVSelectOpts.COUNT_IDS,
+                                       times=times, geom=geom, products=query.products)
+                    cached["count"] = result.count
+                    cached["ids"] = result.ids
+                else:
+                    cached["count"] = mv_search(index, sel=MVSelectOpts.COUNT,
+                                                times=times, geom=geom, products=query.products)
+            return cached["count"]
+        if mode == MVSelectOpts.EXTENT:
+            if "extent" not in cached:
+                cached["extent"] = mv_search(index, sel=MVSelectOpts.EXTENT,
+                                             times=times, geom=geom, products=query.products)
+            return cached["extent"]
+        if mode in (MVSelectOpts.IDS, MVSelectOpts.DATASETS):
+            if "ids" not in cached:
+                cached["ids"] = mv_search(index, sel=MVSelectOpts.IDS,
+                                          times=times, geom=geom, products=query.products)
+                cached["count"] = len(cached["ids"])
+            if mode == MVSelectOpts.IDS:
+                return cached["ids"]
+            if "datasets" not in cached:
+                if cached["ids"]:
+                    cached["datasets"] = dataset_cache.get_datasets(index, cached["ids"])
+                else:
+                    cached["datasets"] = []
+            return cached["datasets"]
+        return mv_search(index, sel=mode, times=times, geom=geom, products=query.products)
+
     def create_nodata_filled_flag_bands(self, data, pbq):
         var = None
         for var in data.data_vars.variables.keys():
@@ -224,10 +366,7 @@ class DataStacker:
         data_new_bands = {}
         for band in pbq.bands:
             default_value = pbq.products[0].measurements[band].nodata
-            new_data = numpy.ndarray(template.shape, dtype="uint8")
-            new_data.fill(default_value)
-            qry_result = template.copy(data=new_data)
-            data_new_bands[band] = qry_result
+            data_new_bands[band] = constant_band(template, default_value)
         data = data.assign(data_new_bands)
         for band in pbq.bands:
             data[band].attrs["flags_definition"] = pbq.products[0].measurements[band].flags_definition
@@ -238,16 +377,28 @@ class DataStacker:
         # pylint: disable=too-many-locals, consider-using-enumerate
         # datasets is an XArray DataArray of datasets grouped by time.
         data = None
+        preloaded = {}
+        self.deadline.check("data load")
+        if self.cfg.concurrent_query_threads > 1 and len(datasets_by_query) > 1:
+            # Load all product queries concurrently, then merge in order.
+            preloaded = dict(zip(
+                datasets_by_query.keys(),
+                QueryLoadExecutor.map(
+                    lambda pbq_dss: self.read_query_data(pbq_dss[0], pbq_dss[1], skip_corrections),
+                    datasets_by_query.items(),
+                    threads=self.cfg.concurrent_query_threads,
+                    deadline=self.deadline
+                )
+            ))
         for pbq, datasets in datasets_by_query.items():
             if data is not None and len(data.time) == 0:
                 # No data, so no need for masking data.
                 continue
-            measurements = pbq.products[0].lookup_measurements(pbq.bands)
-            fuse_func = pbq.fuse_func
-            if pbq.manual_merge:
-                qry_result = self.manual_data_stack(datasets, measurements, pbq.bands, skip_corrections, fuse_func=fuse_func)
+            if pbq in preloaded:
+                qry_result = preloaded[pbq]
             else:
-                qry_result = self.read_data(datasets, measurements, self._geobox, resampling=self._resampling, fuse_func=fuse_func)
+                self.deadline.check("data load")
+                qry_result = self.read_query_data(pbq, datasets, skip_corrections)
             if data is None:
                 data = qry_result
                 continue
@@ -267,13 +418,10 @@ class DataStacker:
                     else:
                         data_new_bands = {}
                         for band in pbq.bands:
-                            band_data = qry_result[band]
-                            timeless_band_data = band_data.sel(time=qry_result.time.values[0])
-                            band_time_slices = []
-                            for dt in data.time.values:
-                                band_time_slices.append(timeless_band_data)
-                            timed_band_data = xarray.concat(band_time_slices, data.time)
-                            data_new_bands[band] = timed_band_data
+                            # Broadcast the timeless band along the time dimension.
+                            # This is a read-only, stride-0 view: memory does not grow with the number of dates.
+                            timeless_band_data = qry_result[band].isel(time=0, drop=True)
+                            data_new_bands[band] = timeless_band_data.expand_dims(time=data.time, axis=0)
                     data = data.assign(data_new_bands)
                     continue
             elif len(qry_result.time) == 0:
@@ -285,6 +433,13 @@ class DataStacker:
 
         return data
 
+    def read_query_data(self, pbq, datasets, skip_corrections=False):
+        measurements = pbq.products[0].lookup_measurements(pbq.bands)
+        fuse_func = pbq.fuse_func
+        if pbq.manual_merge:
+            return self.manual_data_stack(datasets, measurements, pbq.bands, skip_corrections, fuse_func=fuse_func)
+        return self.read_data(datasets, measurements, self._geobox, resampling=self._resampling, fuse_func=fuse_func)
+
     @log_call
     def manual_data_stack(self, datasets, measurements, bands, skip_corrections, fuse_func):
         # pylint: disable=too-many-locals, too-many-branches
@@ -296,11 +451,22 @@ class DataStacker:
             non_flag_bands = bands
             flag_bands = set()
         time_slices = []
-        for dt in datasets.time.values:
-            tds = datasets.sel(time=dt)
+        dt_datasets = [
+            (dt, ds)
+            for dt in datasets.time.values
+            for ds in datasets.sel(time=dt).values.item()
+        ]
+        reads = ReadExecutor.map(
+            lambda dt_ds: self.read_data_for_single_dataset(dt_ds[1], measurements, self._geobox, fuse_func=fuse_func),
+            dt_datasets,
+            threads=self.cfg.concurrent_read_threads,
+            max_in_flight=self.cfg.concurrent_reads_in_flight,
+            deadline=self.deadline
+        )
+        # Reads are returned in the original order, so the merge is deterministic.
+        for _, dt_reads in groupby(zip(dt_datasets, reads), key=lambda r: r[0][0]):
             merged = None
-            for ds in tds.values.item():
-                d = self.read_data_for_single_dataset(ds, measurements, self._geobox, fuse_func=fuse_func)
+            for (_, ds), d in dt_reads:
                 extent_mask = None
                 for band in non_flag_bands:
                     for f in self._product.extent_mask_func:
@@ -308,15 +474,20 @@ class DataStacker:
                             extent_mask = f(d, band)
                         else:
                             extent_mask &= f(d, band)
-                if extent_mask is not None:
-                    d = d.where(extent_mask)
-                if self._product.solar_correction and not skip_corrections:
-                    for band in non_flag_bands:
-                        d[band] = solar_correct_data(d[band], ds)
-                if merged is None:
-                    merged = d
+                solar_correct = self._product.solar_correction and not skip_corrections
+                if merged is None or not numpy.array_equal(merged.time.values, d.time.values):
+                    if extent_mask is not None:
+                        d = d.where(extent_mask)
+                    if solar_correct:
+                        for band in non_flag_bands:
+                            d[band] = solar_correct_data(d[band], ds)
+                    if merged is None:
+                        # The first read becomes the output buffer for the time slice.
+                        merged = d
+                    else:
+                        merged = merged.combine_first(d)
                 else:
-                    merged = merged.combine_first(d)
+                    _fuse_into(merged, d, extent_mask, ds, non_flag_bands if solar_correct else ())
             if merged is None:
                 continue
             for band in flag_bands:
@@ -366,6 +537,41 @@ class DataStacker:
             raise
 
 
+def _fuse_into(merged, d, extent_mask, dataset, solar_bands):
+    """
+    Fill the nodata (NaN) pixels of merged from d, in place.
+
+    Equivalent to merged.combine_first(d.where(extent_mask)) (with solar correction of solar_bands),
+    but the extent mask and solar correction are only evaluated for the pixels actually being filled,
+    and no new output arrays are allocated.
+
+    :param merged: The merged xarray Dataset for a time slice (modified in place)
+    :param d: The xarray Dataset read for a single dataset, on the same geobox and time as merged.
+    :param extent_mask: The extent mask for d, or None
+    :param dataset: The ODC dataset that d was read from (for solar correction)
+    :param solar_bands: The bands to apply solar correction to.
+    """
+    if extent_mask is not None:
+        extent_mask = numpy.asarray(extent_mask, dtype=bool)
+    for band in merged.data_vars:
+        out = merged[band].values
+        if out.dtype.kind != "f":
+            # No NaNs, nothing to fill.
+            continue
+        if not out.flags.writeable:
+            merged[band] = merged[band].copy()
+            out = merged[band].values
+        fill = numpy.isnan(out)
+        if extent_mask is not None:
+            fill &= extent_mask
+        if not fill.any():
+            continue
+        vals = d[band].values[fill].astype(out.dtype)
+        if band in solar_bands:
+            vals = solar_correct_data(vals, dataset)
+        out[fill] = vals
+
+
 def datasets_in_xarray(xa):
     if xa is None:
         return 0
@@ -377,39 +583,40 @@ def bbox_to_geom(bbox, crs):
 
 
 def user_date_sorter(layer, odc_dates, geom, user_dates):
-    # TODO: Make more elegant.  Just a little bit elegant would do.
+    # Normalise each ODC date once, then look up the first matching user date.
     result = []
-    if layer.time_resolution.is_solar():
+    time_res = layer.time_resolution
+    if time_res.is_solar():
         tz = tz_for_geometry(geom)
     else:
         tz = None
 
-    def check_date(time_res, user_date, odc_date):
-        ts = Timestamp(odc_date).tz_localize("UTC")
-        if time_res.is_solar():
-            norm_date = solar_date(ts, tz)
-            return norm_date == user_date
-        elif time_res.is_summary():
-            norm_date = date(ts.year,
-                             ts.month,
-                             ts.day)
-            return norm_date == user_date
-        else:
-            norm_date = datetime(ts.year,
-                                 ts.month,
-                                 ts.day,
-                                 ts.hour,
-                                 ts.minute,
-                                 ts.second,
-                                 tzinfo=ts.tzinfo)
-            user_date = default_to_utc(user_date)
-            return user_date >= norm_date and user_date < norm_date + timedelta(hours=23, minutes=59, seconds=59)
+    if time_res.is_solar() or time_res.is_summary():
+        first_match = {}
+        for idx, user_date in enumerate(user_dates):
+            first_match.setdefault(user_date, idx)
+
+        def match(ts):
+            if time_res.is_solar():
+                norm_date = solar_date(ts, tz)
+            else:
+                norm_date = date(ts.year, ts.month, ts.day)
+            return first_match.get(norm_date)
+    else:
+        utc_user_dates = [default_to_utc(user_date) for user_date in user_dates]
+        window = timedelta(hours=23, minutes=59, seconds=59)
+
+        def match(ts):
+            norm_date = datetime(ts.year, ts.month, ts.day, ts.hour, ts.minute, ts.second, tzinfo=ts.tzinfo)
+            for idx, user_date in enumerate(utc_user_dates):
+                if norm_date <= user_date < norm_date + window:
+                    return idx
+            return None
 
     for odc_date in odc_dates:
-        for idx, user_date in enumerate(user_dates):
-            if check_date(layer.time_resolution, user_date, odc_date):
-                result.append(idx)
-                break
+        idx = match(Timestamp(odc_date).tz_localize("UTC"))
+        if idx is not None:
+            result.append(idx)
     npresult = numpy.array(result, dtype="uint8")
     xrresult = xarray.DataArray(
         npresult,
@@ -425,145 +632,328 @@ class EmptyResponse(Exception):
 
 @log_call
 def get_map(args):
-    # pylint: disable=too-many-nested-blocks, too-many-branches, too-many-statements, too-many-locals
     # Parse GET parameters
     params = GetMapParameters(args)
     qprof = QueryProfiler(params.ows_stats)
-    n_dates = len(params.times)
-    if n_dates == 1:
-        mdh = None
+    mdh = _check_multi_date(params)
+    qprof["n_dates"] = len(params.times)
+    deadline = Deadline.for_request(params.product.global_cfg, args)
+    with cube() as dc:
+        if not dc:
+            raise WMSException("Database connectivity failure")
+        cache_key = _map_cache_key(dc, params)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                body, n_datasets = cached
+                return png_response(body,
+                                    extra_headers=params.product.resource_limits.wms_cache_rules.cache_headers(n_datasets))
+        n_datasets, body = _render_map(dc, params, mdh, qprof, args["requestid"], deadline=deadline)
+        if cache_key:
+            response_cache.put(cache_key, body, n_datasets)
+
+    if params.ows_stats:
+        return json_response(qprof.profile())
     else:
-        mdh = params.style.get_multi_date_handler(n_dates)
-        if mdh is None:
-            raise WMSException("Style %s does not support GetMap requests with %d dates" % (params.style.name, n_dates),
-                               WMSException.INVALID_DIMENSION_VALUE, locator="Time parameter")
-    qprof["n_dates"] = n_dates
+        return png_response(body, extra_headers=params.product.resource_limits.wms_cache_rules.cache_headers(n_datasets))
+
+
+@log_call
+def get_metatile(tile_args, requested, shape):
+    """
+    Render a block of neighbouring tiles with a single data load, and store every tile in the response cache.
+
+    Falls back to a normal get_map call for the requested tile if the response cache is not active for the
+    request, or if rendering the whole block would exceed the layer's resource limits.
+
+    :param tile_args: WMS GetMap arguments for each tile in the block, in row-major order.  All tiles must be the same size.
+    :param requested: Index into tile_args of the requested tile
+    :param shape: (rows, columns) of tiles in the block
+    :return: GetMap response for the requested tile
+    """
+    tile_params = [GetMapParameters(args) for args in tile_args]
+    params = tile_params[requested]
+    if not response_cache.enabled or params.ows_stats or params.style.user_defined:
+        return get_map(tile_args[requested])
+    mdh = _check_multi_date(params)
+    tile_height, tile_width = params.geobox.shape
+    # The block is rendered on the pixel grid of the top-left tile.
+    top_left = tile_params[0].geobox
+    meta_params = copy(params)
+    meta_params.geobox = geometry.GeoBox(tile_width * shape[1], tile_height * shape[0], top_left.affine, top_left.crs)
+    meta_params.resources = RequestScale(
+        native_crs=geometry.CRS(params.product.native_CRS),
+        native_resolution=(params.product.resolution_x, params.product.resolution_y),
+        geobox=meta_params.geobox,
+        n_dates=len(params.times),
+        request_bands=params.style.odc_needed_bands(),
+    )
+    windows = [
+        (slice(r * tile_height, (r + 1) * tile_height), slice(c * tile_width, (c + 1) * tile_width))
+        for r in range(shape[0])
+        for c in range(shape[1])
+    ]
     with cube() as dc:
+        if not dc:
+            raise WMSException("Database connectivity failure")
+        keys = [_map_cache_key(dc, p) for p in tile_params]
+        cached = response_cache.get(keys[requested])
+        if cached is not None:
+            body, n_datasets = cached
+        else:
+            n_datasets, bodies = _render_map(dc, meta_params, mdh, QueryProfiler(False),
+                                             tile_args[requested]["requestid"], windows=windows,
+                                             deadline=Deadline.for_request(params.product.global_cfg,
+                                                                           tile_args[requested]))
+            if bodies is None:
+                body = None
+            else:
+                for key, tile_body in zip(keys, bodies):
+                    response_cache.put(key, tile_body, n_datasets)
+                body = bodies[requested]
+    if body is None:
+        # Whole block is resource limited - render the requested tile alone.
+        # (Outside the cube() block, as get_map checks out its own cube.)
+        return get_map(tile_args[requested])
+    return png_response(body, extra_headers=params.product.resource_limits.wms_cache_rules.cache_headers(n_datasets))
+
+
+@log_call
+def seed_map(args):
+    """
+    Render a GetMap request directly into the response cache, ignoring the layer's resource limits.
+
+    Used for offline tile seeding, so that requests that would normally be resource limited (and rendered
+    as a summary product or polygon fill) are served from the cache at full resolution.
+
+    :param args: WMS GetMap arguments
+    :return: The number of datasets in the request.  Nothing is rendered or cached if there are none.
+    """
+    params = GetMapParameters(args)
+    mdh = _check_multi_date(params)
+    with cube() as dc:
+        if not dc:
+            raise WMSException("Database connectivity failure")
+        n_datasets, body = _render_map(dc, params, mdh, QueryProfiler(False), args["requestid"],
+                                       ignore_limits=True)
+        if n_datasets:
+            response_cache.put(_map_cache_key(dc, params), body, n_datasets)
+    return n_datasets
+
+
+def _check_multi_date(params):
+    n_dates = len(params.times)
+    if n_dates == 1:
+        return None
+    mdh = params.style.get_multi_date_handler(n_dates)
+    if mdh is None:
+        raise WMSException("Style %s does not support GetMap requests with %d dates" % (params.style.name, n_dates),
+                           WMSException.INVALID_DIMENSION_VALUE, locator="Time parameter")
+    return mdh
+
+
+def _map_cache_key(dc, params):
+    if not response_cache.enabled or params.ows_stats or params.style.user_defined:
+        return None
+    return get_map_cache_key(
+        params.product, params.style, params.times, params.geobox, params.format,
+        response_cache.range_stamp(params.product.name,
+                                   lambda: get_range_timestamp(dc, params.product))
+    )
+
+
+def _render_map(dc, params, mdh, qprof, requestid, windows=None, ignore_limits=False, deadline=NO_DEADLINE):
+    """
+    Render a GetMap request to PNG.
+
+    :param dc: A Datacube object
+    :param params: GetMapParameters
+    :param mdh: The multi-date handler for the request (or None)
+    :param qprof: The query profiler
+    :param requestid: The request id (for logging)
+    :param windows: Optional list of (y-slice, x-slice) pixel windows.  If supplied, a separate PNG is written
+                    for each window of the rendered image.
+    :param ignore_limits: If true, the layer's resource limits are not applied.
+    :param deadline: The request deadline.  RequestTimeout is raised if it passes before rendering is complete.
+    :return: (n_datasets, body).  If windows were supplied, body is a list of PNGs (one per window), or None if
+             the request exceeds the layer's resource limits.
+    """
+    # pylint: disable=too-many-nested-blocks, too-many-branches, too-many-statements, too-many-locals
+    n_dates = len(params.times)
+    try:
+        # Tiling.
+        stacker = DataStacker(params.product, params.geobox, params.times, params.resampling, style=params.style,
+                              deadline=deadline)
+        qprof["zoom_factor"] = params.zf
+        limits = params.product.resource_limits
+        # The ids are always needed if the count cannot cause the request to be refused, so fetch them with the count.
+        stacker.count_with_ids = ignore_limits or limits.wms_passes_without_count(params.zf, params.resources)
+        qprof.start_event("count-datasets")
+        n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
+        qprof.end_event("count-datasets")
+        qprof["n_datasets"] = n_datasets
+        qprof["zoom_level_base"] = params.resources.base_zoom_level
+        qprof["zoom_level_adjusted"] = params.resources.load_adjusted_zoom_level
+        if limits.cost_model is not None:
+            qprof["predicted_cost"] = limits.predict_wms_cost(n_datasets, params.resources)
         try:
-            if not dc:
-                raise WMSException("Database connectivity failure")
-            # Tiling.
-            stacker = DataStacker(params.product, params.geobox, params.times, params.resampling, style=params.style)
-            qprof["zoom_factor"] = params.zf
-            qprof.start_event("count-datasets")
-            n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
-            qprof.end_event("count-datasets")
-            qprof["n_datasets"] = n_datasets
-            qprof["zoom_level_base"] = params.resources.base_zoom_level
-            qprof["zoom_level_adjusted"] = params.resources.load_adjusted_zoom_level
-            try:
-                params.product.resource_limits.check_wms(n_datasets, params.zf, params.resources)
-            except ResourceLimited as e:
-                stacker.resource_limited = True
-                qprof["resource_limited"] = str(e)
-            if qprof.active:
-                q_ds_dict = stacker.datasets(dc.index, mode=MVSelectOpts.DATASETS)
-                qprof["datasets"] = []
-                for q, dss in q_ds_dict.items():
-                    query_res = {}
-                    query_res["query"] = str(q)
-                    query_res["datasets"] = [
-                        [
-                            f"{ds.id} ({ds.type.name})"
-                            for ds in tdss
-                        ]
-                        for tdss in dss.values
+            if not ignore_limits:
+                limits.check_wms(n_datasets, params.zf, params.resources)
+        except ResourceLimited as e:
+            if windows is not None:
+                return n_datasets, None
+            stacker.resource_limited = True
+            qprof["resource_limited"] = str(e)
+        # Resource limited requests are rendered from the low resolution summary product(s) if available,
+        # and if that is not predicted to take too long.  Otherwise the extent of the data is rendered as a polygon.
+        use_polygon = stacker.resource_limited and not params.product.low_res_product_names
+        if stacker.resource_limited and not use_polygon and n_datasets > 0:
+            qprof.start_event("count-summary-datasets")
+            qprof["n_summary_datasets"] = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
+            qprof.end_event("count-summary-datasets")
+            if not limits.low_res_within_target(qprof["n_summary_datasets"], params.resources):
+                qprof["resource_limited"] += ", predicted low resolution cost exceeds target latency"
+                use_polygon = True
+        if qprof.active:
+            q_ds_dict = stacker.datasets(dc.index, mode=MVSelectOpts.DATASETS)
+            qprof["datasets"] = []
+            for q, dss in q_ds_dict.items():
+                query_res = {}
+                query_res["query"] = str(q)
+                query_res["datasets"] = [
+                    [
+                        f"{ds.id} ({ds.type.name})"
+                        for ds in tdss
                     ]
-                    qprof["datasets"].append(query_res)
-            if stacker.resource_limited and not params.product.low_res_product_names:
-                qprof.start_event("extent-in-query")
-                extent = stacker.datasets(dc.index, mode=MVSelectOpts.EXTENT)
-                qprof.end_event("extent-in-query")
-                if extent is None:
-                    qprof["write_action"] = "No extent: Write Empty"
+                    for tdss in dss.values
+                ]
+                qprof["datasets"].append(query_res)
+        if use_polygon:
+            qprof.start_event("extent-in-query")
+            extent = stacker.datasets(dc.index, mode=MVSelectOpts.EXTENT)
+            qprof.end_event("extent-in-query")
+            if extent is None:
+                qprof["write_action"] = "No extent: Write Empty"
+                raise EmptyResponse()
+            else:
+                qprof["write_action"] = "Polygon"
+                qprof.start_event("write")
+                body = _write_polygon(
+                    params.geobox,
+                    extent,
+                    params.product.resource_limits.zoom_fill,
+                    params.product)
+                qprof.end_event("write")
+        elif n_datasets == 0:
+            qprof["write_action"] = "No datasets: Write Empty"
+            raise EmptyResponse()
+        else:
+            qprof.start_event("fetch-datasets")
+            datasets = stacker.datasets(dc.index)
+            for flagband, dss in datasets.items():
+                if not dss.any():
+                    _LOG.warning("Flag band %s returned no data", str(flagband))
+                if len(dss.time) != n_dates and flagband.main:
+                    qprof["write_action"] = f"{n_dates} requested, only {len(dss.time)} found - returning empty image"
                     raise EmptyResponse()
-                else:
-                    qprof["write_action"] = "Polygon"
-                    qprof.start_event("write")
-                    body = _write_polygon(
-                        params.geobox,
-                        extent,
-                        params.product.resource_limits.zoom_fill,
-                        params.product)
-                    qprof.end_event("write")
-            elif n_datasets == 0:
-                qprof["write_action"] = "No datasets: Write Empty"
+            qprof.end_event("fetch-datasets")
+            if dataset_cache.enabled:
+                qprof["dataset_cache"] = dataset_cache.stats()
+            _LOG.debug("load start %s %s", datetime.now().time(), requestid)
+            qprof.start_event("load-data")
+            data = stacker.data(datasets)
+            qprof.end_event("load-data")
+            _LOG.debug("load stop %s %s", datetime.now().time(), requestid)
+            qprof.start_event("build-masks")
+            extent_mask = _build_extent_mask(data, params.product, params.style, qprof)
+            qprof.end_event("build-masks")
+            if not data:
+                qprof["write_action"] = "No Data: Write Empty"
                 raise EmptyResponse()
             else:
+                qprof["write_action"] = "Write Data"
+                if mdh and mdh.preserve_user_date_order:
+                    sorter = user_date_sorter(
+                                              params.product,
+                                              data.time.values,
+                                              params.geobox.geographic_extent,
+                                              params.times)
+                    data = data.sortby(sorter)
+                    extent_mask = extent_mask.sortby(sorter)
+
+                body = _write_png(data, params.style, extent_mask, qprof, windows=windows, deadline=deadline)
                 if stacker.resource_limited:
-                    qprof.start_event("count-summary-datasets")
-                    qprof["n_summary_datasets"] = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
-                    qprof.end_event("count-summary-datasets")
-                qprof.start_event("fetch-datasets")
-                datasets = stacker.datasets(dc.index)
-                for flagband, dss in datasets.items():
-                    if not dss.any():
-                        _LOG.warning("Flag band %s returned no data", str(flagband))
-                    if len(dss.time) != n_dates and flagband.main:
-                        qprof["write_action"] = f"{n_dates} requested, only {len(dss.time)} found - returning empty image"
-                        raise EmptyResponse()
-                qprof.end_event("fetch-datasets")
-                _LOG.debug("load start %s %s", datetime.now().time(), args["requestid"])
-                qprof.start_event("load-data")
-                data = stacker.data(datasets)
-                qprof.end_event("load-data")
-                _LOG.debug("load stop %s %s", datetime.now().time(), args["requestid"])
-                qprof.start_event("build-masks")
-                td_masks = []
-                for npdt in data.time.values:
-                    td = data.sel(time=npdt)
-                    td_ext_mask = None
-                    band = ""
-                    for band in params.style.needed_bands:
-                        if band not in params.style.flag_bands:
-                            if params.product.data_manual_merge:
-                                if td_ext_mask is None:
-                                    td_ext_mask = ~numpy.isnan(td[band])
-                                else:
-                                    td_ext_mask &= ~numpy.isnan(td[band])
-                            else:
-                                for f in params.product.extent_mask_func:
-                                    if td_ext_mask is None:
-                                        td_ext_mask = f(td, band)
-                                    else:
-                                        td_ext_mask &= f(td, band)
-                    if params.product.data_manual_merge:
-                        td_ext_mask = xarray.DataArray(td_ext_mask)
-                    if td_ext_mask is None:
-                        td_ext_mask = xarray.DataArray(
-                                            ~numpy.zeros(
-                                                        td[band].values.shape,
-                                                        dtype=numpy.bool_
-                                            ),
-                                            td[band].coords
-                        )
-                    td_masks.append(td_ext_mask)
-                extent_mask = xarray.concat(td_masks, dim=data.time)
-                qprof.end_event("build-masks")
-                if not data:
-                    qprof["write_action"] = "No Data: Write Empty"
-                    raise EmptyResponse()
+                    limits.record_wms_cost(qprof["n_summary_datasets"], params.resources, _render_cost(qprof),
+                                           low_res=True)
                 else:
-                    qprof["write_action"] = "Write Data"
-                    if mdh and mdh.preserve_user_date_order:
-                        sorter = user_date_sorter(
-                                                  params.product,
-                                                  data.time.values,
-                                                  params.geobox.geographic_extent,
-                                                  params.times)
-                        data = data.sortby(sorter)
-                        extent_mask = extent_mask.sortby(sorter)
-
-                    body = _write_png(data, params.style, extent_mask, qprof)
-        except EmptyResponse:
-            qprof.start_event("write")
-            body = _write_empty(params.geobox)
-            qprof.end_event("write")
+                    limits.record_wms_cost(n_datasets, params.resources, _render_cost(qprof))
+    except EmptyResponse:
+        qprof.start_event("write")
+        if windows is None:
+            body = _write_empty(params.geobox, qprof)
+        else:
+            body = [_write_empty(params.geobox[window], qprof) for window in windows]
+        qprof.end_event("write")
+    return n_datasets, body
 
-    if params.ows_stats:
-        return json_response(qprof.profile())
+
+def _render_cost(qprof):
+    """
+    :param qprof: The query profiler for a rendered GetMap request
+    :return: The time taken to fetch, load and render the data, in seconds.
+    """
+    return sum(qprof.duration(event) or 0.0 for event in COST_EVENTS)
+
+
+def _build_extent_mask(data, product, style, qprof):
+    """
+    Build the extent mask for loaded data.
+
+    If all extent mask functions are element-wise (see ogc_utils.time_vectorisable), the mask is
+    evaluated once over the full time-stacked data.  Otherwise it is evaluated per time slice and
+    the slices are concatenated.
+
+    :param data: Loaded data (xarray Dataset, with a time dimension)
+    :param product: The layer
+    :param style: The style
+    :param qprof: The query profiler
+    :return: Boolean extent mask DataArray, with the same dimensions as the data bands.
+    """
+    if product.data_manual_merge:
+        mask_funcs = [mask_by_nan]
     else:
-        return png_response(body, extra_headers=params.product.resource_limits.wms_cache_rules.cache_headers(n_datasets))
+        mask_funcs = product.extent_mask_func
+    if all(getattr(f, "time_vectorisable", False) for f in mask_funcs):
+        qprof.start_event("build-masks-vectorised")
+        extent_mask = _extent_mask_for(data, mask_funcs, style)
+        qprof.end_event("build-masks-vectorised")
+    else:
+        qprof.start_event("build-masks-per-date")
+        extent_mask = xarray.concat(
+            [
+                _extent_mask_for(data.sel(time=npdt), mask_funcs, style)
+                for npdt in data.time.values
+            ],
+            dim=data.time
+        )
+        qprof.end_event("build-masks-per-date")
+    return extent_mask
+
+
+def _extent_mask_for(data, mask_funcs, style):
+    ext_mask = None
+    band = ""
+    for band in style.needed_bands:
+        if band not in style.flag_bands:
+            for f in mask_funcs:
+                if ext_mask is None:
+                    ext_mask = f(data, band)
+                else:
+                    ext_mask &= f(data, band)
+    if ext_mask is None:
+        # No extent mask function or no non-flag bands - everything is in extent.
+        ext_mask = constant_band(data[band], True, dtype=numpy.bool_)
+    return ext_mask
 
 
 def png_response(body, cfg=None, extra_headers=None):
@@ -578,37 +968,55 @@ def png_response(body, cfg=None, extra_headers=None):
 
 
 @log_call
-def _write_png(data, style, extent_mask, qprof):
+def _write_png(data, style, extent_mask, qprof, windows=None, deadline=NO_DEADLINE):
+    deadline.check("render")
     qprof.start_event("combine-masks")
     mask = style.to_mask(data, extent_mask)
     qprof.end_event("combine-masks")
+    deadline.check("render")
     qprof.start_event("apply-style")
     img_data = style.transform_data(data, mask)
     qprof.end_event("apply-style")
+    deadline.check("render")
     qprof.start_event("write")
+    if windows is None:
+        image = _encode_png(img_data, style)
+    else:
+        # Write a separate image for each (y, x) pixel window
+        ydim, xdim = extent_mask.dims[-2:]
+        image = []
+        for ywin, xwin in windows:
+            deadline.check("render")
+            image.append(_encode_png(img_data.isel({ydim: ywin, xdim: xwin}), style))
+    qprof.end_event("write")
+    return image
+
+
+def _encode_png(img_data, style):
     # If time dimension is present animate over it.
     # Verified using : https://docs.dea.ga.gov.au/notebooks/Frequently_used_code/Animated_timeseries.html
     mdh = style.get_multi_date_handler(img_data)
+    layer = style.product
     if mdh:
-        image = xarray_image_as_png(img_data, loop_over='time', animate=True, frame_duration=mdh.frame_duration)
-    else:
-        image = xarray_image_as_png(img_data)
-    qprof.end_event("write")
-    return image
+        return xarray_image_as_png(img_data, loop_over='time', animate=True, frame_duration=mdh.frame_duration,
+                                   compress_level=layer.png_compress_level, strategy=layer.png_strategy)
+    return xarray_image_as_png(img_data,
+                               compress_level=layer.png_compress_level, strategy=layer.png_strategy,
+                               palette=layer.png_palette)
 
 
 @log_call
-def _write_empty(geobox):
-    with MemoryFile() as memfile:
-        with memfile.open(driver='PNG',
-                          width=geobox.width,
-                          height=geobox.height,
-                          count=1,
-                          transform=None,
-                          nodata=0,
-                          dtype='uint8') as thing:
-            pass
-        return memfile.read()
+def _write_empty(geobox, qprof=None):
+    body = _empty_png(geobox.width, geobox.height)
+    if qprof:
+        qprof["empty_png_cache"] = _empty_png.cache_info()._asdict()
+    return body
+
+
+@lru_cache(maxsize=64)
+def _empty_png(width, height):
+    # Encoded empty (fully transparent) PNGs, cached per process by image size.
+    return encode_png(Image.new("L", (width, height), 0), transparency=0)
 
 
 def get_coordlist(geo, layer_name):
@@ -0,0 +1,82 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from time import monotonic
+from typing import Mapping, Optional
+
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+
+class RequestTimeout(Exception):
+    """
+    Raised by Deadline.check() when a request has run past its deadline.
+    """
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"Request timed out ({stage})")
+        self.stage = stage
+
+
+class Deadline:
+    """
+    The time by which a request must be complete.
+
+    Passed down through the stages of a request, which call check() between units of work so that
+    requests that have run past their deadline (and whose client has probably given up waiting) stop
+    consuming worker CPU and I/O.
+    """
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        """
+        :param timeout: Time allowed for the request, in seconds from now.  None means no deadline.
+        """
+        if timeout is None:
+            self.expires: Optional[float] = None
+        else:
+            self.expires = monotonic() + timeout
+
+    @classmethod
+    def for_request(cls, cfg: "datacube_ows.ows_configuration.OWSConfig",
+                    args: Mapping[str, Optional[str]]) -> "Deadline":
+        """
+        Create the deadline for a request.
+
+        The timeout is the configured request_timeout, or the value of the X-Request-Timeout header (in seconds)
+        if it is shorter.  Invalid header values are ignored.
+
+        :param cfg: The OWS configuration
+        :param args: The request arguments (with captured headers - see ogc_utils.capture_headers)
+        """
+        timeout = cfg.request_timeout or None
+        header = args.get("request_timeout")
+        if header:
+            try:
+                requested = float(header)
+            except ValueError:
+                requested = None
+            if requested is not None and requested > 0 and (timeout is None or requested < timeout):
+                timeout = requested
+        return cls(timeout)
+
+    def remaining(self) -> Optional[float]:
+        """
+        :return: The time remaining before the deadline, in seconds (may be negative), or None if there is no deadline.
+        """
+        if self.expires is None:
+            return None
+        return self.expires - monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires is not None and monotonic() >= self.expires
+
+    def check(self, stage: str) -> None:
+        """
+        :param stage: Description of the current stage of the request, for the error message.
+        :raises: RequestTimeout if the deadline has passed.
+        """
+        if self.expired:
+            raise RequestTimeout(stage)
+
+
+NO_DEADLINE = Deadline()
@@ -5,16 +5,22 @@
 # SPDX-License-Identifier: Apache-2.0
 import datetime
 import json
+from collections import OrderedDict
 from enum import Enum
-from typing import Any, Iterable, Optional, Tuple, Union, cast
+from threading import Lock
+from time import monotonic
+from typing import (Any, Hashable, Iterable, List, Mapping, MutableMapping,
+                    NamedTuple, Optional, Tuple, Union, cast)
 
 import pytz
 from datacube.utils.geometry import Geometry as ODCGeom
 from geoalchemy2 import Geometry
+from psycopg2 import Binary
 from psycopg2.extras import DateTimeTZRange
 from sqlalchemy import (SMALLINT, Column, MetaData, Table, and_, or_, select,
                         text)
-from sqlalchemy.dialects.postgresql import TSTZRANGE, UUID
+from sqlalchemy.dialects.postgresql import TEXT, TSTZRANGE, UUID
+from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.sql.functions import count, func
 
 from datacube_ows.utils import default_to_utc
@@ -25,8 +31,10 @@ def get_sqlalc_engine(index: "datacube.index.Index") -> "sqlalchemy.engine.base.
     return index._db._engine
 
 
-def get_st_view(meta: MetaData) -> Table:
-    return Table('space_time_view', meta,
+def get_st_view(meta: MetaData, name: str = 'space_time_view') -> Table:
+    # space_time_view is either a materialised view, or an incrementally refreshed (and partitioned)
+    # table with the same columns (created with datacube-ows-update --schema --extent-index).
+    return Table(name, meta,
              Column('id', UUID()),
              Column('dataset_type_ref', SMALLINT()),
              Column('spatial_extent', Geometry(from_text='ST_GeomFromGeoJSON', name='geometry')),
@@ -45,12 +53,14 @@ class MVSelectOpts(Enum):
     DATASETS: return list of ODC dataset objects
     COUNT: return a count of matching datasets
     EXTENT: return full extent of query result as a Geometry
+    COUNT_IDS: return count and list of database ids (as an MVSearchResult) from a single query
     """
     ALL = 0
     IDS = 1
     COUNT = 2
     EXTENT = 3
     DATASETS = 4
+    COUNT_IDS = 5
     INVALID = 9999
 
     def sel(self, stv: Table) -> Iterable["sqlalchemy.sql.elements.ClauseElement"]:
@@ -62,13 +72,426 @@ class MVSelectOpts(Enum):
             return [cast("sqlalchemy.sql.elements.ClauseElement", count(stv.c.id))]
         if self == self.EXTENT:
             return [text("ST_AsGeoJSON(ST_Union(spatial_extent))")]
+        if self == self.COUNT_IDS:
+            return [
+                cast("sqlalchemy.sql.elements.ClauseElement", count(stv.c.id)),
+                func.array_agg(stv.c.id.cast(TEXT)),
+            ]
         assert False
 
+
+class MVSearchResult(NamedTuple):
+    """
+    Result of a combined COUNT_IDS search.
+
+    count: The number of matching datasets
+    ids: The database ids of the matching datasets
+    """
+    count: int
+    ids: List[str]
+
+
+class DatasetCache:
+    """
+    A bounded, thread-safe, per-process LRU cache of hydrated ODC Dataset objects, keyed by dataset id.
+
+    Datasets that miss the cache are fetched from the index with a single bulk_get call.
+
+    The cache is disabled (max_datasets=0) unless configured.  If a memory limit is set, memory use is
+    approximated from the size of each dataset's serialised metadata document (which is only serialised
+    for this purpose if there is a memory limit).  Entries older than max_age seconds are treated as
+    misses.
+
+    The cache is invalidated when the space-time view or extent index is refreshed by datacube-ows-update
+    (in another process), which records the time of each refresh in the wms.extent_refresh table.  The
+    refresh time is re-read at most once every refresh_check_interval seconds.
+    """
+    def __init__(self, max_datasets: int = 0, max_bytes: int = 0, max_age: int = 0,
+                 refresh_check_interval: int = 30) -> None:
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, Tuple[datacube.model.Dataset, int, float]]" = OrderedDict()
+        self.configure(max_datasets, max_bytes, max_age, refresh_check_interval)
+
+    def configure(self, max_datasets: int = 0, max_bytes: int = 0, max_age: int = 0,
+                  refresh_check_interval: int = 30) -> None:
+        """
+        (Re)configure the cache limits.  Clears the cache.
+
+        :param max_datasets: Maximum number of datasets to cache.  Zero disables the cache.
+        :param max_bytes: Approximate maximum memory footprint of the cache, in bytes.  Zero means no limit.
+        :param max_age: Maximum age of a cache entry, in seconds.  Zero means entries do not expire.
+        :param refresh_check_interval: Maximum time, in seconds, that the extent refresh time is re-used
+                before being re-read from the database.
+        """
+        with self._lock:
+            self.max_datasets = max_datasets
+            self.max_bytes = max_bytes
+            self.max_age = max_age
+            self.refresh_check_interval = refresh_check_interval
+            # (refresh time, monotonic time it was read)
+            self._refresh_stamp: Optional[Tuple[Optional[datetime.datetime], float]] = None
+            self._clear()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_datasets > 0
+
+    def clear(self) -> None:
+        """
+        Invalidate all cached datasets.
+        """
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_refresh(self, index: "datacube.index.Index") -> None:
+        """
+        Clear the cache if the space-time view or extent index has been refreshed since it was last checked.
+        """
+        now = monotonic()
+        with self._lock:
+            previous = self._refresh_stamp
+            if previous is not None and now - previous[1] < self.refresh_check_interval:
+                return
+            # Other threads re-use the previous value while this one reads the database.
+            self._refresh_stamp = (previous[0] if previous else None, now)
+        stamp = self._read_refresh_stamp(index)
+        with self._lock:
+            if previous is not None and stamp != previous[0] and self._entries:
+                self._entries.clear()
+                self.bytes = 0
+                self.invalidations += 1
+            self._refresh_stamp = (stamp, now)
+
+    @staticmethod
+    def _read_refresh_stamp(index: "datacube.index.Index") -> Optional[datetime.datetime]:
+        try:
+            with get_sqlalc_engine(index).connect() as conn:
+                return conn.execute(text("SELECT last_refreshed FROM wms.extent_refresh")).scalar()
+        except ProgrammingError:
+            # No refresh has been recorded (the table is created by datacube-ows-update --schema or --views)
+            return None
+
+    def stats(self) -> Mapping[str, int]:
+        """
+        :return: A dictionary of cache hit/miss/eviction counters and current size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "datasets": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+    def get_datasets(self, index: "datacube.index.Index", ids: Iterable[str]) -> List["datacube.model.Dataset"]:
+        """
+        Return ODC Dataset objects for the given ids, only fetching those not already cached.
+
+        :param index: A datacube index
+        :param ids: An iterable of dataset ids
+        :return: A list of ODC Dataset objects
+        """
+        ids = [str(i) for i in ids]
+        if not self.enabled:
+            return list(index.datasets.bulk_get(ids))
+        self._check_refresh(index)
+        found = {}
+        missing = []
+        now = monotonic()
+        with self._lock:
+            for id_ in ids:
+                entry = self._entries.get(id_)
+                if entry is not None and self.max_age and now - entry[2] > self.max_age:
+                    self._remove(id_)
+                    entry = None
+                if entry is None:
+                    missing.append(id_)
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(id_)
+                    found[id_] = entry[0]
+                    self.hits += 1
+        if missing:
+            fetched = list(index.datasets.bulk_get(missing))
+            with self._lock:
+                for ds in fetched:
+                    id_ = str(ds.id)
+                    found[id_] = ds
+                    self._insert(id_, ds, now)
+        return [found[id_] for id_ in ids if id_ in found]
+
+    def _insert(self, id_: str, ds: "datacube.model.Dataset", timestamp: float) -> None:
+        if id_ in self._entries:
+            self._remove(id_)
+        if self.max_bytes:
+            size = len(json.dumps(ds.metadata_doc, default=str))
+        else:
+            size = 0
+        self._entries[id_] = (ds, size, timestamp)
+        self.bytes += size
+        while self._entries and (
+                len(self._entries) > self.max_datasets
+                or (self.max_bytes and self.bytes > self.max_bytes)):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, id_: str) -> None:
+        _, size, _ = self._entries.pop(id_)
+        self.bytes -= size
+
+
+dataset_cache = DatasetCache()
+
+
 TimeSearchTerm = Union[
     Tuple[datetime.datetime, datetime.datetime],
     datetime.datetime,
 ]
 
+
+def _time_term(t: TimeSearchTerm) -> Union[Tuple[datetime.datetime, datetime.datetime], DateTimeTZRange]:
+    """
+    Normalise a time search term.
+
+    :param t: A date, a datetime, or a pair of datetimes (with time zone)
+    :return: A (start, end) pair of datetimes to compare against the start of the temporal extent
+            (for dates and datetimes), or a DateTimeTZRange to test for overlap with the temporal extent.
+    """
+    if isinstance(t, datetime.datetime):
+        t = datetime.datetime(t.year, t.month, t.day, t.hour, t.minute, t.second)
+        t = default_to_utc(t)
+        if not t.tzinfo:
+            t = t.replace(tzinfo=pytz.utc)
+        return t, t + datetime.timedelta(seconds=1)
+    if isinstance(t, datetime.date):
+        t = datetime.datetime(t.year, t.month, t.day, tzinfo=pytz.utc)
+        return t, t + datetime.timedelta(days=1)
+    return DateTimeTZRange(*t)
+
+
+def _search_geom(geom: Optional[ODCGeom]) -> Tuple[Optional[ODCGeom], Optional["datacube.utils.geometry.CRS"]]:
+    """
+    :param geom: A search geometry, or None
+    :return: A tuple of (search geometry in EPSG:4326, original CRS of the search geometry)
+    """
+    if geom is None:
+        return None, None
+    orig_crs = geom.crs
+    if str(geom.crs) != "EPSG:4326":
+        geom = geom.to_crs("EPSG:4326")
+    return geom, orig_crs
+
+
+class MVQuery(NamedTuple):
+    """
+    The SQL for one query shape of a MVQueryCache.
+
+    name: The name of the server-side prepared statement
+    sql: The query, with psycopg2 placeholders
+    prepare_sql: A PREPARE statement for the query
+    execute_sql: An EXECUTE statement for the prepared query, with psycopg2 placeholders
+    """
+    name: str
+    sql: str
+    prepare_sql: str
+    execute_sql: str
+
+
+class MVQueryCache:
+    """
+    A thread-safe, per-process cache of the SQL for mv_search queries.
+
+    Queries are keyed by their shape - the selection mode, the kind of each time search term, and
+    whether there is a search geometry - and the products, times and search geometry (as WKB) are passed as
+    query parameters.  This avoids building and compiling a SQLAlchemy query for every search.
+
+    If prepare is set, each query shape is also prepared as a server-side prepared statement the first
+    time it is used on each database connection.  Prepared statements belong to the database session, so
+    this cannot be used with connection poolers that share sessions between clients (e.g. pgbouncer in
+    transaction pooling mode).
+
+    The ALL selection mode is not cached.
+    """
+    _columns = {
+        MVSelectOpts.IDS: "CAST(id AS TEXT)",
+        MVSelectOpts.DATASETS: "CAST(id AS TEXT)",
+        MVSelectOpts.COUNT: "count(id)",
+        MVSelectOpts.EXTENT: "ST_AsGeoJSON(ST_Union(spatial_extent))",
+        MVSelectOpts.COUNT_IDS: "count(id), array_agg(CAST(id AS TEXT))",
+    }
+    _generation = 0
+
+    def __init__(self, prepare: bool = False, relation: str = "space_time_view") -> None:
+        self._lock = Lock()
+        self._queries: MutableMapping[Hashable, MVQuery] = {}
+        self.configure(prepare, relation)
+
+    def configure(self, prepare: bool = False, relation: str = "space_time_view") -> None:
+        """
+        (Re)configure the cache.  Clears the cache.
+
+        :param prepare: If true, use server-side prepared statements.
+        :param relation: The space_time_view relation to query.
+        """
+        with self._lock:
+            self.prepare = prepare
+            self.relation = relation
+            self._queries.clear()
+            # Prepared statement names must not be reused for different SQL on connections
+            # that were used before the cache was reconfigured.
+            MVQueryCache._generation += 1
+            self._prefix = f"ows_mv_{MVQueryCache._generation}"
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    @staticmethod
+    def shape(sel: MVSelectOpts,
+              terms: Optional[List[Union[Tuple[datetime.datetime, datetime.datetime], DateTimeTZRange]]],
+              has_geom: bool) -> Hashable:
+        """
+        :param sel: Selection mode - a MVSelectOpts enum.
+        :param terms: A list of normalised time search terms (see _time_term), or None
+        :param has_geom: True if the search has a search geometry
+        :return: The cache key for the query shape.
+        """
+        if terms is None:
+            kinds = None
+        else:
+            kinds = tuple(isinstance(term, DateTimeTZRange) for term in terms)
+        return sel, kinds, has_geom
+
+    def query(self, key: Hashable) -> MVQuery:
+        """
+        :param key: A query shape, as returned by shape()
+        :return: The (cached) SQL for the query shape.
+        """
+        query = self._queries.get(key)
+        if query is None:
+            with self._lock:
+                query = self._queries.get(key)
+                if query is None:
+                    query = self._build(key, f"{self._prefix}_{len(self._queries)}")
+                    self._queries[key] = query
+        return query
+
+    def _build(self, key: Hashable, name: str) -> MVQuery:
+        sel, kinds, has_geom = key
+        types = ["smallint[]"]
+        clauses = ["dataset_type_ref = ANY({})"]
+        if kinds:
+            time_clauses = []
+            for is_range in kinds:
+                if is_range:
+                    types.append("tstzrange")
+                    time_clauses.append("temporal_extent && {}")
+                else:
+                    types.extend(["timestamptz", "timestamptz"])
+                    time_clauses.append("(lower(temporal_extent) >= {} AND lower(temporal_extent) < {})")
+            clauses.append(f"({' OR '.join(time_clauses)})")
+        if has_geom:
+            types.append("bytea")
+            clauses.append("spatial_extent && ST_GeomFromWKB({}, 4326)")
+        template = f"SELECT {self._columns[sel]} FROM {self.relation} WHERE {' AND '.join(clauses)}"
+        prepared = template.format(*(f"${i}" for i in range(1, len(types) + 1)))
+        return MVQuery(
+            name=name,
+            sql=template.format(*(f"%s::{t}" for t in types)),
+            prepare_sql=f"PREPARE {name} ({', '.join(types)}) AS {prepared}",
+            execute_sql=f"EXECUTE {name} ({', '.join('%s' for _ in types)})",
+        )
+
+    def execute(self,
+                conn: "sqlalchemy.engine.Connection",
+                sel: MVSelectOpts,
+                times: Optional[Iterable[TimeSearchTerm]],
+                geom: Optional[ODCGeom],
+                prod_ids: List[int]) -> "sqlalchemy.engine.CursorResult":
+        """
+        Run a dataset search.
+
+        :param conn: A database connection
+        :param sel: Selection mode - a MVSelectOpts enum (not ALL).
+        :param times: A list of time search terms, or None
+        :param geom: The search geometry in EPSG:4326, or None
+        :param prod_ids: The ids of the products to search
+        :return: The query result
+        """
+        terms = None if times is None else [_time_term(t) for t in times]
+        query = self.query(self.shape(sel, terms, geom is not None))
+        params: List[Any] = [prod_ids]
+        for term in terms or []:
+            if isinstance(term, DateTimeTZRange):
+                params.append(term)
+            else:
+                params.extend(term)
+        if geom is not None:
+            params.append(Binary(geom.geom.wkb))
+        if not self.prepare:
+            return conn.exec_driver_sql(query.sql, tuple(params))
+        # Connection info is cleared if the pool reconnects, so this tracks the statements
+        # prepared in the current database session.
+        prepared = conn.connection.info.setdefault("ows_prepared_statements", set())
+        if query.name not in prepared:
+            conn.exec_driver_sql(query.prepare_sql)
+            prepared.add(query.name)
+        return conn.exec_driver_sql(query.execute_sql, tuple(params))
+
+
+mv_query_cache = MVQueryCache()
+
+def mv_search_query(stv: Table,
+                    sel: MVSelectOpts,
+                    times: Optional[Iterable[TimeSearchTerm]],
+                    geom: Optional[ODCGeom],
+                    products: Iterable["datacube.model.DatasetType"]
+                   ) -> Tuple["sqlalchemy.sql.Select", Optional[ODCGeom], Optional["datacube.utils.geometry.CRS"]]:
+    """
+    Build the query for a dataset search against the space_time_view (or a table with the same columns).
+
+    :param stv: The space_time_view Table
+    :param sel: Selection mode - a MVSelectOpts enum.
+    :param times: A list of pairs of datetimes (with time zone)
+    :param geom: A datacube.utils.geometry.Geometry object
+    :param products: An iterable of combinable products to search
+    :return: A tuple of (query, search geometry in EPSG:4326, original CRS of the search geometry)
+    """
+    prod_ids = [p.id for p in products]
+
+    s = select(*sel.sel(stv)).where(stv.c.dataset_type_ref.in_(prod_ids))
+    if times is not None:
+        or_clauses = []
+        for term in map(_time_term, times):
+            if isinstance(term, DateTimeTZRange):
+                or_clauses.append(
+                    stv.c.temporal_extent.op("&&")(term)
+                )
+            else:
+                t, tmax = term
+                or_clauses.append(
+                    and_(
+                        func.lower(stv.c.temporal_extent) >= t,
+                        func.lower(stv.c.temporal_extent) < tmax,
+                    )
+                )
+        s = s.where(or_(*or_clauses))
+    geom, orig_crs = _search_geom(geom)
+    if geom is not None:
+        geom_js = json.dumps(geom.json)
+        s = s.where(stv.c.spatial_extent.intersects(geom_js))
+    return s, geom, orig_crs
+
+
 def mv_search(index: "datacube.index.Index",
               sel: MVSelectOpts = MVSelectOpts.IDS,
               times: Optional[Iterable[TimeSearchTerm]] = None,
@@ -79,7 +502,8 @@ def mv_search(index: "datacube.index.Index",
         Iterable["datacube.model.Dataset"],
         int,
         None,
-        ODCGeom]:
+        ODCGeom,
+        MVSearchResult]:
     """
     Perform a dataset query via the space_time_view
 
@@ -93,72 +517,52 @@ def mv_search(index: "datacube.index.Index",
     :return: See MVSelectOpts doc
     """
     engine = get_sqlalc_engine(index)
-    stv = st_view
     if products is None:
         raise Exception("Must filter by product/layer")
+    if sel == MVSelectOpts.ALL:
+        s, _, _ = mv_search_query(st_view, sel, times, geom, products)
+        with engine.connect() as conn:
+            return conn.execute(s)
     prod_ids = [p.id for p in products]
-
-    s = select(*sel.sel(stv)).where(stv.c.dataset_type_ref.in_(prod_ids))
-    if times is not None:
-        or_clauses = []
-        for t in times:
-            if isinstance(t, datetime.datetime):
-                t = datetime.datetime(t.year, t.month, t.day, t.hour, t.minute, t.second)
-                t = default_to_utc(t)
-                if not t.tzinfo:
-                    t = t.replace(tzinfo=pytz.utc)
-                tmax = t + datetime.timedelta(seconds=1)
-                or_clauses.append(
-                    and_(
-                        func.lower(stv.c.temporal_extent) >= t,
-                        func.lower(stv.c.temporal_extent) < tmax,
-                    )
-                )
-            elif isinstance(t, datetime.date):
-                t = datetime.datetime(t.year, t.month, t.day, tzinfo=pytz.utc)
-                tmax = t + datetime.timedelta(days=1)
-                or_clauses.append(
-                    and_(
-                        func.lower(stv.c.temporal_extent) >= t,
-                        func.lower(stv.c.temporal_extent) < tmax,
-                    )
-                )
-            else:
-                or_clauses.append(
-                    stv.c.temporal_extent.op("&&")(DateTimeTZRange(*t))
-                )
-        s = s.where(or_(*or_clauses))
-    orig_crs = None
-    if geom is not None:
-        orig_crs = geom.crs
-        if str(geom.crs) != "EPSG:4326":
-            geom = geom.to_crs("EPSG:4326")
-        geom_js = json.dumps(geom.json)
-        s = s.where(stv.c.spatial_extent.intersects(geom_js))
-    # print(s) # Print SQL Statement
+    geom, orig_crs = _search_geom(geom)
     with engine.connect() as conn:
-        if sel == MVSelectOpts.ALL:
-            return conn.execute(s)
+        result = mv_query_cache.execute(conn, sel, times, geom, prod_ids)
         if sel == MVSelectOpts.IDS:
-            return [r[0] for r in conn.execute(s)]
+            return [r[0] for r in result]
         if sel in (MVSelectOpts.COUNT, MVSelectOpts.EXTENT):
-            for r in conn.execute(s):
+            for r in result:
                 if sel == MVSelectOpts.COUNT:
                     return r[0]
                 if sel == MVSelectOpts.EXTENT:
-                    geojson = r[0]
-                    if geojson is None:
-                        return None
-                    uniongeom = ODCGeom(json.loads(geojson), crs="EPSG:4326")
-                    if geom:
-                        intersect = uniongeom.intersection(geom)
-                        if intersect.wkt == 'POLYGON EMPTY':
-                            return None
-                        if orig_crs and orig_crs != "EPSG:4326":
-                            intersect = intersect.to_crs(orig_crs)
-                    else:
-                        intersect = uniongeom
-                    return intersect
+                    return _query_extent(r[0], geom, orig_crs)
+        if sel == MVSelectOpts.COUNT_IDS:
+            for r in result:
+                return MVSearchResult(count=r[0], ids=list(r[1] or []))
         if sel == MVSelectOpts.DATASETS:
-            ids = [r[0] for r in conn.execute(s)]
-            return index.datasets.bulk_get(ids)
+            ids = [r[0] for r in result]
+            return dataset_cache.get_datasets(index, ids)
+
+
+def _query_extent(geojson: Optional[str],
+                  geom: Optional[ODCGeom],
+                  orig_crs: Optional["datacube.utils.geometry.CRS"]) -> Optional[ODCGeom]:
+    """
+    Convert the union extent returned by an EXTENT query to a Geometry, clipped to the search geometry.
+
+    :param geojson: The GeoJSON string returned by the query (may be None)
+    :param geom: The search geometry (in EPSG:4326), or None
+    :param orig_crs: The original CRS of the search geometry.
+    :return: The clipped extent in the original CRS, or None if there is no extent.
+    """
+    if geojson is None:
+        return None
+    uniongeom = ODCGeom(json.loads(geojson), crs="EPSG:4326")
+    if geom:
+        intersect = uniongeom.intersection(geom)
+        if intersect.wkt == 'POLYGON EMPTY':
+            return None
+        if orig_crs and orig_crs != "EPSG:4326":
+            intersect = intersect.to_crs(orig_crs)
+    else:
+        intersect = uniongeom
+    return intersect
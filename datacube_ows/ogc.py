@@ -12,6 +12,7 @@ from sqlalchemy import text
 
 from datacube_ows import __version__
 from datacube_ows.cube_pool import cube
+from datacube_ows.deadline import RequestTimeout
 from datacube_ows.legend_generator import create_legend_for_style
 from datacube_ows.ogc_exceptions import OGCException, WMSException
 from datacube_ows.ogc_utils import (capture_headers, get_service_base_url,
@@ -42,6 +43,8 @@ babel = initialise_babel(cfg, app)
 # Initialisation of external libraries that depend on Flask
 # (controlled by environment variables)
 metrics = initialise_prometheus(app, _LOG)
+initialise_range_refresh_metrics(metrics)
+initialise_cube_pool_metrics(metrics)
 
 # Protocol/Version lookup table
 OWS_SUPPORTED = supported_versions()
@@ -152,6 +155,9 @@ def ogc_svc_impl(svc):
         return version_support.router(nocase_args)
     except OGCException as e:
         return e.exception_response()
+    except RequestTimeout as e:
+        _LOG.warning("%s: %s", str(e), nocase_args.get("requestid"))
+        return version_support.exception_class(str(e), http_response=503).exception_response()
     except Exception as e: #pylint: disable=broad-except
         tb = sys.exc_info()[2]
         ogc_e = version_support.exception_class("Unexpected server error: %s" % str(e), http_response=500)
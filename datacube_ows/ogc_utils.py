@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: Apache-2.0
 import datetime
 import logging
+import zlib
 from importlib import import_module
 from io import BytesIO
 from itertools import chain
@@ -21,6 +22,8 @@ from PIL import Image
 from pytz import timezone, utc
 from timezonefinder import TimezoneFinder
 
+from datacube_ows.deadline import TIMEOUT_HEADER
+
 _LOG: logging.Logger = logging.getLogger(__name__)
 tf = TimezoneFinder(in_memory=True)
 
@@ -263,6 +266,9 @@ def capture_headers(req: "flask.Request",
     args_dict['requestid'] = req.environ.get("FLASK_REQUEST_ID")
     args_dict['host'] = req.headers.get('Host', None)
     args_dict['url_root'] = req.url_root
+    args_dict['if_none_match'] = req.headers.get('If-None-Match', None)
+    args_dict['accept_encoding'] = req.headers.get('Accept-Encoding', None)
+    args_dict['request_timeout'] = req.headers.get(TIMEOUT_HEADER, None)
 
     return args_dict
 
@@ -340,6 +346,13 @@ class FunctionWrapper:
             else:
                 self.band_mapper = None
 
+    @property
+    def time_vectorisable(self) -> bool:
+        """
+        True if the wrapped function is marked as element-wise with the time_vectorisable decorator.
+        """
+        return getattr(self._func, "time_vectorisable", False)
+
     def __call__(self, *args, **kwargs) -> Any:
         if args and self._args:
             calling_args = chain(args, self._args)
@@ -373,6 +386,18 @@ def cache_control_headers(max_age: int) -> str:
 
 # Extent Mask Functions
 
+def time_vectorisable(func: F) -> F:
+    """
+    Decorator marking an extent mask function as element-wise.
+
+    The extent masks of element-wise functions can be evaluated over all time slices in
+    a single call, rather than once per time slice.
+    """
+    setattr(func, "time_vectorisable", True)
+    return func
+
+
+@time_vectorisable
 def mask_by_val(data: "xarray.Dataset", band: str, val: Optional[Any] = None) -> "xarray.DataArray":
     """
     Mask by value.
@@ -386,6 +411,7 @@ def mask_by_val(data: "xarray.Dataset", band: str, val: Optional[Any] = None) ->
         return data[band] != val
 
 
+@time_vectorisable
 def mask_by_val2(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     """
     Mask by value, using ODC canonical nodata value
@@ -395,6 +421,7 @@ def mask_by_val2(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     return data[band] != data[band].nodata
 
 
+@time_vectorisable
 def mask_by_bitflag(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     """
     Mask by ODC metadata nodata value, as a bitflag
@@ -402,6 +429,7 @@ def mask_by_bitflag(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     return ~data[band] & data[band].attrs['nodata']
 
 
+@time_vectorisable
 def mask_by_val_in_band(data: "xarray.Dataset", band: str, mask_band: str, val: Any = None) -> "xarray.DataArray":
     """
     Mask all bands by a value in a particular band
@@ -412,6 +440,7 @@ def mask_by_val_in_band(data: "xarray.Dataset", band: str, mask_band: str, val:
     return mask_by_val(data, mask_band, val)
 
 
+@time_vectorisable
 def mask_by_quality(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     """
     Mask by a quality band.
@@ -424,6 +453,7 @@ def mask_by_quality(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     return mask_by_val(data, "quality")
 
 
+@time_vectorisable
 def mask_by_extent_flag(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     """
     Mask by extent.
@@ -433,6 +463,7 @@ def mask_by_extent_flag(data: "xarray.Dataset", band: str) -> "xarray.DataArray"
     return data["extent"] == 1
 
 
+@time_vectorisable
 def mask_by_extent_val(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     """
     Mask by extent value using metadata nodata.
@@ -442,6 +473,7 @@ def mask_by_extent_val(data: "xarray.Dataset", band: str) -> "xarray.DataArray":
     return mask_by_val(data, "extent")
 
 
+@time_vectorisable
 def mask_by_nan(data: "xarray.Dataset", band: str) -> "numpy.NDArray":
     """
     Mask by nan, for bands with floating point data
@@ -449,6 +481,25 @@ def mask_by_nan(data: "xarray.Dataset", band: str) -> "numpy.NDArray":
     return ~numpy.isnan(cast(numpy.generic, data[band]))
 
 
+def constant_band(template: "xarray.DataArray", value: Any, dtype: str = "uint8") -> "xarray.DataArray":
+    """
+    Create a band with the shape and coordinates of template, where every pixel has the same value.
+
+    The pixel data is not materialised - it is a read-only view of a single value.
+    """
+    return template.copy(data=numpy.broadcast_to(numpy.array(value).astype(dtype), template.shape))
+
+
+def constant_band_value(data: "xarray.DataArray") -> Optional[Any]:
+    """
+    Return the value of a constant band (as created by constant_band), or None for normal bands.
+    """
+    arr = data.data
+    if isinstance(arr, numpy.ndarray) and arr.ndim > 0 and arr.size > 0 and not any(arr.strides):
+        return arr.flat[0]
+    return None
+
+
 # Example mosaic date function
 def rolling_window_ndays(
         available_dates: Sequence[datetime.datetime],
@@ -521,7 +572,18 @@ def create_geobox(
     return geometry.GeoBox(width, height, affine, crs)
 
 
-def xarray_image_as_png(img_data, loop_over=None, animate=False, frame_duration=1000):
+# zlib compression strategies for PNG encoding
+PNG_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman_only": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+
+def xarray_image_as_png(img_data, loop_over=None, animate=False, frame_duration=1000,
+                        compress_level=None, strategy=None, palette=False):
     """
     Render an Xarray image as a PNG.
 
@@ -529,11 +591,15 @@ def xarray_image_as_png(img_data, loop_over=None, animate=False, frame_duration=
     :param loop_over: Optional name of a dimension on img_data.  If set, xarray_image_as_png is called in a loop
                 over all coordinate values for the named dimension.
     :param animate: Optional generate animated PNG
+    :param compress_level: Optional zlib compression level (0-9).  Defaults to the Pillow default.
+    :param strategy: Optional zlib compression strategy - a key of PNG_STRATEGIES.  Defaults to "default".
+    :param palette: Optional.  If True, single-frame images with 256 colours or less are written as palette PNGs.
     :return: A list of bytes representing a PNG image file. (Or a list of lists of bytes, if loop_over was set.)
     """
     if loop_over and not animate:
         return [
-            xarray_image_as_png(img_data.sel(**{loop_over: coord}))
+            xarray_image_as_png(img_data.sel(**{loop_over: coord}),
+                                compress_level=compress_level, strategy=strategy, palette=palette)
             for coord in img_data.coords[loop_over].values
         ]
     xcoord = None
@@ -550,7 +616,6 @@ def xarray_image_as_png(img_data, loop_over=None, animate=False, frame_duration=
         raise Exception("Could not identify spatial coordinates")
     width = len(img_data.coords[xcoord])
     height = len(img_data.coords[ycoord])
-    img_io = BytesIO()
     # Render XArray to APNG via Pillow
     # https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html#apng-sequences
     if loop_over and animate:
@@ -558,14 +623,12 @@ def xarray_image_as_png(img_data, loop_over=None, animate=False, frame_duration=
             xarray_image_as_png(img_data.sel(**{loop_over: coord}), animate=True)
             for coord in img_data.coords[loop_over].values
         ]
-        images = []
-
-        for t_slice in time_slices_array:
-            im = Image.fromarray(t_slice, "RGBA")
-            images.append(im)
-        images[0].save(img_io, "PNG", save_all=True, default_image=True, loop=0, duration=frame_duration, append_images=images)
-        img_io.seek(0)
-        return img_io.read()
+        images = [
+            Image.fromarray(t_slice, "RGBA")
+            for t_slice in time_slices_array
+        ]
+        return encode_png(images[0], compress_level=compress_level, strategy=strategy,
+                          save_all=True, default_image=True, loop=0, duration=frame_duration, append_images=images)
 
     if "time" in img_data.dims:
         img_data = img_data.squeeze(dim="time", drop=True)
@@ -574,11 +637,53 @@ def xarray_image_as_png(img_data, loop_over=None, animate=False, frame_duration=
     if not loop_over and animate:
         return pillow_data
 
-    # Change PNG rendering to Pillow
-    im_final = Image.fromarray(pillow_data, "RGBA")
-    im_final.save(img_io, "PNG")
-    img_io.seek(0)
-    return img_io.read()
+    if palette:
+        im_final = palette_image(pillow_data)
+    else:
+        im_final = None
+    if im_final is None:
+        im_final = Image.fromarray(pillow_data, "RGBA")
+    return encode_png(im_final, compress_level=compress_level, strategy=strategy)
+
+
+def encode_png(image, compress_level=None, strategy=None, **kwargs):
+    """
+    Encode a Pillow image as a PNG.
+
+    :param image: A Pillow Image
+    :param compress_level: Optional zlib compression level (0-9).  Defaults to the Pillow default.
+    :param strategy: Optional zlib compression strategy - a key of PNG_STRATEGIES.  Defaults to "default".
+    :param kwargs: Additional arguments passed through to the Pillow PNG encoder
+    :return: The PNG file as bytes
+    """
+    if compress_level is not None:
+        kwargs["compress_level"] = compress_level
+    if strategy is not None:
+        kwargs["compress_type"] = PNG_STRATEGIES[strategy]
+    img_io = BytesIO()
+    image.save(img_io, "PNG", **kwargs)
+    return img_io.getvalue()
+
+
+def palette_image(pixels):
+    """
+    Convert an RGBA pixel buffer to a palette ("P" mode) Pillow image, if it has no more than 256 distinct colours.
+
+    Alpha values are preserved in the palette transparency.
+
+    :param pixels: A contiguous (height, width, 4) uint8 numpy array, as returned by render_frame
+    :return: A palette mode Pillow Image, or None if there are more than 256 colours.
+    """
+    if Image.fromarray(pixels, "RGBA").getcolors(256) is None:
+        return None
+    colours, indices = numpy.unique(pixels.view(numpy.uint32).reshape(-1), return_inverse=True)
+    rgba = colours.view(numpy.uint8).reshape(-1, 4)
+    im = Image.fromarray(indices.astype(numpy.uint8).reshape(pixels.shape[:2]), "P")
+    im.putpalette(rgba[:, :3].tobytes(), "RGB")
+    if (rgba[:, 3] != 255).any():
+        im.info["transparency"] = rgba[:, 3].tobytes()
+    return im
+
 
 def render_frame(img_data, width, height):
     """Render to a 3D numpy array an Xarray RGB(A) input
@@ -589,27 +694,17 @@ def render_frame(img_data, width, height):
         height ([type]): Height of the frame to render
 
     Returns:
-        numpy.ndarray: 3D Rendered Xarray as numpy array
+        numpy.ndarray: Contiguous (height, width, 4) uint8 RGBA array
     """
-    masked = False
-    last_band = None
-    buffer = numpy.zeros((4, width, height), numpy.uint8)
+    buffer = numpy.zeros((height, width, 4), numpy.uint8)
     band_index = {
         "red": 0,
         "green": 1,
         "blue": 2,
         "alpha": 3,
     }
+    if "alpha" not in img_data.data_vars:
+        buffer[:, :, 3] = 255
     for band in img_data.data_vars:
-        index = band_index[band]
-        band_data = img_data[band].values
-        if band == "alpha":
-            masked = True
-        buffer[index, :, :] = band_data
-        index += 1
-        last_band = band_data
-    if not masked:
-        alpha_mask = numpy.empty(last_band.shape).astype('uint8')
-        alpha_mask.fill(255)
-        buffer[3, :, :] = alpha_mask
-    return buffer.transpose()
+        buffer[:, :, band_index[band]] = img_data[band].values.T
+    return buffer
@@ -1357,6 +1357,18 @@ standard_resource_limits = {
         # extents for the product.
         # Defaults to zero, which is interpreted as no dataset limit.
         "max_datasets": 10,
+        # Target latency for GetMap/GetTile requests, in seconds.
+        #
+        # If set, each worker process fits a model of the cost of rendering this layer from recent requests.
+        # Once trained (after cost_model_min_samples requests), the model replaces min_zoom_factor and
+        # min_zoom_level: requests predicted to take longer than the target latency are resource limited.
+        # (One in 20 such requests is rendered anyway, so the model can correct over-predictions.)
+        # max_datasets still applies.
+        #
+        # Optional, defaults to None (static limits only).
+        "target_latency": 2.0,
+        # Number of requests observed before the cost model is used.  Optional, defaults to 20.
+        "cost_model_min_samples": 20,
         # Dataset cache rules.
         #
         # The number of datasets accessed by a GetMap/GetTile/GetCoverage query can be used to control
@@ -1489,6 +1501,73 @@ ows_cfg = {
         # If there are constraints on access to the service, they can be described here in free text.
         # If blank or not included, defaults to "none".
         "access_constraints": "",
+        # Per-process LRU cache of ODC dataset objects returned by index searches.
+        # Optional, defaults to disabled (max_datasets: 0).
+        "dataset_cache": {
+            # Maximum number of datasets cached per worker process.
+            "max_datasets": 5000,
+            # Approximate memory limit per worker process, in megabytes (0 = no limit)
+            "max_memory_mb": 256,
+            # Maximum age of a cached dataset, in seconds (0 = never expire)
+            "max_age": 3600,
+            # How often each worker process checks whether datacube-ows-update --views has refreshed the
+            # views or extent index (and so clears its cache), in seconds.  Defaults to 30.
+            "refresh_check_interval": 30,
+        },
+        # Per-process thread pools for concurrent per-dataset reads (manual merge layers)
+        # and concurrent main/flag product loads.
+        # Optional, defaults to serial reads (threads: 0, query_threads: 0).
+        "concurrent_reads": {
+            # Number of threads in the per-process read pool.
+            "threads": 16,
+            # Maximum number of reads in flight for a single request (defaults to threads)
+            "max_in_flight": 4,
+            # Number of threads for loading main and flag product queries concurrently (0 = serial)
+            "query_threads": 8,
+        },
+        # Per-process pool of Datacube objects, each checked out by one request at a time.
+        # Optional, defaults to a single Datacube object shared by all threads (max_size: 0).
+        "cube_pool": {
+            # Maximum number of pooled Datacube objects per worker process (normally the number of worker threads)
+            "max_size": 8,
+            # Number of pooled Datacube objects created when the pool is first used.  Optional, defaults to 0.
+            "min_size": 2,
+            # Maximum time to wait for a free Datacube object, in seconds.  Optional, defaults to 30.
+            "checkout_timeout": 10,
+            # Check the database connection of pooled Datacube objects on checkout.  Optional, defaults to True.
+            "check_on_borrow": True,
+        },
+        # Server-side cache of rendered GetMap/GetTile images.
+        # Optional, defaults to no response cache.
+        "response_cache": {
+            # Storage backend: memory (per-process), disk (per-host) or redis (shared).
+            "backend": "disk",
+            # Cache directory (disk backend only)
+            "directory": "/var/cache/ows",
+            # Maximum age of a cached image, in seconds (0 = never expire)
+            "max_age": 86400,
+            # Render WMTS tiles in 4x4 blocks, caching all 16 tiles from one data load.
+            # Optional, defaults to 1 (no metatiling)
+            "wmts_metatile_size": 4,
+        },
+        # Cache rendered GetCapabilities documents (with pre-compressed variants and ETags) in each worker process.
+        # Optional - if not supplied, GetCapabilities documents are rendered for every request.
+        "capabilities_cache": {
+            # How often to check the database for range updates, in seconds.  Optional, defaults to 30.
+            "range_check_interval": 60,
+        },
+        # Reload the ranges of dynamic layers in a background thread every 60 seconds,
+        # instead of re-reading them from the database on every use.
+        # Optional, defaults to 0 (re-read on every use).
+        "dynamic_range_refresh_interval": 60,
+        # Abandon GetMap/GetTile/GetCoverage requests that take longer than 30 seconds.
+        # Clients may request a shorter timeout with the X-Request-Timeout header.
+        # Optional, defaults to 0 (no timeout).
+        "request_timeout": 30,
+        # Use server-side prepared statements for dataset searches.
+        # Do not enable if connecting via a transaction-pooling connection pooler (e.g. pgbouncer).
+        # Optional, defaults to False.
+        "prepared_statements": True,
         # Supported co-ordinate reference systems. Any coordinate system supported by GDAL and Proj.4J can be used.
         # At least one CRS must be included.  At least one geographic CRS must be included if WCS is active.
         # WGS-84 (EPSG:4326) is strongly recommended, but not required.
@@ -1804,6 +1883,16 @@ ows_cfg = {
                         # Apply corrections for solar angle, for "Level 1" products.
                         # (Defaults to false - should not be used for NBAR/NBAR-T or other Analysis Ready products
                         "apply_solar_corrections": False,
+                        # Optional PNG encoding options for WMS/WMTS images.
+                        "png_encoding": {
+                            # zlib compression level, 0-9. Defaults to the Pillow default (6).
+                            "compress_level": 6,
+                            # zlib compression strategy: default, filtered, huffman_only, rle or fixed.
+                            "strategy": "default",
+                            # Write palette PNGs for single-date images with 256 colours or less.
+                            # Defaults to True.
+                            "palette": True,
+                        },
                     },
                     # If the WCS section is not supplied, then this named layer will NOT appear as a WCS
                     # coverage (but will still be a layer in WMS and WMTS).
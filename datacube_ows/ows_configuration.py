@@ -28,17 +28,24 @@ from datacube.utils import geometry
 from ows import Version
 from slugify import slugify
 
+from datacube_ows.capabilities_cache import capabilities_cache
 from datacube_ows.config_utils import (FlagProductBands, OWSConfigEntry,
                                        OWSEntryNotFound,
                                        OWSExtensibleConfigEntry, OWSFlagBand,
                                        OWSMetadataConfig, cfg_expand,
                                        get_file_loc, import_python_obj,
-                                       load_json_obj)
-from datacube_ows.cube_pool import ODCInitException, cube, get_cube
-from datacube_ows.ogc_utils import (ConfigException, FunctionWrapper,
-                                    create_geobox, local_solar_date_range)
+                                       load_json_obj, parse_non_negative_int)
+from datacube_ows.cube_pool import CubePool, ODCInitException, cube, get_cube
+from datacube_ows.mv_index import dataset_cache, mv_query_cache
+from datacube_ows.ogc_utils import (PNG_STRATEGIES, ConfigException,
+                                    FunctionWrapper, create_geobox,
+                                    local_solar_date_range)
+from datacube_ows.range_refresher import range_refresher
 from datacube_ows.resource_limits import (OWSResourceManagementRules,
                                           parse_cache_age)
+from datacube_ows.response_cache import (DiskCacheBackend, MemoryCacheBackend,
+                                         RedisCacheBackend, ResponseCache,
+                                         response_cache)
 from datacube_ows.styles import StyleDef
 from datacube_ows.tile_matrix_sets import TileMatrixSet
 from datacube_ows.utils import (group_by_begin_datetime, group_by_mosaic,
@@ -549,7 +556,7 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
                 self.low_res_products.append(product)
         self.product = self.products[0]
         self.definition = self.product.definition
-        self.force_range_update(dc)
+        self.force_range_update(dc, snapshot=kwargs.get("range_snapshot"))
         self.band_idx.make_ready(dc)
         self.resource_limits.make_ready(dc)
         self.all_flag_band_names = set()
@@ -592,6 +599,23 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
             self.fuse_func = FunctionWrapper(self, cfg["fuse_func"])
         else:
             self.fuse_func = None
+        self.parse_png_encoding(cfg.get("png_encoding", {}))
+
+    # pylint: disable=attribute-defined-outside-init
+    def parse_png_encoding(self, cfg):
+        try:
+            self.png_compress_level = cfg.get("compress_level")
+            if self.png_compress_level is not None:
+                self.png_compress_level = int(self.png_compress_level)
+        except ValueError:
+            raise ConfigException(f"compress_level in png_encoding section for layer {self.name} must be an integer")
+        if self.png_compress_level is not None and not 0 <= self.png_compress_level <= 9:
+            raise ConfigException(f"compress_level in png_encoding section for layer {self.name} must be between 0 and 9")
+        self.png_strategy = cfg.get("strategy", "default")
+        if self.png_strategy not in PNG_STRATEGIES:
+            raise ConfigException(f"Invalid strategy in png_encoding section for layer {self.name}: {self.png_strategy}"
+                                  f" (must be one of {', '.join(PNG_STRATEGIES.keys())})")
+        self.png_palette = bool(cfg.get("palette", True))
 
     # pylint: disable=attribute-defined-outside-init
     def ready_image_processing(self, dc):
@@ -843,40 +867,45 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
     def parse_pq_names(self, cfg):
         raise NotImplementedError()
 
-    def force_range_update(self, ext_dc=None):
+    def force_range_update(self, ext_dc=None, snapshot=None):
         if ext_dc:
             dc = ext_dc
         else:
             dc = get_cube()
-        self.hide = False
-        self._ranges = None
         try:
             from datacube_ows.product_ranges import get_ranges
-            self._ranges = get_ranges(dc, self)
-            if self._ranges is None:
+            ranges = get_ranges(dc, self, snapshot=snapshot)
+            if ranges is None:
                 raise Exception("Null product range")
-            self.bboxes = self.extract_bboxes()
+            bboxes = self.extract_bboxes(ranges)
             if self.default_time_rule == DEF_TIME_EARLIEST:
-                self.default_time = self._ranges["start_time"]
+                default_time = ranges["start_time"]
             elif isinstance(self.default_time_rule,
-                            datetime.date) and self.default_time_rule in self._ranges["time_set"]:
-                self.default_time = self.default_time_rule
+                            datetime.date) and self.default_time_rule in ranges["time_set"]:
+                default_time = self.default_time_rule
             elif isinstance(self.default_time_rule, datetime.date):
                 _LOG.warning("default_time for named_layer %s is explicit date (%s) that is "
                              " not available for the layer. Using most recent available date instead.",
                                     self.name,
                                     self.default_time_rule.isoformat()
                 )
-                self.default_time = self._ranges["end_time"]
+                default_time = ranges["end_time"]
             else:
-                self.default_time = self._ranges["end_time"]
+                default_time = ranges["end_time"]
 
         # pylint: disable=broad-except
         except Exception as a:
             if not self.global_cfg.called_from_update_ranges:
                 _LOG.warning("get_ranges failed for layer %s: %s", self.name, str(a))
             self.hide = True
+            self._ranges = None
             self.bboxes = {}
+            return
+        # Swap in the new ranges only once fully derived, as requests may be reading them from other threads.
+        self._ranges = ranges
+        self.bboxes = bboxes
+        self.default_time = default_time
+        self.hide = False
 
     def time_range(self, ranges=None):
         if ranges is None:
@@ -893,15 +922,17 @@ class OWSNamedLayer(OWSExtensibleConfigEntry, OWSLayer):
 
     @property
     def ranges(self):
-        if self.dynamic:
+        if self.dynamic and not range_refresher.ensure_running(self.global_cfg):
             self.force_range_update()
         return self._ranges
 
-    def extract_bboxes(self):
-        if self._ranges is None:
+    def extract_bboxes(self, ranges=None):
+        if ranges is None:
+            ranges = self._ranges
+        if ranges is None:
             return {}
         bboxes = {}
-        for crs_id, bbox in self._ranges["bboxes"].items():
+        for crs_id, bbox in ranges["bboxes"].items():
             if crs_id in self.global_cfg.published_CRSs:
                 # Assume we've already handled coordinate swapping for
                 # Vertical-coord first CRSs.   Top is top, left is left.
@@ -1208,9 +1239,21 @@ class OWSConfig(OWSMetadataConfig):
         else:
             self.set_msg_src(None)
         self.native_product_index = {}
+        if "range_snapshot" not in kwargs:
+            kwargs["range_snapshot"] = self.load_range_snapshot(dc)
         self.root_layer_folder.make_ready(dc, *args, **kwargs)
         super().make_ready(dc, *args, **kwargs)
 
+    def load_range_snapshot(self, dc):
+        # Load all range tables up front, rather than querying the database separately for each layer.
+        from datacube_ows.product_ranges import RangeSnapshot
+        try:
+            return RangeSnapshot(dc)
+        except Exception as e:  # pylint: disable=broad-except
+            if not self.called_from_update_ranges:
+                _LOG.warning("Could not load range tables in bulk - falling back to per-layer queries: %s", str(e))
+            return None
+
     def export_metadata(self):
         if self.catalog is None:
             now = datetime.datetime.now()
@@ -1265,6 +1308,15 @@ class OWSConfig(OWSMetadataConfig):
         self.info_url = cfg["info_url"]
         self.contact_info = ContactInfo.parse(cfg.get("contact_info"), self)
         self.attribution = AttributionCfg.parse(cfg.get("attribution"), self)
+        self.parse_dataset_cache(cfg.get("dataset_cache", {}))
+        self.parse_concurrent_reads(cfg.get("concurrent_reads", {}))
+        self.parse_cube_pool(cfg.get("cube_pool", {}))
+        self.parse_response_cache(cfg.get("response_cache", {}))
+        self.parse_capabilities_cache(cfg.get("capabilities_cache"))
+        range_refresher.configure(parse_non_negative_int(cfg, "dynamic_range_refresh_interval", "global"))
+        self.request_timeout = parse_non_negative_int(cfg, "request_timeout", "global")
+        self.prepared_statements = bool(cfg.get("prepared_statements", False))
+        mv_query_cache.configure(prepare=self.prepared_statements)
 
         def make_gml_name(name):
             if name.startswith("EPSG:"):
@@ -1319,6 +1371,80 @@ class OWSConfig(OWSMetadataConfig):
             self.published_CRSs[alias]["gml_name"] = make_gml_name(alias)
             self.published_CRSs[alias]["alias_of"] = target_crs
 
+    def parse_dataset_cache(self, cfg):
+        self.dataset_cache_max_datasets = parse_non_negative_int(cfg, "max_datasets", "dataset_cache")
+        self.dataset_cache_max_mb = parse_non_negative_int(cfg, "max_memory_mb", "dataset_cache")
+        self.dataset_cache_max_age = parse_cache_age(cfg, "max_age", "dataset_cache")
+        self.dataset_cache_refresh_check_interval = parse_non_negative_int(cfg, "refresh_check_interval",
+                                                                           "dataset_cache", default=30)
+        dataset_cache.configure(
+            max_datasets=self.dataset_cache_max_datasets,
+            max_bytes=self.dataset_cache_max_mb * 1024 * 1024,
+            max_age=self.dataset_cache_max_age,
+            refresh_check_interval=self.dataset_cache_refresh_check_interval
+        )
+
+    def parse_response_cache(self, cfg):
+        if not cfg:
+            self.response_cache_backend = None
+            self.wmts_metatile_size = 1
+            response_cache.configure(None)
+            return
+        backend = cfg.get("backend")
+        if backend not in ResponseCache.BACKENDS:
+            raise ConfigException(f"Invalid backend in response_cache section: {backend} "
+                                  f"(must be one of {', '.join(ResponseCache.BACKENDS.keys())})")
+        self.response_cache_backend = backend
+        max_age = parse_cache_age(cfg, "max_age", "response_cache")
+        range_check_interval = parse_non_negative_int(cfg, "range_check_interval", "response_cache", default=30)
+        self.wmts_metatile_size = parse_non_negative_int(cfg, "wmts_metatile_size", "response_cache", default=1)
+        if self.wmts_metatile_size < 1:
+            raise ConfigException("wmts_metatile_size in response_cache section must be a positive integer")
+        if backend == "memory":
+            max_entries = parse_non_negative_int(cfg, "max_entries", "response_cache", default=10000)
+            max_mb = parse_non_negative_int(cfg, "max_memory_mb", "response_cache", default=256)
+            cache_backend = MemoryCacheBackend(max_entries=max_entries, max_bytes=max_mb * 1024 * 1024, max_age=max_age)
+        elif backend == "disk":
+            if "directory" not in cfg:
+                raise ConfigException("The disk response cache backend requires a directory")
+            cache_backend = DiskCacheBackend(cfg["directory"], max_age=max_age)
+        else:
+            if "url" not in cfg:
+                raise ConfigException("The redis response cache backend requires a url")
+            cache_backend = RedisCacheBackend(cfg["url"], key_prefix=cfg.get("key_prefix", "ows:"), max_age=max_age)
+        response_cache.configure(cache_backend, range_check_interval=range_check_interval)
+
+    def parse_capabilities_cache(self, cfg):
+        if cfg is None:
+            capabilities_cache.configure(False)
+            return
+        range_check_interval = parse_non_negative_int(cfg, "range_check_interval", "capabilities_cache", default=30)
+        max_entries = parse_non_negative_int(cfg, "max_entries", "capabilities_cache", default=100)
+        capabilities_cache.configure(True, range_check_interval=range_check_interval, max_entries=max_entries)
+
+    def parse_concurrent_reads(self, cfg):
+        self.concurrent_read_threads = parse_non_negative_int(cfg, "threads", "concurrent_reads")
+        self.concurrent_reads_in_flight = parse_non_negative_int(cfg, "max_in_flight", "concurrent_reads",
+                                                                 default=self.concurrent_read_threads)
+        self.concurrent_query_threads = parse_non_negative_int(cfg, "query_threads", "concurrent_reads")
+
+    def parse_cube_pool(self, cfg):
+        self.cube_pool_max_size = parse_non_negative_int(cfg, "max_size", "cube_pool")
+        self.cube_pool_min_size = parse_non_negative_int(cfg, "min_size", "cube_pool")
+        try:
+            self.cube_pool_checkout_timeout = float(cfg.get("checkout_timeout", 30))
+        except (TypeError, ValueError):
+            raise ConfigException("checkout_timeout in cube_pool section must be a number")
+        if self.cube_pool_checkout_timeout <= 0:
+            raise ConfigException("checkout_timeout in cube_pool section must be positive")
+        if self.cube_pool_min_size > self.cube_pool_max_size:
+            raise ConfigException("min_size in cube_pool section cannot be greater than max_size")
+        self.cube_pool_check_on_borrow = bool(cfg.get("check_on_borrow", True))
+        CubePool.configure(min_size=self.cube_pool_min_size,
+                           max_size=self.cube_pool_max_size,
+                           checkout_timeout=self.cube_pool_checkout_timeout,
+                           check_on_borrow=self.cube_pool_check_on_borrow)
+
     def parse_wms(self, cfg):
         if not self.wms and not self.wmts:
             cfg = {}
@@ -6,16 +6,28 @@
 
 #pylint: skip-file
 
+import logging
 import math
-from datetime import datetime, timezone
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 
 import datacube
 from psycopg2.extras import Json
 from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
 
 from datacube_ows.ows_configuration import get_config
+from datacube_ows.time_index import TimeIndex
 from datacube_ows.utils import get_sqlconn
 
+_LOG = logging.getLogger(__name__)
+
+# Datasets are not visible to the range update until their insert commits, which may be after the update has
+# read a dataset with a later "added" time.  Incremental updates re-read datasets added within this period before
+# the high-water mark, so that such datasets are not missed.  (Re-merging a dataset's dates and extent is harmless.)
+RANGE_MARK_LOOK_BACK = timedelta(hours=1)
+
 
 def get_crsids(cfg=None):
     if not cfg:
@@ -132,7 +144,8 @@ def create_multiprod_range_entry(dc, product, crses):
     cfg = get_config()
     conn.execute(text("""
         UPDATE wms.multiproduct_ranges
-        SET bboxes = :bbox
+        SET bboxes = :bbox,
+            last_updated = now()
         WHERE wms_product_name=:pname
         """),
                  {
@@ -146,12 +159,16 @@ def create_multiprod_range_entry(dc, product, crses):
     return
 
 
-def create_range_entry(dc, product, crses, time_resolution):
+def create_range_entry(dc, product, crses, time_resolution, incremental=False):
+  if incremental and update_range_entry(dc, product, crses, time_resolution):
+      return
   print("Updating range for ODC product %s..." % product.name)
   # NB. product is an ODC product
   conn = get_sqlconn(dc)
   txn = conn.begin()
   prodid = product.id
+  if incremental:
+      checked = conn.execute(text("SELECT now()")).scalar()
 
   # insert empty row if one does not already exist
   conn.execute(text("""
@@ -184,45 +201,8 @@ def create_range_entry(dc, product, crses, time_resolution):
   # Set default timezone
   conn.execute(text("""set timezone to 'Etc/UTC'"""))
 
-  # Loop over dates
-  dates = set()
-  if time_resolution.is_solar():
-      results = conn.execute(text(
-          """
-          select
-                lower(temporal_extent), upper(temporal_extent),
-                ST_X(ST_Centroid(spatial_extent))
-          from public.space_time_view
-          WHERE dataset_type_ref = :p_id
-          """),
-          {"p_id": prodid})
-      for result in results:
-          dt1, dt2, lon = result
-          dt = dt1 + (dt2 - dt1) / 2
-          dt = dt.astimezone(timezone.utc)
-
-          solar_day = datacube.api.query._convert_to_solar_time(dt, lon).date()
-          dates.add(solar_day)
-  else:
-      results = conn.execute(text(
-          """
-          select
-                array_agg(temporal_extent)
-          from public.space_time_view
-          WHERE dataset_type_ref = :p_id
-          """),
-          {"p_id": prodid}
-      )
-      for result in results:
-          for dat_ran in result[0]:
-              dates.add(dat_ran.lower)
-
-  if time_resolution.is_subday():
-      date_formatter = lambda d: d.isoformat()
-  else:
-      date_formatter = lambda d: d.strftime("%Y-%m-%d")
-
-  dates = sorted(dates)
+  dates = sorted(product_dates(conn, prodid, time_resolution))
+  date_formatter = get_date_formatter(time_resolution)
   conn.execute(text("""
        UPDATE wms.product_ranges
        SET dates = :dates
@@ -256,16 +236,208 @@ def create_range_entry(dc, product, crses, time_resolution):
 
   conn.execute(text("""
     UPDATE wms.product_ranges
-    SET bboxes = :bbox
+    SET bboxes = :bbox,
+        last_updated = now()
     WHERE id=:p_id
     """), {
     "bbox": Json(all_bboxes),
     "p_id": product.id})
 
+  if incremental:
+      record_range_mark(conn, prodid, checked)
+
   txn.commit()
   conn.close()
 
 
+def get_date_formatter(time_resolution):
+    if time_resolution.is_subday():
+        return lambda d: d.isoformat()
+    else:
+        return lambda d: d.strftime("%Y-%m-%d")
+
+
+def product_dates(conn, prodid, time_resolution, added_since=None):
+    """
+    Return the set of dates (or datetimes, for subday products) of a product's datasets in the space-time view.
+
+    :param conn: Database connection (with the timezone set to UTC)
+    :param prodid: ODC product id
+    :param time_resolution: The time resolution of the OWS layer(s) for the product
+    :param added_since: If supplied, only datasets added to the index after this time are considered.
+    """
+    params = {"p_id": prodid}
+    if added_since is None:
+        where = "WHERE stv.dataset_type_ref = :p_id"
+    else:
+        where = """JOIN agdc.dataset ds ON ds.id = stv.id
+            WHERE stv.dataset_type_ref = :p_id
+            AND ds.added > :since"""
+        params["since"] = added_since
+    dates = set()
+    if time_resolution.is_solar():
+        results = conn.execute(text(
+            f"""
+            select
+                  lower(stv.temporal_extent), upper(stv.temporal_extent),
+                  ST_X(ST_Centroid(stv.spatial_extent))
+            from public.space_time_view stv
+            {where}
+            """),
+            params)
+        for result in results:
+            dt1, dt2, lon = result
+            dt = dt1 + (dt2 - dt1) / 2
+            dt = dt.astimezone(timezone.utc)
+
+            solar_day = datacube.api.query._convert_to_solar_time(dt, lon).date()
+            dates.add(solar_day)
+    else:
+        results = conn.execute(text(
+            f"""
+            select
+                  array_agg(stv.temporal_extent)
+            from public.space_time_view stv
+            {where}
+            """),
+            params
+        )
+        for result in results:
+            for dat_ran in result[0] or []:
+                dates.add(dat_ran.lower)
+    return dates
+
+
+def record_range_mark(conn, prodid, checked):
+    """
+    Record the high-water mark for incremental range updates of a product.
+
+    :param conn: Database connection, in the transaction that updated the product's ranges
+    :param prodid: ODC product id
+    :param checked: Database time at the start of the range update (archivals after this time are not yet reflected)
+    """
+    conn.execute(text("""
+        INSERT INTO wms.product_range_marks (product_id, last_added, last_checked)
+        SELECT :p_id, max(ds.added), :checked
+        FROM public.space_time_view stv
+        JOIN agdc.dataset ds ON ds.id = stv.id
+        WHERE stv.dataset_type_ref = :p_id
+        ON CONFLICT (product_id) DO UPDATE
+        SET last_added = greatest(wms.product_range_marks.last_added, excluded.last_added),
+            last_checked = excluded.last_checked
+        """),
+                 {"p_id": prodid, "checked": checked})
+
+
+def update_range_entry(dc, product, crses, time_resolution):
+    """
+    Incrementally update the ranges for an ODC product.
+
+    Only datasets added to the index since the high-water mark recorded by the last update (less
+    RANGE_MARK_LOOK_BACK) are read from the space-time view, and their dates and extents are merged into the
+    stored ranges.
+
+    Archiving a dataset may shrink a product's ranges, which cannot be done incrementally, so if any datasets
+    have been archived since the last update (or there is no recorded high-water mark), no update is made.
+
+    :return: True if the ranges were updated incrementally, False if a full update is required.
+    """
+    conn = get_sqlconn(dc)
+    txn = conn.begin()
+    prodid = product.id
+    try:
+        conn.execute(text("""set timezone to 'Etc/UTC'"""))
+        mark = conn.execute(text("""
+            SELECT m.last_added, m.last_checked, now() as checked,
+                   pr.lat_min, pr.lat_max, pr.lon_min, pr.lon_max, pr.dates
+            FROM wms.product_range_marks m
+            JOIN wms.product_ranges pr ON pr.id = m.product_id
+            WHERE m.product_id = :p_id
+            """),
+                            {"p_id": prodid}).first()
+        if mark is None or mark["last_added"] is None:
+            print("No previous incremental update for ODC product %s - full update required" % product.name)
+            txn.rollback()
+            return False
+        archived = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT 1 FROM agdc.dataset
+                WHERE dataset_type_ref = :p_id
+                AND archived >= :checked
+            )
+            """),
+                                {"p_id": prodid, "checked": mark["last_checked"]}).scalar()
+        if archived:
+            print("Datasets archived from ODC product %s since last update - full update required" % product.name)
+            txn.rollback()
+            return False
+
+        since = mark["last_added"] - RANGE_MARK_LOOK_BACK
+        print("Incrementally updating range for ODC product %s (datasets added since %s)..." % (
+            product.name, since.isoformat()))
+        new = conn.execute(text("""
+            SELECT st_ymin(subq.bbox), st_ymax(subq.bbox), st_xmin(subq.bbox), st_xmax(subq.bbox), subq.n
+            FROM (
+              SELECT st_extent(stv.spatial_extent) as bbox, count(*) as n
+              FROM public.space_time_view stv
+              JOIN agdc.dataset ds ON ds.id = stv.id
+              WHERE stv.dataset_type_ref = :p_id
+              AND ds.added > :since
+            ) as subq
+            """),
+                           {"p_id": prodid, "since": since}).first()
+        if not new[4]:
+            print("No new datasets for ODC product %s" % product.name)
+            record_range_mark(conn, prodid, mark["checked"])
+            txn.commit()
+            return True
+
+        lat_min = min(float(mark["lat_min"]), new[0])
+        lat_max = max(float(mark["lat_max"]), new[1])
+        lon_min = min(float(mark["lon_min"]), new[2])
+        lon_max = max(float(mark["lon_max"]), new[3])
+
+        date_formatter = get_date_formatter(time_resolution)
+        dates = set(mark["dates"] or [])
+        dates.update(map(date_formatter, product_dates(conn, prodid, time_resolution, since)))
+        if time_resolution.is_subday():
+            dates = sorted(dates, key=datetime.fromisoformat)
+        else:
+            dates = sorted(dates)
+
+        epsg4326 = datacube.utils.geometry.CRS("EPSG:4326")
+        box = datacube.utils.geometry.box(lon_min, lat_min, lon_max, lat_max, epsg4326)
+        conn.execute(text("""
+            UPDATE wms.product_ranges
+            SET lat_min = :lat_min,
+                lat_max = :lat_max,
+                lon_min = :lon_min,
+                lon_max = :lon_max,
+                dates = :dates,
+                bboxes = :bbox,
+                last_updated = now()
+            WHERE id = :p_id
+            """),
+                     {
+                         "lat_min": lat_min,
+                         "lat_max": lat_max,
+                         "lon_min": lon_min,
+                         "lon_max": lon_max,
+                         "dates": Json(dates),
+                         "bbox": Json(bbox_projections(box, crses)),
+                         "p_id": prodid,
+                     })
+        record_range_mark(conn, prodid, mark["checked"])
+        txn.commit()
+        print("Merged %d recently added datasets" % new[4])
+        return True
+    except Exception:
+        txn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
 def bbox_projections(starting_box, crses):
    result = {}
    for crsid, crs in crses.items():
@@ -311,7 +483,7 @@ def datasets_exist(dc, product_name):
   return list(results)[0][0] > 0
 
 
-def add_ranges(dc, product_names, merge_only=False):
+def add_ranges(dc, product_names, merge_only=False, incremental=False, jobs=1):
     odc_products = {}
     ows_multiproducts = []
     errors = False
@@ -346,44 +518,157 @@ def add_ranges(dc, product_names, merge_only=False):
                 errors = True
                 continue
 
+    timings = {}
+
+    def timed(label, func, *args):
+        start = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            timings[label] = time.monotonic() - start
+
+    start = time.monotonic()
     if ows_multiproducts and merge_only:
         print("Merge-only: Skipping range update of products:", repr(list(odc_products.keys())))
-    else:
-        for pname, ows_prods in odc_products.items():
-            dc_product = dc.index.products.get_by_name(pname)
-            if dc_product is None:
-                print("Could not find ODC product:", pname)
+        odc_products = {}
+    # Products are updated concurrently, each on its own connection from the index's connection pool.
+    # Each multiproduct layer is merged once all of its underlying products have been updated.
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="ows_update_ranges") as executor:
+        product_futures = {
+            executor.submit(timed, f"ODC product {pname}", update_odc_product,
+                            dc, pname, ows_prods, incremental): pname
+            for pname, ows_prods in odc_products.items()
+        }
+        updated = set()
+        waiting = list(ows_multiproducts)
+        merge_futures = []
+
+        def submit_ready_merges():
+            for mp in list(waiting):
+                if all(p in updated or p not in odc_products for p in mp.product_names):
+                    waiting.remove(mp)
+                    merge_futures.append(executor.submit(timed, f"Multiproduct layer {mp.name}",
+                                                         create_multiprod_range_entry, dc, mp, get_crses()))
+
+        submit_ready_merges()
+        for future in as_completed(product_futures):
+            if future.result():
                 errors = True
-            elif datasets_exist(dc, dc_product.name):
-                print("Datasets exist for ODC product",
-                      dc_product.name,
-                      "(OWS layers",
-                      ",".join(p.name for p in ows_prods["ows"]),
-                      ")")
-                time_resolution = None
-                for ows_prod in ows_prods["ows"]:
-                    if ows_prod:
-                        new_tr = ows_prod.time_resolution
-                        if time_resolution is not None and new_tr != time_resolution:
-                            time_resolution = None
-                            errors = True
-                            print("Inconsistent time resolution for ODC product:", pname)
-                            break
-                        time_resolution = new_tr
-                if time_resolution is not None:
-                    create_range_entry(dc, dc_product, get_crses(), time_resolution)
-                else:
-                    print("Could not determine time_resolution for product: ", pname)
-            else:
-                print("Could not find any datasets for: ", pname)
-    for mp in ows_multiproducts:
-        create_multiprod_range_entry(dc, mp, get_crses())
+            updated.add(product_futures[future])
+            submit_ready_merges()
+        for future in merge_futures:
+            future.result()
 
+    print_timings(timings, time.monotonic() - start, jobs)
     print("Done.")
     return errors
 
-def get_ranges(dc, product, path=None, is_dc_product=False):
-    cfg = product.global_cfg
+
+def update_odc_product(dc, pname, ows_prods, incremental=False):
+    """
+    Update the ranges for an ODC product.
+
+    :return: True if there were errors
+    """
+    errors = False
+    dc_product = dc.index.products.get_by_name(pname)
+    if dc_product is None:
+        print("Could not find ODC product:", pname)
+        errors = True
+    elif datasets_exist(dc, dc_product.name):
+        print("Datasets exist for ODC product",
+              dc_product.name,
+              "(OWS layers",
+              ",".join(p.name for p in ows_prods["ows"]),
+              ")")
+        time_resolution = None
+        for ows_prod in ows_prods["ows"]:
+            if ows_prod:
+                new_tr = ows_prod.time_resolution
+                if time_resolution is not None and new_tr != time_resolution:
+                    time_resolution = None
+                    errors = True
+                    print("Inconsistent time resolution for ODC product:", pname)
+                    break
+                time_resolution = new_tr
+        if time_resolution is not None:
+            create_range_entry(dc, dc_product, get_crses(), time_resolution, incremental)
+        else:
+            print("Could not determine time_resolution for product: ", pname)
+    else:
+        print("Could not find any datasets for: ", pname)
+    return errors
+
+
+def print_timings(timings, elapsed, jobs):
+    if not timings:
+        return
+    print("Range update timings (slowest first):")
+    for label, seconds in sorted(timings.items(), key=lambda t: t[1], reverse=True):
+        print(f"  {label}: {seconds:.2f}s")
+    print(f"Total: {elapsed:.2f}s for {len(timings)} updates ({jobs} job{'s' if jobs > 1 else ''})")
+
+
+class RangeSnapshot:
+    """
+    A snapshot of all OWS range tables, loaded with one query per table.
+
+    Used to populate the ranges of all layers at startup without a database round-trip per layer.
+    Rows are parsed on first use, and the parsed ranges are shared by all layers that use them.
+    """
+    def __init__(self, dc):
+        start = time.monotonic()
+        conn = get_sqlconn(dc)
+        try:
+            self.product_rows = {
+                row["id"]: row
+                for row in conn.execute(text("SELECT * FROM wms.product_ranges"))
+            }
+            self.multiproduct_rows = {
+                row["wms_product_name"]: row
+                for row in conn.execute(text("SELECT * FROM wms.multiproduct_ranges"))
+            }
+            self.sub_product_rows = {
+                (row["product_id"], row["sub_product_id"]): row
+                for row in conn.execute(text("SELECT * FROM wms.sub_product_ranges"))
+            }
+        finally:
+            conn.close()
+        self._parsed = {}
+        _LOG.info("Loaded %d product, %d multiproduct and %d sub-product ranges in %.3fs",
+                  len(self.product_rows), len(self.multiproduct_rows), len(self.sub_product_rows),
+                  time.monotonic() - start)
+
+    def get_ranges(self, product, path=None, is_dc_product=False):
+        """
+        Return the ranges for a layer (or ODC product) from the snapshot.
+
+        Arguments as for get_ranges.
+        """
+        if not is_dc_product and product.multi_product:
+            if path is not None:
+                raise Exception("Combining subproducts and multiproducts is not yet supported")
+            key = ("multiproduct", product.name)
+            row = self.multiproduct_rows.get(product.name)
+        else:
+            prod_id = product.id if is_dc_product else product.product.id
+            if path is not None:
+                key = ("sub_product", prod_id, path)
+                row = self.sub_product_rows.get((prod_id, path))
+            else:
+                key = ("product", prod_id)
+                row = self.product_rows.get(prod_id)
+        if row is None:
+            return None
+        key = key + (product.time_resolution.is_subday(),)
+        if key not in self._parsed:
+            self._parsed[key] = parse_ranges(product, row)
+        return self._parsed[key]
+
+
+def get_ranges(dc, product, path=None, is_dc_product=False, snapshot=None):
+    if snapshot is not None:
+        return snapshot.get_ranges(product, path, is_dc_product)
     conn = get_sqlconn(dc)
     if not is_dc_product and product.multi_product:
         if path is not None:
@@ -418,26 +703,84 @@ def get_ranges(dc, product, path=None, is_dc_product=False):
                                   )
     for result in results:
         conn.close()
-        if product.time_resolution.is_subday():
-            dt_parser = lambda dts: datetime.fromisoformat(dts)
-        else:
-            dt_parser = lambda dts: datetime.strptime(dts, "%Y-%m-%d").date()
-        times = [dt_parser(d) for d in result["dates"] if d is not None]
-        if not times:
-            return None
-        return {
-            "lat": {
-                "min": float(result["lat_min"]),
-                "max": float(result["lat_max"]),
-            },
-            "lon": {
-                "min": float(result["lon_min"]),
-                "max": float(result["lon_max"]),
-            },
-            "times": times,
-            "start_time": times[0],
-            "end_time": times[-1],
-            "time_set": set(times),
-            "bboxes": cfg.alias_bboxes(result["bboxes"])
-        }
+        return parse_ranges(product, result)
     return None
+
+
+def parse_ranges(product, result):
+    cfg = product.global_cfg
+    times = TimeIndex.from_strings(result["dates"], product.time_resolution.is_subday())
+    if not times:
+        return None
+    return {
+        "lat": {
+            "min": float(result["lat_min"]),
+            "max": float(result["lat_max"]),
+        },
+        "lon": {
+            "min": float(result["lon_min"]),
+            "max": float(result["lon_max"]),
+        },
+        "times": times,
+        "start_time": times[0],
+        "end_time": times[-1],
+        # Retained for backwards compatibility - the time index supports membership tests directly.
+        "time_set": times,
+        "bboxes": cfg.alias_bboxes(result["bboxes"]),
+        "last_updated": result["last_updated"] if "last_updated" in result.keys() else None,
+    }
+
+
+def get_range_timestamp(dc, product):
+    """
+    Return the time the ranges for an OWS layer were last updated by datacube-ows-update.
+
+    Returns None if the layer has no ranges, or if the schema predates range timestamps.
+    """
+    conn = get_sqlconn(dc)
+    try:
+        if product.multi_product:
+            results = conn.execute(text("""
+                SELECT last_updated
+                FROM wms.multiproduct_ranges
+                WHERE wms_product_name=:pname"""),
+                                   {"pname": product.name}
+                                  )
+        else:
+            results = conn.execute(text("""
+                SELECT last_updated
+                FROM wms.product_ranges
+                WHERE id=:pid"""),
+                                   {"pid": product.product.id}
+                                  )
+        for result in results:
+            return result[0]
+        return None
+    except ProgrammingError:
+        _LOG.warning("Range timestamps not available - rerun datacube-ows-update --schema")
+        return None
+    finally:
+        conn.close()
+
+
+def get_ranges_timestamp(dc):
+    """
+    Return the time the ranges for any OWS layer were last updated by datacube-ows-update.
+
+    Returns None if there are no ranges, or if the schema predates range timestamps.
+    """
+    conn = get_sqlconn(dc)
+    try:
+        results = conn.execute(text("""
+            SELECT greatest(
+                (SELECT max(last_updated) FROM wms.product_ranges),
+                (SELECT max(last_updated) FROM wms.multiproduct_ranges)
+            )"""))
+        for result in results:
+            return result[0]
+        return None
+    except ProgrammingError:
+        _LOG.warning("Range timestamps not available - rerun datacube-ows-update --schema")
+        return None
+    finally:
+        conn.close()
@@ -7,6 +7,12 @@ from time import time
 
 
 class QueryProfiler:
+    """
+    Records event timings and other statistics for a request.
+
+    Event timings are always recorded (they are used by the adaptive resource limits cost model),
+    but the profile is only reported if the profiler is active (i.e. the ows_stats parameter was set).
+    """
     def __init__(self, active):
         self.active = active
         self._events = {}
@@ -15,8 +21,7 @@ class QueryProfiler:
             self.start_event("query")
 
     def start_event(self, name):
-        if self.active:
-            self._events[name] = [time(), None]
+        self._events[name] = [time(), None]
 
     def __setitem__(self, name, val):
         self._stats[name] = val
@@ -25,11 +30,20 @@ class QueryProfiler:
         return self._stats[name]
 
     def end_event(self, name):
-        if self.active:
-            if name in self._events:
-                self._events[name][1] = time()
-            else:
-                self._events[name] = [None, time()]
+        if name in self._events:
+            self._events[name][1] = time()
+        else:
+            self._events[name] = [None, time()]
+
+    def duration(self, name):
+        """
+        :param name: An event name
+        :return: The duration of the event in seconds, or None if the event was not both started and ended.
+        """
+        rng = self._events.get(name)
+        if rng is None or not rng[0] or not rng[1]:
+            return None
+        return rng[1] - rng[0]
 
     def profile(self):
         result = {}
@@ -0,0 +1,126 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import logging
+import os
+from threading import Event, Lock, Thread
+from time import monotonic, time
+from typing import Any, Mapping, MutableMapping, Optional
+
+from datacube_ows.cube_pool import cube
+
+_LOG = logging.getLogger(__name__)
+
+
+class RangeRefresher:
+    """
+    Background thread that periodically reloads the ranges of dynamic layers.
+
+    When enabled, request handlers read the most recently loaded ranges for dynamic layers,
+    instead of re-reading them from the database on every access.
+
+    The refresher thread is started on first use in each worker process, so it survives
+    servers (e.g. gunicorn with preload_app) that fork workers after the config is loaded.
+
+    The refresher is disabled unless configured.
+    """
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._pid: Optional[int] = None
+        self._stop = Event()
+        # Optional prometheus gauges, keyed by "duration" and "timestamp".
+        self.metrics: MutableMapping[str, Any] = {}
+        self.configure(0)
+
+    def configure(self, interval: int) -> None:
+        """
+        (Re)configure the refresher.  Any running refresher thread is stopped.
+
+        :param interval: Refresh interval, in seconds.  Zero disables the refresher.
+        """
+        self.stop()
+        self.interval = interval
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh: Optional[float] = None
+        self.last_duration: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def ensure_running(self, cfg: "datacube_ows.ows_configuration.OWSConfig") -> bool:
+        """
+        Start the refresher thread for this process, if enabled and not already running.
+
+        :param cfg: The OWS configuration
+        :return: True if the refresher is enabled (and so dynamic ranges should not be reloaded by the caller).
+        """
+        if not self.enabled:
+            return False
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return True
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._stop = Event()
+                self._thread = Thread(target=self._run, args=(cfg, self._stop),
+                                      name="ows_range_refresher", daemon=True)
+                self._pid = os.getpid()
+                if self.last_refresh is None:
+                    # Ranges were loaded when the config was made ready.
+                    self.last_refresh = time()
+                self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+        self._pid = None
+
+    def _run(self, cfg: "datacube_ows.ows_configuration.OWSConfig", stop: Event) -> None:
+        while not stop.wait(self.interval):
+            self.refresh(cfg)
+
+    def refresh(self, cfg: "datacube_ows.ows_configuration.OWSConfig") -> None:
+        """
+        Reload the ranges of all dynamic layers from the database.
+
+        :param cfg: The OWS configuration
+        """
+        from datacube_ows.product_ranges import RangeSnapshot
+        start = monotonic()
+        try:
+            with cube() as dc:
+                if not dc:
+                    raise Exception("Database connectivity failure")
+                snapshot = RangeSnapshot(dc)
+                for layer in cfg.product_index.values():
+                    if layer.dynamic and layer.ready:
+                        layer.force_range_update(dc, snapshot=snapshot)
+        except Exception as e:  # pylint: disable=broad-except
+            _LOG.warning("Dynamic range refresh failed: %s", str(e))
+            self.failures += 1
+            return
+        self.last_duration = monotonic() - start
+        self.last_refresh = time()
+        self.refreshes += 1
+        if self.metrics:
+            self.metrics["duration"].set(self.last_duration)
+            self.metrics["timestamp"].set(self.last_refresh)
+
+    def stats(self) -> Mapping[str, Any]:
+        """
+        :return: A dictionary of refresh statistics for this process.
+        """
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_duration": self.last_duration,
+            "staleness": time() - self.last_refresh if self.last_refresh else None,
+        }
+
+
+range_refresher = RangeRefresher()
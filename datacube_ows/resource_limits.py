@@ -11,6 +11,7 @@ import numpy as np
 from datacube.utils.geometry import CRS, GeoBox, polygon
 
 from datacube_ows.config_utils import CFG_DICT, RAW_CFG, OWSConfigEntry
+from datacube_ows.cost_model import LayerCostModel
 from datacube_ows.ogc_utils import (ConfigException, cache_control_headers,
                                     create_geobox)
 
@@ -118,6 +119,13 @@ class RequestScale:
     def load_factor(self) -> float:
         return self / self.standard_scale
 
+    @property
+    def data_bytes(self) -> int:
+        """
+        The approximate number of bytes of data loaded by the request (for all dates and bands).
+        """
+        return self.n_dates * self.pixel_size[0] * self.pixel_size[1] * self.total_band_size
+
     @property
     def zoom_lvl_offset(self) -> float:
         return math.log(self.load_factor, 4)
@@ -229,6 +237,17 @@ class OWSResourceManagementRules(OWSConfigEntry):
         self.min_zoom = cast(Optional[float], wms_cfg.get("min_zoom_factor"))
         self.min_zoom_lvl = cast(Optional[Union[int, float]], wms_cfg.get("min_zoom_level"))
         self.max_datasets_wms = cast(int, wms_cfg.get("max_datasets", 0))
+        self.target_latency = cast(Optional[Union[int, float]], wms_cfg.get("target_latency"))
+        self.cost_model: Optional[LayerCostModel] = None
+        self.low_res_cost_model: Optional[LayerCostModel] = None
+        if self.target_latency is not None:
+            if not isinstance(self.target_latency, (int, float)) or self.target_latency <= 0:
+                raise ConfigException(f"target_latency must be a positive number in {context}")
+            min_samples = wms_cfg.get("cost_model_min_samples", 20)
+            if not isinstance(min_samples, int) or min_samples < 1:
+                raise ConfigException(f"cost_model_min_samples must be a positive integer in {context}")
+            self.cost_model = LayerCostModel(min_samples)
+            self.low_res_cost_model = LayerCostModel(min_samples)
         self.max_datasets_wcs = cast(int, wcs_cfg.get("max_datasets", 0))
         self.max_image_size_wcs = cast(int, wcs_cfg.get("max_image_size", 0))
         self.wms_cache_rules = CacheControlRules(wms_cfg.get("dataset_cache_rules"), context, self.max_datasets_wms)
@@ -252,16 +271,88 @@ class OWSResourceManagementRules(OWSConfigEntry):
         limits_exceeded: List[str] = []
         if self.max_datasets_wms > 0 and n_datasets > self.max_datasets_wms:
             limits_exceeded.append("too many datasets")
-        if self.min_zoom is not None:
-            if zoom_factor < self.min_zoom:
-                limits_exceeded.append("zoomed out too far")
-        if self.min_zoom_lvl is not None:
-            fuzz_factor = 0.01
-            if request_scale.load_adjusted_zoom_level < self.min_zoom_lvl - fuzz_factor:
-                limits_exceeded.append("too much projected resource requirements")
+        predicted = self.predict_wms_cost(n_datasets, request_scale)
+        if predicted is not None:
+            # Once the layer's cost model is trained, it replaces the static zoom limits.  (Requests it
+            # refuses are occasionally served anyway, so that the model can correct over-predictions.)
+            if (predicted > cast(float, self.target_latency)
+                    and (limits_exceeded or not cast(LayerCostModel, self.cost_model).explore())):
+                limits_exceeded.append(f"predicted cost ({predicted:.2f}s) exceeds target latency")
+        else:
+            if self.min_zoom is not None:
+                if zoom_factor < self.min_zoom:
+                    limits_exceeded.append("zoomed out too far")
+            if self.min_zoom_lvl is not None:
+                fuzz_factor = 0.01
+                if request_scale.load_adjusted_zoom_level < self.min_zoom_lvl - fuzz_factor:
+                    limits_exceeded.append("too much projected resource requirements")
         if limits_exceeded:
             raise ResourceLimited(limits_exceeded)
 
+    def wms_passes_without_count(self, zoom_factor: float, request_scale: RequestScale) -> bool:
+        """
+        Check whether a WMS request passes check_wms, whatever its number of datasets.
+
+        :param zoom_factor: The zoom factor of the query
+        :param request_scale: Model of the resource-intensiveness of the query
+        :return: False if the dataset count could cause the request to be refused (or if it is refused anyway),
+                otherwise True.
+        """
+        if self.max_datasets_wms > 0:
+            return False
+        if self.cost_model is not None and self.cost_model.trained:
+            return False
+        try:
+            self.check_wms(0, zoom_factor, request_scale)
+        except ResourceLimited:
+            return False
+        return True
+
+    def predict_wms_cost(self, n_datasets: int, request_scale: RequestScale, low_res: bool = False) -> Optional[float]:
+        """
+        Predict the cost of a WMS request from the layer's cost model.
+
+        :param n_datasets: The number of datasets for the query
+        :param request_scale: Model of the resource-intensiveness of the query
+        :param low_res: True to predict the cost of rendering from the low-resolution summary product(s).
+        :return: The predicted cost in seconds, or None if there is no target latency or the cost model
+                is not yet trained.
+        """
+        model = self.low_res_cost_model if low_res else self.cost_model
+        if model is None:
+            return None
+        return model.predict(n_datasets, request_scale.data_bytes)
+
+    def low_res_within_target(self, n_datasets: int, request_scale: RequestScale) -> bool:
+        """
+        Check whether a resource limited WMS request can be rendered from the low-resolution summary product(s)
+        within the target latency.
+
+        :param n_datasets: The number of summary product datasets for the query
+        :param request_scale: Model of the resource-intensiveness of the query
+        :return: False if the predicted cost exceeds the target latency, otherwise True.
+        """
+        predicted = self.predict_wms_cost(n_datasets, request_scale, low_res=True)
+        return (predicted is None or predicted <= cast(float, self.target_latency)
+                or cast(LayerCostModel, self.low_res_cost_model).explore())
+
+    def record_wms_cost(self, n_datasets: int, request_scale: RequestScale, seconds: float,
+                        low_res: bool = False) -> None:
+        """
+        Record the measured cost of a rendered WMS request in the layer's cost model.
+
+        The data volume is taken from the same request scale estimate used for predictions (see predict_wms_cost),
+        not the size of the loaded data, which depends on masking and dtype conversions.
+
+        :param n_datasets: The number of datasets read
+        :param request_scale: Model of the resource-intensiveness of the query
+        :param seconds: The time taken to read and render the data
+        :param low_res: True if the request was rendered from the low-resolution summary product(s).
+        """
+        model = self.low_res_cost_model if low_res else self.cost_model
+        if model is not None:
+            model.record(n_datasets, request_scale.data_bytes, seconds)
+
     def check_wcs(self, n_datasets: int,
                   height: int, width: int,
                   pixel_size: int,
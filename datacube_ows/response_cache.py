@@ -0,0 +1,335 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, time
+from typing import (Any, Callable, Iterable, Mapping, MutableMapping, Optional,
+                    Tuple)
+
+from datacube_ows.ogc_utils import ConfigException
+
+_LOG = logging.getLogger(__name__)
+
+
+class ResponseCacheBackend:
+    """
+    Abstract base class for response cache storage backends.
+
+    Backends store opaque byte strings against string keys.
+    """
+    def __init__(self, max_age: int = 0) -> None:
+        """
+        :param max_age: Maximum age of a cache entry, in seconds.  Zero means entries do not expire.
+        """
+        self.max_age = max_age
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError()
+
+    def put(self, key: str, value: bytes) -> None:
+        raise NotImplementedError()
+
+    def clear(self) -> None:
+        raise NotImplementedError()
+
+
+class MemoryCacheBackend(ResponseCacheBackend):
+    """
+    A bounded, thread-safe, per-process LRU response cache.
+    """
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 0, max_age: int = 0) -> None:
+        """
+        :param max_entries: Maximum number of entries.
+        :param max_bytes: Maximum total size of entries, in bytes.  Zero means no limit.
+        :param max_age: Maximum age of a cache entry, in seconds.  Zero means entries do not expire.
+        """
+        super().__init__(max_age)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.max_age and monotonic() - entry[1] > self.max_age:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, monotonic())
+            self.bytes += len(value)
+            while self._entries and (
+                    len(self._entries) > self.max_entries
+                    or (self.max_bytes and self.bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self.bytes -= len(value)
+
+
+class DiskCacheBackend(ResponseCacheBackend):
+    """
+    A response cache in a local directory, which may be shared by all worker processes on a host.
+
+    Entries are written atomically, so concurrent readers never see partially written files.
+    """
+    def __init__(self, directory: str, max_age: int = 0) -> None:
+        """
+        :param directory: The cache directory.  Created if it does not exist.
+        :param max_age: Maximum age of a cache entry, in seconds.  Zero means entries do not expire.
+        """
+        super().__init__(max_age)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if self.max_age and time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _LOG.warning("Could not write response cache entry %s: %s", path, str(e))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                try:
+                    os.remove(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+
+
+class RedisCacheBackend(ResponseCacheBackend):
+    """
+    A response cache in a Redis (or Redis-compatible) store, which may be shared by all worker processes
+    on all hosts.
+
+    Requires the redis python package, unless a client object is supplied.
+    """
+    def __init__(self, url: Optional[str] = None, key_prefix: str = "ows:", max_age: int = 0,
+                 client: Any = None) -> None:
+        """
+        :param url: The Redis URL (e.g. redis://localhost:6379/0)
+        :param key_prefix: Prefix for all keys written by this cache
+        :param max_age: Maximum age of a cache entry, in seconds.  Zero means entries do not expire.
+        :param client: Optional client object supporting the get, set, scan_iter and delete methods
+                       of the redis package.  Used instead of connecting to url if supplied.
+        """
+        super().__init__(max_age)
+        self.key_prefix = key_prefix
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ConfigException("The redis response cache backend requires the redis python package")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get(self.key_prefix + key)
+        except Exception as e:  # pylint: disable=broad-except
+            _LOG.warning("Response cache read failed: %s", str(e))
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        try:
+            self.client.set(self.key_prefix + key, value, ex=self.max_age or None)
+        except Exception as e:  # pylint: disable=broad-except
+            _LOG.warning("Response cache write failed: %s", str(e))
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=self.key_prefix + "*"):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """
+    Optional cache of rendered responses (e.g. GetMap/GetTile images), in a pluggable backend.
+
+    Cache keys are derived from normalised request parameters, and include the time the layer's
+    ranges were last updated, so that entries are invalidated by datacube-ows-update.
+
+    The cache is disabled unless configured.
+    """
+    BACKENDS: Mapping[str, Callable[..., ResponseCacheBackend]] = {
+        "memory": MemoryCacheBackend,
+        "disk": DiskCacheBackend,
+        "redis": RedisCacheBackend,
+    }
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._range_stamps: MutableMapping[str, Tuple[Optional[str], float]] = {}
+        self.configure(None)
+
+    def configure(self, backend: Optional[ResponseCacheBackend], range_check_interval: int = 30) -> None:
+        """
+        (Re)configure the cache.
+
+        :param backend: The storage backend.  None disables the cache.
+        :param range_check_interval: Maximum time, in seconds, that a layer's range update timestamp is
+                                     re-used before being re-read from the database.
+        """
+        with self._lock:
+            self.backend = backend
+            self.range_check_interval = range_check_interval
+            self._range_stamps.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def stats(self) -> Mapping[str, int]:
+        """
+        :return: A dictionary of cache hit/miss counters for this process.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def range_stamp(self, layer_name: str, lookup: Callable[[], Optional[Any]]) -> Optional[str]:
+        """
+        Return the time the named layer's ranges were last updated, as an ISO format string.
+
+        Re-uses the previously read value for up to range_check_interval seconds.
+
+        :param layer_name: The layer name
+        :param lookup: Function returning the layer's range update timestamp from the database.
+        """
+        now = monotonic()
+        with self._lock:
+            entry = self._range_stamps.get(layer_name)
+            if entry is not None and now - entry[1] < self.range_check_interval:
+                return entry[0]
+        stamp = lookup()
+        if stamp is not None:
+            stamp = stamp.isoformat()
+        with self._lock:
+            self._range_stamps[layer_name] = (stamp, now)
+        return stamp
+
+    @staticmethod
+    def key(**params: Any) -> str:
+        """
+        Derive a cache key from normalised request parameters.
+
+        :param params: JSON-serialisable normalised request parameters
+        :return: A cache key string
+        """
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, int]]:
+        """
+        :param key: Cache key
+        :return: A (body, n_datasets) tuple, or None on a cache miss.
+        """
+        value = self.backend.get(key) if self.backend else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        n_datasets, = struct.unpack_from("!q", value)
+        return value[8:], n_datasets
+
+    def put(self, key: str, body: bytes, n_datasets: int) -> None:
+        """
+        :param key: Cache key
+        :param body: Response body
+        :param n_datasets: Number of datasets used to render the response (used to set cache control headers)
+        """
+        if self.backend:
+            self.backend.put(key, struct.pack("!q", n_datasets) + body)
+
+    def clear(self) -> None:
+        """
+        Remove all cached responses.
+        """
+        if self.backend:
+            self.backend.clear()
+        with self._lock:
+            self._range_stamps.clear()
+
+
+response_cache = ResponseCache()
+
+
+def get_map_cache_key(layer: "datacube_ows.ows_configuration.OWSNamedLayer",
+                      style: "datacube_ows.styles.StyleDef",
+                      times: Iterable[Any],
+                      geobox: "datacube.utils.geometry.GeoBox",
+                      fmt: str,
+                      range_stamp: Optional[str]) -> str:
+    """
+    Derive the response cache key for a GetMap (or WMTS GetTile) request.
+
+    The requested area is normalised to its geobox, so equivalent requests (e.g. with different
+    WMS versions or axis orders) share a cache entry.
+
+    :param layer: The requested layer
+    :param style: The requested style
+    :param times: The requested times
+    :param geobox: The requested geobox
+    :param fmt: The requested image format
+    :param range_stamp: The time the layer's ranges were last updated.
+    """
+    return ResponseCache.key(
+        layer=layer.name,
+        style=style.name,
+        times=[t.isoformat() for t in times],
+        crs=str(geobox.crs),
+        affine=[round(c, 9) for c in tuple(geobox.affine)[:6]],
+        width=geobox.width,
+        height=geobox.height,
+        format=fmt,
+        ranges=range_stamp,
+    )
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+
+import click
+
+from datacube_ows import __version__
+from datacube_ows.data import seed_map
+from datacube_ows.ows_configuration import get_config
+from datacube_ows.response_cache import MemoryCacheBackend, response_cache
+from datacube_ows.startup_utils import initialise_debugging
+from datacube_ows.wmts import wmts_args_to_wms
+
+RENDERED = "rendered"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+@click.command()
+@click.option("--style", default=None, help="Style to seed.  Defaults to the layer's default style.")
+@click.option("--tile-matrix-set", default="WholeWorld_WebMercator", show_default=True,
+              help="Identifier of the WMTS tile matrix set to seed.")
+@click.option("--min-zoom", default=0, show_default=True, help="Lowest tile matrix (zoom level) to seed.")
+@click.option("--max-zoom", required=True, type=int, help="Highest tile matrix (zoom level) to seed.")
+@click.option("--time", "times", multiple=True,
+              help="Time value to seed (may be repeated).  Defaults to the layer's default time.")
+@click.option("--workers", default=1, show_default=True, help="Number of worker processes.")
+@click.option("--progress-file", default=None, type=click.Path(dir_okay=False),
+              help="File recording completed tiles. If it already exists, tiles recorded in it are not re-rendered, "
+                   "so an interrupted run can be resumed.")
+@click.option("--report-every", default=100, show_default=True, help="Print throughput statistics every N tiles.")
+@click.option("--version", is_flag=True, default=False, help="Print version string and exit")
+@click.argument("layer", required=False)
+def main(layer, style, tile_matrix_set, min_zoom, max_zoom, times,
+         workers, progress_file, report_every, version):
+    """Pre-render WMTS tiles for an OWS layer into the response cache.
+
+    Tiles are rendered for every tile of the tile matrix set that intersects the layer's
+    bounding box, over the requested range of zoom levels.  Tiles with no matching
+    datasets are skipped.  Resource limits are not applied, so seeded low zoom
+    levels are rendered at full resolution rather than as summary products or
+    polygon fills.
+
+    Requires a disk or redis response_cache backend in the OWS config.
+
+    Uses the DATACUBE_OWS_CFG environment variable to find the OWS config file.
+    """
+    # --version
+    if version:
+        print("Open Data Cube Open Web Services (datacube-ows) version",
+              __version__
+               )
+        sys.exit(0)
+    if not layer:
+        print("Sorry, a layer must be specified")
+        sys.exit(1)
+    if min_zoom > max_zoom:
+        print("Sorry, --min-zoom cannot be greater than --max-zoom")
+        sys.exit(1)
+    if workers < 1:
+        print("Sorry, --workers must be at least one")
+        sys.exit(1)
+
+    initialise_debugging()
+
+    cfg = get_config()
+    if not response_cache.enabled or isinstance(response_cache.backend, MemoryCacheBackend):
+        print("Sorry, tile seeding requires a disk or redis response_cache backend")
+        sys.exit(1)
+    lyr = cfg.product_index.get(layer)
+    if lyr is None:
+        print(f"Sorry, unknown layer: {layer}")
+        sys.exit(1)
+    tms = cfg.tile_matrix_sets.get(tile_matrix_set)
+    if tms is None:
+        print(f"Sorry, unknown tile matrix set: {tile_matrix_set}")
+        sys.exit(1)
+    if max_zoom >= len(tms.scale_set):
+        print(f"Sorry, tile matrix set {tile_matrix_set} only has {len(tms.scale_set)} zoom levels")
+        sys.exit(1)
+    bbox = lyr.bboxes.get(tms.crs_name)
+    if bbox is None:
+        print(f"Sorry, no bounding box for layer {layer} in {tms.crs_name} - try running datacube-ows-update first")
+        sys.exit(1)
+    if not times:
+        times = [lyr.default_time.isoformat()]
+    style = style or lyr.default_style.name
+
+    tiles = tile_requests(layer, style, tms, range(min_zoom, max_zoom + 1), bbox, times)
+    done = read_progress(progress_file)
+    tiles = [t for t in tiles if progress_key(t) not in done]
+    print(f"Seeding {len(tiles)} tiles for layer {layer} ({len(done)} already complete)")
+    stats = seed(tiles, workers, progress_file, report_every)
+    if stats[FAILED]:
+        sys.exit(1)
+    return 0
+
+
+def tile_requests(layer, style, tms, zooms, bbox, times):
+    """
+    List the WMTS GetTile requests for the tiles of a tile matrix set that intersect a bounding box.
+
+    :param layer: The layer name
+    :param style: The style name
+    :param tms: The TileMatrixSet
+    :param zooms: Iterable of tile matrix (zoom level) indexes
+    :param bbox: The bounding box, in the tile matrix set's CRS
+    :param times: Iterable of time values
+    :return: A list of WMTS GetTile argument dictionaries
+    """
+    tiles = []
+    for time_val in times:
+        for zoom in zooms:
+            rows, cols = tms.tile_ranges(zoom, bbox)
+            for row in rows:
+                for col in cols:
+                    tiles.append({
+                        "layer": layer,
+                        "style": style,
+                        "format": "image/png",
+                        "time": time_val,
+                        "tilematrixset": tms.identifier,
+                        "tilematrix": str(zoom),
+                        "tilerow": str(row),
+                        "tilecol": str(col),
+                        "requestid": "seed",
+                    })
+    return tiles
+
+
+def progress_key(tile):
+    return " ".join(tile[k] for k in ("layer", "style", "time", "tilematrixset", "tilematrix", "tilerow", "tilecol"))
+
+
+def read_progress(progress_file):
+    if not progress_file or not os.path.exists(progress_file):
+        return set()
+    with open(progress_file) as f:
+        # Each line is a progress key followed by the tile status.  Failed tiles are retried.
+        return set(
+            key
+            for key, _, status in (line.rstrip("\n").rpartition(" ") for line in f)
+            if key and status != FAILED
+        )
+
+
+def seed(tiles, workers=1, progress_file=None, report_every=100):
+    """
+    Render tiles into the response cache, recording progress and printing throughput statistics.
+
+    :param tiles: List of WMTS GetTile argument dictionaries
+    :param workers: Number of worker processes.  If one, tiles are rendered in this process.
+    :param progress_file: Optional file to append completed tiles to.
+    :param report_every: Print statistics after every this many tiles.
+    :return: A Counter of tile statuses.
+    """
+    stats = Counter()
+    zoom_stats = {}
+    start = time.monotonic()
+    progress = open(progress_file, "a") if progress_file else None
+    if workers > 1:
+        # Spawn fresh worker processes, so no database connections are shared with this process.
+        pool = multiprocessing.get_context("spawn").Pool(workers, initializer=get_config)
+        results = pool.imap_unordered(seed_tile, tiles, chunksize=4)
+    else:
+        pool = None
+        results = map(seed_tile, tiles)
+    try:
+        for tile, status, msg, elapsed in results:
+            stats[status] += 1
+            zoom_stats.setdefault(int(tile["tilematrix"]), Counter())[status] += 1
+            zoom_stats[int(tile["tilematrix"])]["seconds"] += elapsed
+            if status == FAILED:
+                print(f"Tile {progress_key(tile)} failed: {msg}")
+            if progress:
+                progress.write(f"{progress_key(tile)} {status}\n")
+                progress.flush()
+            n_done = sum(stats.values())
+            if report_every and n_done % report_every == 0:
+                print_stats(stats, n_done, len(tiles), time.monotonic() - start)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if progress:
+            progress.close()
+    print_stats(stats, sum(stats.values()), len(tiles), time.monotonic() - start)
+    for zoom, zstats in sorted(zoom_stats.items()):
+        n_zoom = zstats[RENDERED] + zstats[SKIPPED] + zstats[FAILED]
+        print(f"  Zoom {zoom}: {zstats[RENDERED]} rendered, {zstats[SKIPPED]} skipped, {zstats[FAILED]} failed, "
+              f"{zstats['seconds'] / n_zoom:.3f}s per tile")
+    return stats
+
+
+def print_stats(stats, n_done, n_tiles, elapsed):
+    rate = n_done / elapsed if elapsed else 0.0
+    print(f"{n_done}/{n_tiles} tiles: {stats[RENDERED]} rendered, {stats[SKIPPED]} skipped, {stats[FAILED]} failed "
+          f"({rate:.1f} tiles/s)")
+
+
+def seed_tile(tile):
+    """
+    Render a single tile into the response cache.
+
+    :param tile: WMTS GetTile argument dictionary
+    :return: A tuple of (tile, status, error message, elapsed seconds)
+    """
+    start = time.monotonic()
+    try:
+        n_datasets = seed_map(wmts_args_to_wms(tile, get_config()))
+        status, msg = (RENDERED if n_datasets else SKIPPED), None
+    except Exception as e:  # pylint: disable=broad-except
+        status, msg = FAILED, str(e)
+    return tile, status, msg, time.monotonic() - start
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+-- Setting default timezone to UTC
+
+set timezone to 'Etc/UTC'
@@ -0,0 +1,3 @@
+-- Creating/replacing wms schema
+
+create schema if not exists wms;
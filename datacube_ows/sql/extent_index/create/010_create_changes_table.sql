@@ -0,0 +1,6 @@
+-- Creating/replacing extent index change list table
+
+create table if not exists wms.extent_index_changes (
+    dataset_id uuid not null primary key,
+    dataset_type_ref smallint not null
+)
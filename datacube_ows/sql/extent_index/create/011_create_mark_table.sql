@@ -0,0 +1,13 @@
+-- Creating/replacing extent index high-water mark table
+
+create table if not exists wms.extent_index_mark (
+    singleton boolean not null primary key default true check (singleton),
+
+    last_added timestamp with time zone,
+    last_checked timestamp with time zone,
+    partition_prefix text,
+
+    pending_added timestamp with time zone,
+    pending_checked timestamp with time zone,
+    pending_partition_prefix text
+)
@@ -0,0 +1,39 @@
+-- Creating/replacing extent index partition function
+
+-- Creates any missing partitions of an extent index table for the datasets in the change list:
+-- a partition per product (in the wms schema), sub-partitioned by the year of the start of the
+-- temporal extent, with a default sub-partition for datasets with no start time.
+CREATE OR REPLACE FUNCTION wms.create_extent_partitions(parent regclass, prefix text) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  part record;
+  product_part text;
+  year_part text;
+  created integer := 0;
+BEGIN
+  FOR part IN
+    SELECT DISTINCT dataset_type_ref AS product,
+                    extract(year FROM lower(temporal_extent))::integer AS year
+    FROM wms.changed_time_extents
+  LOOP
+    product_part := format('%s_%s', prefix, part.product);
+    IF to_regclass(format('wms.%I', product_part)) IS NULL THEN
+      EXECUTE format('CREATE TABLE wms.%I PARTITION OF %s FOR VALUES IN (%s) PARTITION BY RANGE (lower(temporal_extent))',
+                     product_part, parent, part.product);
+      EXECUTE format('CREATE TABLE wms.%I PARTITION OF wms.%I DEFAULT',
+                     product_part || '_default', product_part);
+      created := created + 2;
+    END IF;
+    year_part := format('%s_%s', product_part, part.year);
+    IF part.year IS NOT NULL AND to_regclass(format('wms.%I', year_part)) IS NULL THEN
+      EXECUTE format('CREATE TABLE wms.%I PARTITION OF wms.%I FOR VALUES FROM (%L) TO (%L)',
+                     year_part, product_part,
+                     make_timestamptz(part.year, 1, 1, 0, 0, 0, 'UTC'),
+                     make_timestamptz(part.year + 1, 1, 1, 0, 0, 0, 'UTC'));
+      created := created + 1;
+    END IF;
+  END LOOP;
+  RETURN created;
+END
+$$
+
@@ -0,0 +1,25 @@
+-- Creating/replacing extent index change deletion function
+
+-- Deletes the datasets in the change list from an extent index table, touching only the partitions
+-- of the products in the change list.
+CREATE OR REPLACE FUNCTION wms.delete_extent_changes(prefix text) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  product smallint;
+  product_part text;
+  n integer;
+  deleted integer := 0;
+BEGIN
+  FOR product IN SELECT DISTINCT dataset_type_ref FROM wms.extent_index_changes LOOP
+    product_part := format('%s_%s', prefix, product);
+    IF to_regclass(format('wms.%I', product_part)) IS NOT NULL THEN
+      EXECUTE format('DELETE FROM wms.%I stv USING wms.extent_index_changes c '
+                     'WHERE c.dataset_type_ref = %s AND stv.id = c.dataset_id',
+                     product_part, product);
+      GET DIAGNOSTICS n = ROW_COUNT;
+      deleted := deleted + n;
+    END IF;
+  END LOOP;
+  RETURN deleted;
+END
+$$
@@ -0,0 +1,10 @@
+-- Creating NEW SPACE-TIME extent index table
+
+-- Partitioned by product, and (see wms.create_extent_partitions) by year within each product,
+-- so queries for a product and date range only scan the relevant partitions.
+CREATE TABLE space_time_view_new (
+    id uuid not null,
+    dataset_type_ref smallint not null,
+    spatial_extent geometry,
+    temporal_extent tstzrange
+) PARTITION BY LIST (dataset_type_ref)
@@ -0,0 +1,8 @@
+-- Recording extent index high-water mark candidates
+
+INSERT INTO wms.extent_index_mark (singleton, pending_added, pending_checked, pending_partition_prefix)
+SELECT true, max(added), now(), 'stv' || to_char(now(), 'YYYYMMDDHH24MISS') FROM agdc.dataset
+ON CONFLICT (singleton) DO UPDATE
+SET pending_added = excluded.pending_added,
+    pending_checked = excluded.pending_checked,
+    pending_partition_prefix = excluded.pending_partition_prefix
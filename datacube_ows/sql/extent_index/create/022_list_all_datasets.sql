@@ -0,0 +1,5 @@
+-- Listing all active datasets
+
+TRUNCATE wms.extent_index_changes;
+INSERT INTO wms.extent_index_changes (dataset_id, dataset_type_ref)
+SELECT id, dataset_type_ref FROM agdc.dataset WHERE archived IS NULL
@@ -0,0 +1,6 @@
+-- Creating NEW extent index table partitions
+
+SELECT wms.create_extent_partitions(
+    'space_time_view_new',
+    (SELECT pending_partition_prefix FROM wms.extent_index_mark)
+)
@@ -0,0 +1,6 @@
+-- Populating NEW SPACE-TIME extent index table (Slowest step!)
+
+INSERT INTO space_time_view_new (id, dataset_type_ref, spatial_extent, temporal_extent)
+SELECT DISTINCT ON (s.id) s.id, t.dataset_type_ref, s.spatial_extent, t.temporal_extent
+FROM wms.changed_space_extents s
+JOIN wms.changed_time_extents t ON s.id = t.id
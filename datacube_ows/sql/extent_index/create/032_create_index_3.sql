@@ -0,0 +1,5 @@
+-- Creating NEW extent index table Index 3/4 (date queries within a partition)
+
+CREATE INDEX space_time_view_start_idx_new
+  ON space_time_view_new
+  USING BRIN (lower(temporal_extent))
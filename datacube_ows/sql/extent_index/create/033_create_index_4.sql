@@ -0,0 +1,5 @@
+-- Creating NEW extent index table Index 4/4 (refresh deletes)
+
+CREATE INDEX space_time_view_id_idx_new
+  ON space_time_view_new
+  USING BTREE (id)
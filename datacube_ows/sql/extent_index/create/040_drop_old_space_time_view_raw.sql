@@ -0,0 +1,11 @@
+-- Dropping OLD space-time materialised view or extent index table (OWS down)
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = 'public' AND matviewname = 'space_time_view') THEN
+    DROP MATERIALIZED VIEW public.space_time_view;
+  ELSIF EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = 'space_time_view') THEN
+    DROP TABLE public.space_time_view;
+  END IF;
+END
+$$
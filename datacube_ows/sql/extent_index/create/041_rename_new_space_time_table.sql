@@ -0,0 +1,4 @@
+-- Renaming NEW extent index table to space_time_view (OWS back up)
+
+ALTER TABLE space_time_view_new
+RENAME TO space_time_view
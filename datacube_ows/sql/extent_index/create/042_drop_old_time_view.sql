@@ -0,0 +1,3 @@
+-- Dropping OLD time materialised view (not needed by the extent index)
+
+DROP MATERIALIZED VIEW IF EXISTS time_view
@@ -0,0 +1,3 @@
+-- Dropping OLD space materialised view (not needed by the extent index)
+
+DROP MATERIALIZED VIEW IF EXISTS space_view
@@ -0,0 +1,4 @@
+-- Renaming new extent index table Index 3/4
+
+ALTER INDEX space_time_view_start_idx_new
+  RENAME TO space_time_view_start_idx
@@ -0,0 +1,7 @@
+-- Recording extent index high-water mark
+
+UPDATE wms.extent_index_mark
+SET last_added = coalesce(pending_added, last_added),
+    last_checked = pending_checked,
+    partition_prefix = pending_partition_prefix;
+TRUNCATE wms.extent_index_changes
@@ -0,0 +1,5 @@
+-- Recording extent index high-water mark candidates
+
+UPDATE wms.extent_index_mark
+SET pending_added = (SELECT max(added) FROM agdc.dataset),
+    pending_checked = now()
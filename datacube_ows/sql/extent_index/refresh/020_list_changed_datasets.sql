@@ -0,0 +1,9 @@
+-- Listing datasets added or archived since the last refresh
+
+-- The look-back interval allows for datasets indexed in transactions that were still open at the last refresh.
+TRUNCATE wms.extent_index_changes;
+INSERT INTO wms.extent_index_changes (dataset_id, dataset_type_ref)
+SELECT ds.id, ds.dataset_type_ref
+FROM agdc.dataset ds, wms.extent_index_mark m
+WHERE ds.added > coalesce(m.last_added, '-infinity') - interval '1 hour'
+   OR ds.archived >= m.last_checked - interval '1 hour'
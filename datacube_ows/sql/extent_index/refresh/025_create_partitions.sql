@@ -0,0 +1,6 @@
+-- Creating any new extent index table partitions
+
+SELECT wms.create_extent_partitions(
+    'public.space_time_view',
+    (SELECT partition_prefix FROM wms.extent_index_mark)
+)
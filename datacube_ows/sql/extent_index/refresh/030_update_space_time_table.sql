@@ -0,0 +1,7 @@
+-- Updating SPACE-TIME extent index table for changed datasets (single transaction)
+
+SELECT wms.delete_extent_changes((SELECT partition_prefix FROM wms.extent_index_mark));
+INSERT INTO public.space_time_view (id, dataset_type_ref, spatial_extent, temporal_extent)
+SELECT DISTINCT ON (s.id) s.id, t.dataset_type_ref, s.spatial_extent, t.temporal_extent
+FROM wms.changed_space_extents s
+JOIN wms.changed_time_extents t ON s.id = t.id
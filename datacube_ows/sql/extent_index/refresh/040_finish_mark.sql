@@ -0,0 +1,6 @@
+-- Recording extent index high-water mark
+
+UPDATE wms.extent_index_mark
+SET last_added = coalesce(pending_added, last_added),
+    last_checked = pending_checked;
+TRUNCATE wms.extent_index_changes
@@ -0,0 +1,7 @@
+-- Creating extent refresh timestamp table if required
+
+create table if not exists wms.extent_refresh (
+    singleton boolean not null primary key default true check (singleton),
+
+    last_refreshed timestamp with time zone not null
+)
@@ -0,0 +1,6 @@
+-- Recording extent refresh timestamp
+
+INSERT INTO wms.extent_refresh (singleton, last_refreshed)
+VALUES (true, now())
+ON CONFLICT (singleton) DO UPDATE
+SET last_refreshed = excluded.last_refreshed
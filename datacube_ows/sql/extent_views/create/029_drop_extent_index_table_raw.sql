@@ -0,0 +1,9 @@
+-- Dropping incremental extent index table, if switching back from the extent index (OWS down)
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = 'space_time_view') THEN
+    DROP TABLE public.space_time_view;
+  END IF;
+END
+$$
@@ -0,0 +1,4 @@
+-- Adding last updated timestamp to product ranges table
+
+alter table wms.product_ranges
+    add column if not exists last_updated timestamp with time zone not null default now()
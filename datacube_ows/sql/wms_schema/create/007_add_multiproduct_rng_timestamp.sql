@@ -0,0 +1,4 @@
+-- Adding last updated timestamp to multi-product ranges table
+
+alter table wms.multiproduct_ranges
+    add column if not exists last_updated timestamp with time zone not null default now()
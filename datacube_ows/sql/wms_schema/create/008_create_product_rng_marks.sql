@@ -0,0 +1,8 @@
+-- Creating/replacing product range high-water mark table (for incremental range updates)
+
+create table if not exists wms.product_range_marks (
+    product_id smallint not null primary key references agdc.dataset_type (id),
+
+    last_added timestamp with time zone,
+    last_checked timestamp with time zone not null
+)
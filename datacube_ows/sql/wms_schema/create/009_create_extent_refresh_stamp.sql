@@ -0,0 +1,7 @@
+-- Creating/replacing extent refresh timestamp table (for invalidating worker dataset caches)
+
+create table if not exists wms.extent_refresh (
+    singleton boolean not null primary key default true check (singleton),
+
+    last_refreshed timestamp with time zone not null
+)
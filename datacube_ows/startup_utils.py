@@ -24,6 +24,8 @@ __all__ = [
     'parse_config_file',
     'initialise_flask',
     'initialise_prometheus',
+    'initialise_range_refresh_metrics',
+    'initialise_cube_pool_metrics',
     'CredentialManager',
 ]
 
@@ -209,6 +211,42 @@ def initialise_prometheus(app, log=None):
         return metrics
     return FakeMetrics()
 
+def initialise_range_refresh_metrics(metrics):
+    if isinstance(metrics, FakeMetrics):
+        return
+    from prometheus_client import Gauge
+
+    from datacube_ows.range_refresher import range_refresher
+    range_refresher.metrics = {
+        "duration": Gauge("ows_dynamic_range_refresh_seconds",
+                          "Time taken by the last background refresh of dynamic layer ranges",
+                          multiprocess_mode="max"),
+        "timestamp": Gauge("ows_dynamic_range_refresh_timestamp_seconds",
+                           "Time of the last successful background refresh of dynamic layer ranges",
+                           multiprocess_mode="min"),
+    }
+
+def initialise_cube_pool_metrics(metrics):
+    if isinstance(metrics, FakeMetrics):
+        return
+    from prometheus_client import Counter, Gauge, Histogram
+
+    from datacube_ows.cube_pool import CubePool
+    CubePool.metrics = {
+        "wait": Histogram("ows_cube_pool_wait_seconds",
+                          "Time spent waiting to check out a datacube from the cube pool",
+                          ["app"]),
+        "in_use": Gauge("ows_cube_pool_in_use",
+                        "Number of datacubes checked out of the cube pool",
+                        ["app"], multiprocess_mode="livesum"),
+        "saturation": Gauge("ows_cube_pool_saturation",
+                            "Fraction of the cube pool maximum size checked out",
+                            ["app"], multiprocess_mode="max"),
+        "timeouts": Counter("ows_cube_pool_timeouts",
+                            "Number of cube pool checkouts that timed out",
+                            ["app"]),
+    }
+
 def request_extractor():
     qreq = request.args.get('request')
     return qreq
@@ -347,7 +347,7 @@ class StyleDefBase(OWSExtensibleConfigEntry, OWSMetadataConfig):
                     if flat_mask is None:
                         flat_mask = mask_slice
                     else:
-                        flat_mask &= mask_slice
+                        flat_mask = flat_mask & mask_slice
                 mask = cast(xr.DataArray, flat_mask)
             alpha = alpha.where(mask, other=0)
         img_data = img_data.assign({"alpha": alpha})
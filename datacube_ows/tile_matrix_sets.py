@@ -3,6 +3,8 @@
 #
 # Copyright (c) 2017-2023 OWS Contributors
 # SPDX-License-Identifier: Apache-2.0
+import math
+
 from datacube_ows.config_utils import OWSConfigEntry
 from datacube_ows.ogc_utils import ConfigException
 
@@ -107,12 +109,44 @@ class TileMatrixSet(OWSConfigEntry):
     def height_exponent(self, scale_no):
         return self.exponent(1, scale_no)
 
+    def matrix_width(self, scale_no):
+        return 2 ** self.width_exponent(scale_no)
+
+    def matrix_height(self, scale_no):
+        return 2 ** self.height_exponent(scale_no)
+
+    def tile_span(self, tile_matrix):
+        # Size of a tile in CRS units, (horizontal, vertical)
+        scale_denominator = self.scale_set[tile_matrix]
+        pixel_span = [scale_denominator * 0.00028 * u for u in self.unit_coefficients]
+        return [ps * ts for ps, ts in zip(pixel_span, self.tile_size)]
+
+    def tile_ranges(self, tile_matrix, bbox):
+        """
+        Find the tiles of a tile matrix that intersect a bounding box.
+
+        :param tile_matrix: The tile matrix (zoom level) index
+        :param bbox: A bounding box dictionary with left, right, top and bottom entries,
+                     in the tile matrix set's CRS.
+        :return: A tuple of (row range, column range).  Ranges are empty if the bounding box
+                 does not intersect the tile matrix.
+        """
+        tile_span = self.tile_span(tile_matrix)
+        extents = (
+            (bbox["left"], bbox["right"], self.matrix_width(tile_matrix)),
+            (bbox["top"], bbox["bottom"], self.matrix_height(tile_matrix)),
+        )
+        ranges = []
+        for (low, high, n_tiles), origin, span in zip(extents, self.matrix_origin, tile_span):
+            low, high = sorted(((low - origin) / span, (high - origin) / span))
+            first = math.floor(low)
+            ranges.append(range(max(first, 0), min(max(math.ceil(high), first + 1), n_tiles)))
+        return ranges[1], ranges[0]
+
     def wms_bbox_coords(self, tile_matrix, row, col):
         # Convert WMTS params to coordinate window for WMS
         pixel = [col, row]
-        scale_denominator = self.scale_set[tile_matrix]
-        pixel_span = [scale_denominator * 0.00028 * u for u in self.unit_coefficients]
-        tile_span = [ps * ts for ps, ts in zip(pixel_span, self.tile_size)]
+        tile_span = self.tile_span(tile_matrix)
 
         mins = [mo + p * ts for mo, p, ts in zip(self.matrix_origin, pixel, tile_span)]
         maxs = [m + ts for m, ts in zip(mins, tile_span)]
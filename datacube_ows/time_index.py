@@ -0,0 +1,181 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+from collections.abc import Sequence
+from typing import Iterable, Iterator, List, Optional, Union
+
+import numpy
+
+TimeValue = Union[datetime.date, datetime.datetime]
+
+
+class TimeIndex(Sequence):
+    """
+    Compact, sorted index of the available times for a layer.
+
+    Times are stored in a numpy datetime64 array (day resolution for date-based layers,
+    microsecond resolution for subday layers), rather than as lists and sets of Python date
+    objects. Lookups are by binary search.
+
+    Behaves as a read-only sorted sequence of date (or datetime) objects, and supports
+    membership tests, so it can be used wherever the layer's list of times or set of times
+    was used previously.
+
+    Timezone-aware datetimes are stored in UTC and are returned in the timezone of the first time
+    the index was built from. Naive datetimes used in lookups against an index of timezone-aware
+    datetimes are treated as UTC.
+    """
+    def __init__(self, times: Iterable[TimeValue]) -> None:
+        """
+        :param times: Iterable of dates, or of datetimes, in ascending order.
+        """
+        times = list(times)
+        self.subday = bool(times) and isinstance(times[0], datetime.datetime)
+        self.tzinfo: Optional[datetime.tzinfo] = times[0].tzinfo if self.subday else None
+        self._values = numpy.array([self._to_datetime64(t) for t in times],
+                                   dtype="datetime64[us]" if self.subday else "datetime64[D]")
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[Optional[str]], subday: bool) -> "TimeIndex":
+        """
+        Build an index from ISO format strings, as stored in the range tables.
+
+        :param strings: Iterable of ISO format date (or datetime) strings, in ascending order.  Nulls are ignored.
+        :param subday: True to parse as datetimes, False to parse as dates.
+        """
+        strings = [s for s in strings if s is not None]
+        if subday:
+            index = cls(datetime.datetime.fromisoformat(s) for s in strings)
+            index.subday = True
+            index._values = index._values.astype("datetime64[us]")
+        else:
+            index = cls([])
+            index._values = numpy.array(strings, dtype="datetime64[D]")
+        return index
+
+    def _to_datetime64(self, t: TimeValue) -> numpy.datetime64:
+        if self.subday:
+            if t.tzinfo is not None:
+                t = t.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            return numpy.datetime64(t, "us")
+        return numpy.datetime64(t, "D")
+
+    def _from_datetime64(self, value: numpy.datetime64) -> TimeValue:
+        t = value.item()
+        if self.tzinfo is not None:
+            t = t.replace(tzinfo=datetime.timezone.utc).astimezone(self.tzinfo)
+        return t
+
+    def _key(self, t: TimeValue) -> Optional[numpy.datetime64]:
+        # Keys of the wrong kind (datetimes in a date index or vice versa) match nothing,
+        # as with a set of dates.
+        if isinstance(t, datetime.datetime) != self.subday:
+            return None
+        return self._to_datetime64(t)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._from_datetime64(v) for v in self._values[idx]]
+        return self._from_datetime64(self._values[idx])
+
+    def __iter__(self) -> Iterator[TimeValue]:
+        if self.tzinfo is None:
+            return iter(self._values.tolist())
+        return (self._from_datetime64(v) for v in self._values)
+
+    def __contains__(self, t) -> bool:
+        if not isinstance(t, datetime.date):
+            return False
+        key = self._key(t)
+        if key is None:
+            return False
+        idx = numpy.searchsorted(self._values, key)
+        return bool(idx < len(self._values) and self._values[idx] == key)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TimeIndex):
+            return self.subday == other.subday and numpy.array_equal(self._values, other._values)
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TimeIndex({len(self)} times)"
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the underlying array, in bytes."""
+        return self._values.nbytes
+
+    def between(self, start: TimeValue, end: TimeValue) -> List[TimeValue]:
+        """
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (inclusive)
+        :return: The times in the range, in ascending order.
+        """
+        lo, hi = self._slice_bounds(start, end)
+        return self[lo:hi]
+
+    def first_between(self, start: TimeValue, end: TimeValue) -> Optional[TimeValue]:
+        """
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (inclusive)
+        :return: The earliest time in the range, or None if there are no times in the range.
+        """
+        lo, hi = self._slice_bounds(start, end)
+        if lo >= hi:
+            return None
+        return self[lo]
+
+    def _slice_bounds(self, start: TimeValue, end: TimeValue):
+        lo = numpy.searchsorted(self._values, self._to_datetime64(start), side="left")
+        hi = numpy.searchsorted(self._values, self._to_datetime64(end), side="right")
+        return int(lo), int(hi)
+
+    def nearest(self, t: TimeValue) -> Optional[TimeValue]:
+        """
+        :param t: A date (or datetime, for subday indexes)
+        :return: The time in the index closest to t (the earlier on a tie), or None if the index is empty.
+        """
+        if not len(self):
+            return None
+        key = self._to_datetime64(t)
+        idx = int(numpy.searchsorted(self._values, key))
+        if idx == 0:
+            return self[0]
+        if idx == len(self):
+            return self[-1]
+        before, after = self._values[idx - 1], self._values[idx]
+        return self[idx - 1] if key - before <= after - key else self[idx]
+
+    def matches_second(self, dt: datetime.datetime) -> bool:
+        """
+        Check for a time in the same second as dt, using the subday time resolution second-rounding rules.
+
+        :param dt: A datetime.  Naive datetimes are treated as UTC.
+        :return: True if a time in the index rounds down to the same second as dt.
+        """
+        if not self.subday:
+            return False
+        key = self._to_datetime64(dt)
+        # A stored time t matches if floor(t) <= dt < floor(t) + 1s,
+        # i.e. if floor(dt) <= t < floor(dt) + 1s.
+        start = key.astype("datetime64[s]").astype("datetime64[us]")
+        idx = int(numpy.searchsorted(self._values, start, side="left"))
+        return idx < len(self._values) and self._values[idx] < start + numpy.timedelta64(1, "s")
+
+
+def as_time_index(times: Iterable[TimeValue]) -> TimeIndex:
+    """
+    :param times: A TimeIndex, or an iterable of dates or datetimes in ascending order
+    :return: A TimeIndex
+    """
+    if isinstance(times, TimeIndex):
+        return times
+    return TimeIndex(times)
@@ -27,12 +27,15 @@ from datacube_ows.startup_utils import initialise_debugging
 @click.option("--views", is_flag=True, default=False, help="Refresh the ODC spatio-temporal materialised views.")
 @click.option("--schema", is_flag=True, default=False, help="Create or update the OWS database schema, including the spatio-temporal materialised views.")
 @click.option("--role", default=None, help="Role to grant database permissions to")
+@click.option("--extent-index", is_flag=True, default=False, help="When used with --schema, create an incrementally refreshed extent index table instead of the spatio-temporal materialised views.")
 @click.option("--merge-only/--no-merge-only", default=False, help="When used with a multiproduct layer, the ranges for underlying datacube products are not updated.")
+@click.option("--jobs", default=1, show_default=True, help="Number of ODC products to update in parallel.")
+@click.option("--incremental/--no-incremental", default=False, help="Only merge datasets added since the last incremental update into the ranges (falls back to a full update if datasets have been archived).")
 @click.option("--version", is_flag=True, default=False, help="Print version string and exit")
 @click.argument("layers", nargs=-1)
 def main(layers,
-         merge_only,
-         schema, views, role, version):
+         merge_only, incremental, jobs,
+         schema, views, role, extent_index, version):
     """Manage datacube-ows range tables.
 
     Valid invocations:
@@ -40,8 +43,11 @@ def main(layers,
     * update_ranges.py --schema --role myrole
         Create (re-create) the OWS schema (including materialised views) and grants permission to role myrole
 
+    * update_ranges.py --schema --extent-index --role myrole
+        As above, but create an incrementally refreshed extent index table instead of the materialised views
+
     * update_ranges.py --views
-        Refresh the materialised views
+        Refresh the materialised views (or the extent index)
 
     * One or more OWS or ODC layer names
         Update ranges for the specified LAYERS
@@ -49,6 +55,12 @@ def main(layers,
     * No LAYERS (and neither the --views nor --schema options)
         (Update ranges for all configured OWS layers.
 
+    * --incremental, with or without LAYERS
+        Update ranges as above, but only merge datasets added since the last incremental update.
+
+    * --jobs N, with or without LAYERS
+        Update ranges as above, updating up to N ODC products at a time.
+
     Uses the DATACUBE_OWS_CFG environment variable to find the OWS config file.
     """
     # --version
@@ -72,6 +84,15 @@ def main(layers,
     elif role and not schema:
         print("Sorry, role only makes sense for updating the schema")
         sys.exit(1)
+    elif extent_index and not schema:
+        print("Sorry, --extent-index only makes sense for updating the schema")
+        sys.exit(1)
+    elif incremental and (schema or views):
+        print("Sorry, --incremental only makes sense for updating ranges")
+        sys.exit(1)
+    elif jobs < 1:
+        print("Sorry, --jobs must be at least one")
+        sys.exit(1)
 
     initialise_debugging()
 
@@ -81,13 +102,21 @@ def main(layers,
         print("Checking schema....")
         print("Creating or replacing WMS database schema...")
         create_schema(dc, role)
-        print("Creating or replacing materialised views...")
-        create_views(dc)
+        if extent_index:
+            print("Creating or replacing extent index...")
+            create_extent_index(dc)
+        else:
+            print("Creating or replacing materialised views...")
+            create_views(dc)
         print("Done")
         return 0
     elif views:
-        print("Refreshing materialised views...")
-        refresh_views(dc)
+        if extent_index_in_use(dc):
+            print("Refreshing extent index...")
+            refresh_extent_index(dc)
+        else:
+            print("Refreshing materialised views...")
+            refresh_views(dc)
         print("Done")
         return 0
 
@@ -95,7 +124,7 @@ def main(layers,
     if not layers:
         layers = list(cfg.product_index.keys())
     try:
-        errors = add_ranges(dc, layers, merge_only)
+        errors = add_ranges(dc, layers, merge_only, incremental, jobs)
     except (psycopg2.errors.UndefinedColumn,
             sqlalchemy.exc.ProgrammingError) as e:
         print("ERROR: OWS schema or extent materialised views appear to be missing",
@@ -128,6 +157,31 @@ def create_views(dc):
 
 def refresh_views(dc):
     run_sql(dc, "extent_views/refresh")
+    run_sql(dc, "extent_refresh/record")
+
+
+def create_extent_index(dc):
+    run_sql(dc, "extent_index/create")
+
+
+def refresh_extent_index(dc):
+    run_sql(dc, "extent_index/refresh")
+    run_sql(dc, "extent_refresh/record")
+
+
+def extent_index_in_use(dc):
+    """
+    :return: True if the space_time_view is an incrementally refreshed extent index table,
+             rather than a materialised view.
+    """
+    conn = get_sqlconn(dc)
+    try:
+        results = conn.execute(text("""
+            SELECT 1 FROM pg_tables
+            WHERE schemaname = 'public' AND tablename = 'space_time_view'"""))
+        return bool(list(results))
+    finally:
+        conn.close()
 
 
 def create_schema(dc, role):
@@ -12,6 +12,8 @@ from typing import Any, Callable, List, Optional, TypeVar
 import pytz
 from numpy import datetime64 as npdt64
 
+from datacube_ows.time_index import as_time_index
+
 F = TypeVar('F', bound=Callable[..., Any])
 
 def log_call(func: F) -> F:
@@ -135,28 +137,10 @@ def find_matching_date(dt, dates) -> bool:
     Check for a matching datetime in sorted list, using subday time resolution second-rounding rules.
 
     :param dt: The date to dun
-    :param dates: List of sorted date-times
+    :param dates: List of sorted date-times, or a TimeIndex
     :return: True if match found
     """
-    def range_of(dt):
-        start = datetime.datetime(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, tzinfo=dt.tzinfo)
-        end = start + datetime.timedelta(seconds=1)
-        return start, end
-
-    dt = default_to_utc(dt)
-    region = dates
-    while region:
-        dtlen = len(region)
-        splitter = dtlen // 2
-        start, end = range_of(region[splitter])
-        if dt >= start and dt < end:
-            return True
-        elif dt < start:
-            region = region[0:splitter]
-        else:
-            region = region[splitter + 1:]
-
-    return False
+    return as_time_index(dates).matches_second(default_to_utc(dt))
 
 
 def default_to_utc(dt):
@@ -14,6 +14,7 @@ from rasterio import MemoryFile
 
 from datacube_ows.cube_pool import cube
 from datacube_ows.data import DataStacker
+from datacube_ows.deadline import Deadline
 from datacube_ows.mv_index import MVSelectOpts
 from datacube_ows.ogc_exceptions import WCS1Exception
 from datacube_ows.ogc_utils import ConfigException
@@ -28,6 +29,7 @@ class WCS1GetCoverageRequest():
     def __init__(self, args):
         self.args = args
         cfg = get_config()
+        self.deadline = Deadline.for_request(cfg, args)
 
         # Argument: Coverage (required)  -> product/layer
         if "coverage" not in args:
@@ -312,7 +314,8 @@ def get_coverage_data(req, qprof):
         stacker = DataStacker(req.product,
                               req.geobox,
                               req.times,
-                              bands=req.bands)
+                              bands=req.bands,
+                              deadline=req.deadline)
         qprof.start_event("count-datasets")
         n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
         qprof.end_event("count-datasets")
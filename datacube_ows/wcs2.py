@@ -17,6 +17,7 @@ from ows.wcs.v20.decoders import (kvp_decode_describe_coverage,
 from ows.wcs.v21 import encoders as encoders_v21
 
 from datacube_ows.data import json_response
+from datacube_ows.deadline import Deadline
 from datacube_ows.ogc_exceptions import WCS2Exception
 from datacube_ows.ogc_utils import (cache_control_headers,
                                     get_service_base_url, resp_headers)
@@ -79,6 +80,21 @@ def get_capabilities(args):
     if 'coveragesummary' in sections:
         include_coverage_summary = True
 
+    def render(update_sequence):
+        return _render_capabilities(cfg, base_url, update_sequence,
+                                    include_service_identification=include_service_identification,
+                                    include_service_provider=include_service_provider,
+                                    include_operations_metadata=include_operations_metadata,
+                                    include_service_metadata=include_service_metadata,
+                                    include_coverage_summary=include_coverage_summary)
+
+    key = ("wcs", "2.0", base_url,
+           include_service_identification, include_service_provider, include_operations_metadata,
+           include_service_metadata, include_coverage_summary)
+    return capabilities_response(cfg, args, key, render, WCS2Exception)
+
+
+def _render_capabilities(cfg, base_url, update_sequence, **sections):
     capabilities = ServiceCapabilities.with_defaults_v20(
         service_url =base_url + '/wcs',
         allowed_operations=[
@@ -130,23 +146,10 @@ def get_capabilities(args):
             for crs in cfg.published_CRSs
         ],
         interpolations_supported=None,  # TODO: find out interpolations
+        update_sequence=update_sequence,
     )
-    result = encoders_v20.xml_encode_capabilities(
-        capabilities,
-        include_service_identification=include_service_identification,
-        include_service_provider=include_service_provider,
-        include_operations_metadata=include_operations_metadata,
-        include_service_metadata=include_service_metadata,
-        include_coverage_summary=include_coverage_summary
-    )
-
-    headers = cache_control_headers(cfg.wms_cap_cache_age)
-    headers["Content-Type"] = result.content_type
-    return (
-        result.value,
-        200,
-        cfg.response_headers(headers)
-    )
+    result = encoders_v20.xml_encode_capabilities(capabilities, **sections)
+    return result.value, result.content_type
 
 
 def create_coverage_description(cfg, product):
@@ -300,7 +303,8 @@ def desc_coverages(args):
 def get_coverage(args, ows_stats=False, styles=None):
     request_obj = kvp_decode_get_coverage(args)
     qprof = QueryProfiler(ows_stats)
-    output, headers = get_coverage_data(request_obj, styles, qprof)
+    deadline = Deadline.for_request(get_config(), args)
+    output, headers = get_coverage_data(request_obj, styles, qprof, deadline=deadline)
     if ows_stats:
         return json_response(qprof.profile())
     return (
@@ -14,10 +14,12 @@ from rasterio import MemoryFile
 
 from datacube_ows.cube_pool import cube
 from datacube_ows.data import DataStacker
+from datacube_ows.deadline import NO_DEADLINE
 from datacube_ows.mv_index import MVSelectOpts
 from datacube_ows.ogc_exceptions import WCS2Exception
 from datacube_ows.ows_configuration import get_config
 from datacube_ows.resource_limits import ResourceLimited
+from datacube_ows.time_index import as_time_index
 from datacube_ows.utils import default_to_utc
 from datacube_ows.wcs_scaler import WCSScaler, WCSScalerUnknownDimension
 
@@ -46,7 +48,7 @@ def uniform_crs(cfg, crs):
     return crs
 
 
-def get_coverage_data(request, styles, qprof):
+def get_coverage_data(request, styles, qprof, deadline=NO_DEADLINE):
     # pylint: disable=too-many-locals, protected-access
 
     cfg = get_config()
@@ -126,16 +128,9 @@ def get_coverage_data(request, styles, qprof):
                     else:
                         low = parse(subset.low).date() if subset.low is not None else None
                         high = parse(subset.high).date() if subset.high is not None else None
-                    if low is not None:
-                        times = [
-                            time for time in times
-                            if time >= low
-                        ]
-                    if high is not None:
-                        times = [
-                            time for time in times
-                            if time <= high
-                        ]
+                    index = as_time_index(times)
+                    times = index.between(low if low is not None else index[0],
+                                          high if high is not None else index[-1])
                 elif isinstance(subset, Slice):
                     point = parse(subset.point).date()
                     times = [point]
@@ -260,7 +255,8 @@ def get_coverage_data(request, styles, qprof):
         stacker = DataStacker(layer,
                               geobox,
                               times,
-                              bands=bands)
+                              bands=bands,
+                              deadline=deadline)
         qprof.end_event("setup")
         qprof.start_event("count-datasets")
         n_datasets = stacker.datasets(dc.index, mode=MVSelectOpts.COUNT)
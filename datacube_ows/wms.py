@@ -5,10 +5,11 @@
 # SPDX-License-Identifier: Apache-2.0
 from flask import render_template
 
+from datacube_ows.capabilities_cache import capabilities_response
 from datacube_ows.data import feature_info, get_map
 from datacube_ows.legend_generator import legend_graphic
 from datacube_ows.ogc_exceptions import WMSException
-from datacube_ows.ogc_utils import cache_control_headers, get_service_base_url
+from datacube_ows.ogc_utils import get_service_base_url
 from datacube_ows.ows_configuration import get_config
 from datacube_ows.utils import log_call
 
@@ -36,19 +37,20 @@ def handle_wms(nocase_args):
 
 @log_call
 def get_capabilities(args):
-    # TODO: Handle updatesequence request parameter for cache consistency.
     # Note: Only WMS v1.3.0 is fully supported at this stage, so no version negotiation is necessary
     # Extract layer metadata from Datacube.
     cfg = get_config()
     url = args.get('Host', args['url_root'])
     base_url = get_service_base_url(cfg.allowed_urls, url)
-    headers = cache_control_headers(cfg.wms_cap_cache_age)
-    headers["Content-Type"] = "application/xml"
-    return (
-        render_template(
-            "wms_capabilities.xml",
-            cfg=cfg,
-            base_url=base_url),
-        200,
-        cfg.response_headers(headers)
-    )
+
+    def render(update_sequence):
+        return (
+            render_template(
+                "wms_capabilities.xml",
+                cfg=cfg,
+                base_url=base_url,
+                update_sequence=update_sequence),
+            "application/xml"
+        )
+
+    return capabilities_response(cfg, args, ("wms", "1.3.0", base_url), render, WMSException)
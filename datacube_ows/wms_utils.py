@@ -22,6 +22,7 @@ from datacube_ows.ows_configuration import get_config
 from datacube_ows.resource_limits import RequestScale
 from datacube_ows.styles import StyleDef
 from datacube_ows.styles.expression import ExpressionException
+from datacube_ows.time_index import as_time_index
 from datacube_ows.utils import default_to_utc, find_matching_date
 
 RESAMPLING_METHODS = {
@@ -185,14 +186,12 @@ def parse_time_item(item, product):
     if len(times) > 1:
         # TODO WMS Time range selections (/ notation) are poorly and incompletely implemented.
         start, end = parse_wms_time_strings(times, with_tz=product.time_resolution.is_subday())
-        if product.time_resolution.is_subday():
-            matching_times = [t for t in product.ranges['times'] if start <= t <= end]
-        else:
+        if not product.time_resolution.is_subday():
             start, end = start.date(), end.date()
-            matching_times = [t for t in product.ranges['times'] if start <= t <= end]
-        if matching_times:
-            # default to the first matching time
-            return matching_times[0]
+        # default to the first matching time
+        matching_time = as_time_index(product.ranges['times']).first_between(start, end)
+        if matching_time is not None:
+            return matching_time
         elif product.regular_time_axis:
             raise WMSException(
                 "No data available for time dimension range '%s'-'%s' for this layer" % (start, end),
@@ -7,9 +7,10 @@ import logging
 
 from flask import render_template
 
-from datacube_ows.data import feature_info, get_map
+from datacube_ows.capabilities_cache import capabilities_response
+from datacube_ows.data import feature_info, get_map, get_metatile
 from datacube_ows.ogc_exceptions import WMSException, WMTSException
-from datacube_ows.ogc_utils import cache_control_headers, get_service_base_url
+from datacube_ows.ogc_utils import get_service_base_url
 from datacube_ows.ows_configuration import get_config
 from datacube_ows.utils import log_call
 
@@ -40,7 +41,6 @@ def handle_wmts(nocase_args):
 
 @log_call
 def get_capabilities(args):
-    # TODO: Handle updatesequence request parameter for cache consistency.
     # Note: Only WMS v1.0.0 exists at this stage, so no version negotiation is necessary
     # Extract layer metadata from Datacube.
     cfg = get_config()
@@ -83,21 +83,38 @@ def get_capabilities(args):
                 raise WMTSException("Invalid section: %s" % section,
                                 WMTSException.INVALID_PARAMETER_VALUE,
                                 locator="Section parameter")
-    headers = cache_control_headers(cfg.wms_cap_cache_age)
-    headers["Content-Type"] = "application/xml"
-    return (
-        render_template(
-            "wmts_capabilities.xml",
-            cfg=cfg,
-            base_url=base_url,
-            show_service_id=show_service_id,
-            show_service_provider=show_service_provider,
-            show_ops_metadata=show_ops_metadata,
-            show_contents=show_contents,
-            show_themes=show_themes),
-        200,
-        cfg.response_headers(headers)
-    )
+
+    def render(update_sequence):
+        return (
+            render_template(
+                "wmts_capabilities.xml",
+                cfg=cfg,
+                base_url=base_url,
+                show_service_id=show_service_id,
+                show_service_provider=show_service_provider,
+                show_ops_metadata=show_ops_metadata,
+                show_contents=show_contents,
+                show_themes=show_themes,
+                update_sequence=update_sequence),
+            "application/xml"
+        )
+
+    key = ("wmts", "1.0.0", base_url,
+           show_service_id, show_service_provider, show_ops_metadata, show_contents, show_themes)
+    return capabilities_response(cfg, args, key, render, WMTSException)
+
+
+def get_tile_matrix_set(identifier, cfg):
+    tms = cfg.tile_matrix_sets.get(identifier)
+    if not tms:
+        for _tms in cfg.tile_matrix_sets.values():
+            if identifier == _tms.wkss:
+                tms = _tms
+                break
+
+    if tms is None:
+        raise WMTSException("Invalid Tile Matrix Set: " + identifier)
+    return tms
 
 
 @log_call
@@ -122,18 +139,11 @@ def wmts_args_to_wms(args, cfg):
         "height": 256,
         "format": format_,
         "exceptions": "application/vnd.ogc.se_xml",
-        "requestid": args["requestid"]
+        "requestid": args["requestid"],
+        "request_timeout": args.get("request_timeout"),
     }
 
-    tms = cfg.tile_matrix_sets.get(tileMatrixSet)
-    if not tms:
-        for _tms in cfg.tile_matrix_sets.values():
-            if tileMatrixSet == _tms.wkss:
-                tms = _tms
-                break
-
-    if tms is None:
-        raise WMTSException("Invalid Tile Matrix Set: " + tileMatrixSet)
+    tms = get_tile_matrix_set(tileMatrixSet, cfg)
 
     wms_args["crs"] = tms.crs_name
     crs_cfg = cfg.published_CRSs[tms.crs_name]
@@ -166,12 +176,52 @@ def wmts_args_to_wms(args, cfg):
     return wms_args
 
 
+@log_call
+def wmts_metatile_args(args, cfg, size):
+    """
+    Convert a WMTS GetTile request to WMS GetMap requests for the block of tiles containing the requested tile.
+
+    Blocks are aligned to multiples of size tiles from the tile matrix origin, and are clipped to the
+    edges of the tile matrix.
+
+    :param args: WMTS GetTile arguments (assumed already validated by wmts_args_to_wms)
+    :param cfg: The OWS configuration
+    :param size: The metatile size (tiles along each side of a block)
+    :return: A tuple of (list of WMS GetMap args for the tiles in the block in row-major order,
+             index of the requested tile in the list, (rows, cols) of tiles in the block),
+             or None if the requested tile is outside the tile matrix.
+    """
+    tms = get_tile_matrix_set(args.get("tilematrixset"), cfg)
+    tile_matrix = int(args.get("tilematrix"))
+    row = int(args.get("tilerow"))
+    col = int(args.get("tilecol"))
+    n_rows = tms.matrix_height(tile_matrix)
+    n_cols = tms.matrix_width(tile_matrix)
+    if not (0 <= row < n_rows and 0 <= col < n_cols):
+        return None
+    rows = range(row - row % size, min(row - row % size + size, n_rows))
+    cols = range(col - col % size, min(col - col % size + size, n_cols))
+    tile_args = []
+    for r in rows:
+        for c in cols:
+            block_args = dict(args)
+            block_args["tilerow"] = str(r)
+            block_args["tilecol"] = str(c)
+            tile_args.append(wmts_args_to_wms(block_args, cfg))
+    requested = rows.index(row) * len(cols) + cols.index(col)
+    return tile_args, requested, (len(rows), len(cols))
+
+
 @log_call
 def get_tile(args):
     cfg = get_config()
     wms_args = wmts_args_to_wms(args, cfg)
 
     try:
+        if cfg.wmts_metatile_size > 1 and not wms_args.get("ows_stats"):
+            metatile = wmts_metatile_args(args, cfg, cfg.wmts_metatile_size)
+            if metatile:
+                return get_metatile(*metatile)
         return get_map(wms_args)
     except WMSException as wmse:
         first_error = wmse.errors[0]
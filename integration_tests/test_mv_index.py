@@ -131,3 +131,14 @@ def test_extent_and_spatial():
             dc.index, MVSelectOpts.COUNT, geom=small_geom, products=lyr.products
         )
         assert small_count <= all_count
+
+
+def test_count_ids():
+    cfg = get_config()
+    lyr = list(cfg.product_index.values())[0]
+    with cube() as dc:
+        count = mv_search(dc.index, MVSelectOpts.COUNT, products=lyr.products)
+        ids = mv_search(dc.index, MVSelectOpts.IDS, products=lyr.products)
+        result = mv_search(dc.index, MVSelectOpts.COUNT_IDS, products=lyr.products)
+        assert result.count == count
+        assert sorted(result.ids) == sorted(str(i) for i in ids)
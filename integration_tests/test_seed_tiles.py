@@ -0,0 +1,27 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+"""Test tile seeding using Click testing
+https://click.palletsprojects.com/en/7.x/testing/
+"""
+from datacube_ows.seed_tiles_impl import main
+
+
+def test_seed_version(runner):
+    result = runner.invoke(main, ["--version"])
+    assert "Open Data Cube Open Web Services (datacube-ows) version" in result.output
+    assert result.exit_code == 0
+
+
+def test_seed_no_layer(runner):
+    result = runner.invoke(main, ["--max-zoom", "2"])
+    assert "a layer must be specified" in result.output
+    assert result.exit_code == 1
+
+
+def test_seed_bad_zoom_range(runner):
+    result = runner.invoke(main, ["--min-zoom", "3", "--max-zoom", "2", "a_layer"])
+    assert "--min-zoom cannot be greater than --max-zoom" in result.output
+    assert result.exit_code == 1
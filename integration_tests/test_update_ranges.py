@@ -21,6 +21,24 @@ def test_update_ranges_views(runner):
     assert result.exit_code == 0
 
 
+def test_update_ranges_extent_index(runner, role_name, product_name):
+    result = runner.invoke(main, ["--schema", "--extent-index", "--role", role_name])
+    assert "Cannot find SQL resource" not in result.output
+    assert result.exit_code == 0
+    result = runner.invoke(main, ["--views"])
+    assert "Refreshing extent index" in result.output
+    assert result.exit_code == 0
+    result = runner.invoke(main, [product_name])
+    assert "ERROR" not in result.output
+    assert result.exit_code == 0
+    # Switch back to the materialised views
+    result = runner.invoke(main, ["--schema", "--role", role_name])
+    assert result.exit_code == 0
+    result = runner.invoke(main, ["--views"])
+    assert "Refreshing materialised views" in result.output
+    assert result.exit_code == 0
+
+
 def test_update_version(runner):
     result = runner.invoke(main, ["--version"])
     assert "Open Data Cube Open Web Services (datacube-ows) version" in result.output
@@ -62,3 +80,7 @@ def test_update_ranges_misuse_cases(runner, role_name, product_name):
     result = runner.invoke(main, ["--schema", product_name])
     assert "Sorry" in result.output
     assert result.exit_code == 1
+
+    result = runner.invoke(main, ["--extent-index"])
+    assert "Sorry" in result.output
+    assert result.exit_code == 1
@@ -58,14 +58,16 @@ operational_requirements = [
     "gunicorn>=22.0.0", "gunicorn[gevent]", "gevent", "prometheus_client", "sentry_sdk",
     "prometheus_flask_exporter", "blinker"
 ]
+cache_requirements = ["redis", "brotli"]
 setup_requirements = ['setuptools_scm', 'setuptools']
 
 extras = {
     "dev": dev_requirements + test_requirements + operational_requirements,
     "test": test_requirements,
     "ops": operational_requirements,
+    "cache": cache_requirements,
     "setup": setup_requirements,
-    "all": dev_requirements + test_requirements + operational_requirements,
+    "all": dev_requirements + test_requirements + operational_requirements + cache_requirements,
 }
 
 #  Dropped requirements: ruamel.yaml, bottleneck, watchdog
@@ -98,7 +100,8 @@ Features
         'console_scripts': [
             'datacube-ows=datacube_ows.wsgi:main',
             'datacube-ows-update=datacube_ows.update_ranges_impl:main',
-            'datacube-ows-cfg=datacube_ows.cfg_parser_impl:main'
+            'datacube-ows-cfg=datacube_ows.cfg_parser_impl:main',
+            'datacube-ows-seed=datacube_ows.seed_tiles_impl:main',
         ]
     },
     python_requires=">=3.8.0",
@@ -0,0 +1,122 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+import gzip
+from unittest.mock import MagicMock
+
+import pytest
+
+from datacube_ows.capabilities_cache import (CachedDocument, CapabilitiesCache,
+                                             capabilities_cache,
+                                             capabilities_response)
+from datacube_ows.ogc_exceptions import OGCException, WMSException
+
+
+@pytest.fixture
+def caps_cfg():
+    cfg = MagicMock()
+    cfg.wms_cap_cache_age = 60
+    cfg.internationalised = False
+    cfg.response_headers = lambda d: d
+    return cfg
+
+
+@pytest.fixture
+def enabled_cache():
+    capabilities_cache.configure(True)
+    capabilities_cache.update_sequence(lambda: datetime.datetime(2023, 1, 2, 3, 4, 5))
+    yield capabilities_cache
+    capabilities_cache.configure(False)
+
+
+def test_cached_document():
+    doc = CachedDocument("<xml>caps</xml>", "application/xml", "seq")
+    assert doc.body == b"<xml>caps</xml>"
+    assert gzip.decompress(doc.encodings["gzip"]) == doc.body
+    assert doc.etag.startswith('"') and doc.etag.endswith('"')
+    assert doc.etag == CachedDocument(b"<xml>caps</xml>", "application/xml", "other").etag
+    assert doc.etag != CachedDocument(b"<xml>other</xml>", "application/xml", "seq").etag
+    assert doc.matches(doc.etag)
+    assert doc.matches(f'"abc", {doc.etag}')
+    assert doc.matches("*")
+    assert not doc.matches('"abc"')
+    assert not doc.matches(None)
+    assert doc.encoding("gzip, deflate") == "gzip"
+    assert doc.encoding("gzip;q=0, deflate") is None
+    assert doc.encoding("deflate") is None
+    assert doc.encoding(None) is None
+
+
+def test_capabilities_cache_rerender():
+    cache = CapabilitiesCache()
+    cache.configure(True, max_entries=2)
+    render = MagicMock(side_effect=lambda seq: (f"<caps seq='{seq}'/>", "application/xml"))
+    doc = cache.get("a", "1", render)
+    assert cache.get("a", "1", render) is doc
+    assert render.call_count == 1
+    assert cache.hits == 1
+    doc2 = cache.get("a", "2", render)
+    assert doc2 is not doc
+    assert doc2.body == b"<caps seq='2'/>"
+    assert render.call_count == 2
+    cache.get("b", "2", render)
+    cache.get("c", "2", render)
+    cache.get("a", "2", render)
+    assert render.call_count == 5
+
+
+def test_update_sequence_memo():
+    cache = CapabilitiesCache()
+    cache.configure(True, range_check_interval=3600)
+    lookup = MagicMock(return_value=datetime.datetime(2023, 1, 2))
+    assert cache.update_sequence(lookup) == "2023-01-02T00:00:00"
+    assert cache.update_sequence(lookup) == "2023-01-02T00:00:00"
+    assert lookup.call_count == 1
+    cache.configure(True, range_check_interval=0)
+    lookup.return_value = None
+    assert cache.update_sequence(lookup) is None
+
+
+def test_capabilities_response_disabled(caps_cfg):
+    capabilities_cache.configure(False)
+    body, status, headers = capabilities_response(caps_cfg, {"if_none_match": "*"}, "key",
+                                                  lambda seq: ("<caps/>", "application/xml"), WMSException)
+    assert body == "<caps/>"
+    assert status == 200
+    assert headers["Content-Type"] == "application/xml"
+    assert "ETag" not in headers
+
+
+def test_capabilities_response(caps_cfg, enabled_cache):
+    render = MagicMock(side_effect=lambda seq: (f"<caps seq='{seq}'/>", "application/xml"))
+    body, status, headers = capabilities_response(caps_cfg, {}, "key", render, WMSException)
+    assert status == 200
+    assert body == b"<caps seq='2023-01-02T03:04:05'/>"
+    assert headers["cache-control"] == "max-age=60"
+    etag = headers["ETag"]
+    body, status, headers = capabilities_response(caps_cfg, {"if_none_match": etag}, "key", render, WMSException)
+    assert status == 304
+    assert not body
+    assert headers["ETag"] == etag
+    body, status, headers = capabilities_response(caps_cfg, {"accept_encoding": "gzip"}, "key", render, WMSException)
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == b"<caps seq='2023-01-02T03:04:05'/>"
+    assert render.call_count == 1
+
+
+@pytest.mark.parametrize("sequence, code", [
+    ("2023-01-02T03:04:05", OGCException.CURRENT_UPDATE_SEQUENCE),
+    ("2024-01-01T00:00:00", OGCException.INVALID_UPDATE_SEQUENCE),
+])
+def test_capabilities_response_update_sequence(caps_cfg, enabled_cache, sequence, code):
+    render = MagicMock(return_value=("<caps/>", "application/xml"))
+    with pytest.raises(WMSException) as e:
+        capabilities_response(caps_cfg, {"updatesequence": sequence}, "key", render, WMSException)
+    assert e.value.errors[0]["code"] == code
+    body, status, headers = capabilities_response(caps_cfg, {"updatesequence": "2022-01-01T00:00:00"}, "key",
+                                                  render, WMSException)
+    assert status == 200
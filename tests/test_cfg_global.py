@@ -261,3 +261,279 @@ def test_bad_integers_in_wms_section(minimal_global_raw_cfg, minimal_dc):
         cfg = OWSConfig(cfg=minimal_global_raw_cfg)
     assert "caps_cache_maxage in wms section cannot be negative" in str(e.value)
     assert "-100" in str(e.value)
+
+
+def test_dataset_cache(minimal_global_raw_cfg, minimal_dc):
+    from datacube_ows.mv_index import dataset_cache
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["dataset_cache"] = {
+        "max_datasets": 500,
+        "max_memory_mb": 64,
+    }
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.dataset_cache_max_datasets == 500
+    assert cfg.dataset_cache_max_age == 0
+    assert dataset_cache.enabled
+    assert dataset_cache.max_bytes == 64 * 1024 * 1024
+    dataset_cache.configure()
+
+
+def test_dataset_cache_bad(minimal_global_raw_cfg):
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["dataset_cache"] = {
+        "max_datasets": "lots",
+    }
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "max_datasets in dataset_cache section must be an integer" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["dataset_cache"] = {
+        "max_datasets": 2.5,
+    }
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "max_datasets in dataset_cache section must be an integer: 2.5" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["dataset_cache"] = {
+        "max_datasets": None,
+    }
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "max_datasets in dataset_cache section must be an integer: None" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["dataset_cache"] = {
+        "max_age": -5,
+    }
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "max_age in dataset_cache section cannot be negative" in str(e.value)
+
+
+def test_concurrent_reads(minimal_global_raw_cfg):
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.concurrent_read_threads == 0
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["concurrent_reads"] = {
+        "threads": 8,
+    }
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.concurrent_read_threads == 8
+    assert cfg.concurrent_reads_in_flight == 8
+    assert cfg.concurrent_query_threads == 0
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["concurrent_reads"]["query_threads"] = 4
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.concurrent_query_threads == 4
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["concurrent_reads"]["max_in_flight"] = -2
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "cannot be negative" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["concurrent_reads"]["max_in_flight"] = "many"
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "max_in_flight in concurrent_reads section must be an integer" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["concurrent_reads"]["max_in_flight"] = 4
+    minimal_global_raw_cfg["global"]["concurrent_reads"]["threads"] = 1.5
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "threads in concurrent_reads section must be an integer" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["concurrent_reads"]["threads"] = 4
+    minimal_global_raw_cfg["global"]["concurrent_reads"]["query_threads"] = None
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "query_threads in concurrent_reads section must be an integer" in str(e.value)
+
+
+def test_response_cache(minimal_global_raw_cfg, tmp_path):
+    from datacube_ows.response_cache import (DiskCacheBackend,
+                                             MemoryCacheBackend,
+                                             response_cache)
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.response_cache_backend is None
+    assert not response_cache.enabled
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["response_cache"] = {
+        "backend": "memory",
+        "max_entries": 100,
+        "max_age": 60,
+    }
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert isinstance(response_cache.backend, MemoryCacheBackend)
+    assert response_cache.backend.max_entries == 100
+    assert response_cache.backend.max_age == 60
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["response_cache"] = {
+        "backend": "disk",
+        "directory": str(tmp_path),
+    }
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert isinstance(response_cache.backend, DiskCacheBackend)
+    OWSConfig._instance = None
+    del minimal_global_raw_cfg["global"]["response_cache"]["directory"]
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "requires a directory" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["response_cache"] = {
+        "backend": "punchcards",
+    }
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "Invalid backend" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["response_cache"] = {
+        "backend": "memory",
+        "max_age": -1,
+    }
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "cannot be negative" in str(e.value)
+    response_cache.configure(None)
+
+
+def test_capabilities_cache(minimal_global_raw_cfg):
+    from datacube_ows.capabilities_cache import capabilities_cache
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert not capabilities_cache.enabled
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["capabilities_cache"] = {}
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert capabilities_cache.enabled
+    assert capabilities_cache.range_check_interval == 30
+    assert capabilities_cache.max_entries == 100
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["capabilities_cache"] = {
+        "range_check_interval": 300,
+        "max_entries": 20,
+    }
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert capabilities_cache.range_check_interval == 300
+    assert capabilities_cache.max_entries == 20
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["capabilities_cache"]["max_entries"] = "lots"
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "must be an integer" in str(e.value)
+    capabilities_cache.configure(False)
+
+
+def test_dynamic_range_refresh_interval(minimal_global_raw_cfg):
+    from datacube_ows.range_refresher import range_refresher
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert not range_refresher.enabled
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["dynamic_range_refresh_interval"] = 120
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert range_refresher.enabled
+    assert range_refresher.interval == 120
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["dynamic_range_refresh_interval"] = -1
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "cannot be negative" in str(e.value)
+    range_refresher.configure(0)
+
+
+def test_cube_pool(minimal_global_raw_cfg):
+    from datacube_ows.cube_pool import CubePool
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert CubePool.max_size == 0
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["cube_pool"] = {
+        "max_size": 8,
+        "min_size": 2,
+        "checkout_timeout": 5,
+    }
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.cube_pool_max_size == 8
+    assert CubePool.min_size == 2
+    assert CubePool.checkout_timeout == 5.0
+    assert CubePool.check_on_borrow
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["cube_pool"]["min_size"] = 10
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "cannot be greater than max_size" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["cube_pool"]["max_size"] = "lots"
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "max_size in cube_pool section must be an integer" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["cube_pool"]["max_size"] = 10.5
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "max_size in cube_pool section must be an integer" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["cube_pool"]["max_size"] = 10
+    minimal_global_raw_cfg["global"]["cube_pool"]["checkout_timeout"] = None
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "checkout_timeout in cube_pool section must be a number" in str(e.value)
+    CubePool.configure()
+
+
+def test_request_timeout(minimal_global_raw_cfg):
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.request_timeout == 0
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["request_timeout"] = 30
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.request_timeout == 30
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["request_timeout"] = "soon"
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "request_timeout in global section must be an integer: soon" in str(e.value)
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["request_timeout"] = -10
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "request_timeout in global section cannot be negative: -10" in str(e.value)
+
+
+def test_prepared_statements(minimal_global_raw_cfg):
+    from datacube_ows.mv_index import mv_query_cache
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert not cfg.prepared_statements
+    assert not mv_query_cache.prepare
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["prepared_statements"] = True
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.prepared_statements
+    assert mv_query_cache.prepare
+    mv_query_cache.configure()
+
+
+def test_wmts_metatile_size(minimal_global_raw_cfg):
+    from datacube_ows.response_cache import response_cache
+    OWSConfig._instance = None
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.wmts_metatile_size == 1
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["response_cache"] = {
+        "backend": "memory",
+    }
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.wmts_metatile_size == 1
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["response_cache"]["wmts_metatile_size"] = 4
+    cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert cfg.wmts_metatile_size == 4
+    OWSConfig._instance = None
+    minimal_global_raw_cfg["global"]["response_cache"]["wmts_metatile_size"] = 0
+    with pytest.raises(ConfigException) as e:
+        cfg = OWSConfig(cfg=minimal_global_raw_cfg)
+    assert "positive integer" in str(e.value)
+    response_cache.configure(None)
@@ -184,6 +184,35 @@ def test_minimal_named_layer(minimal_layer_cfg, minimal_global_cfg, minimal_dc,
     assert lyr.mosaic_date_func is None
 
 
+def test_named_layer_range_snapshot(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    snapshot = MagicMock()
+    with patch("datacube_ows.product_ranges.get_ranges") as get_rng:
+        get_rng.return_value = mock_range
+        lyr.make_ready(minimal_dc, range_snapshot=snapshot)
+    get_rng.assert_called_once_with(minimal_dc, lyr, snapshot=snapshot)
+    assert lyr.default_time == mock_range["times"][-1]
+
+
+def test_dynamic_layer_range_refresher(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
+    from datacube_ows.range_refresher import range_refresher
+    minimal_layer_cfg["dynamic"] = True
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    with patch("datacube_ows.product_ranges.get_ranges") as get_rng, \
+            patch("datacube_ows.ows_configuration.get_cube") as get_cube:
+        get_rng.return_value = mock_range
+        get_cube.return_value = minimal_dc
+        lyr.make_ready(minimal_dc)
+        assert lyr.ranges == mock_range
+        assert get_rng.call_count == 2
+        with patch.object(range_refresher, "ensure_running") as ensure_running:
+            ensure_running.return_value = True
+            assert lyr.ranges == mock_range
+            assert get_rng.call_count == 2
+
+
 def test_duplicate_named_layer(minimal_layer_cfg, minimal_global_cfg, minimal_dc, mock_range):
     lyr = parse_ows_layer(minimal_layer_cfg,
                           global_cfg=minimal_global_cfg)
@@ -440,6 +469,66 @@ def test_resource_limit_checks(minimal_layer_cfg, minimal_global_cfg):
     assert "too many datasets" in str(e.value)
     assert "zoomed out too far" in str(e.value)
     assert "too much projected resource requirements" in str(e.value)
+    # The dataset count can cause refusal
+    assert not lyr.resource_limits.wms_passes_without_count(zoom_factor=400.0, request_scale=mock_req_scale)
+    minimal_layer_cfg["resource_limits"]["wms"]["max_datasets"] = 0
+    minimal_global_cfg.product_index = {}
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    mock_req_scale.load_adjusted_zoom_level = 5.2
+    assert lyr.resource_limits.wms_passes_without_count(zoom_factor=400.0, request_scale=mock_req_scale)
+    # Refused anyway
+    assert not lyr.resource_limits.wms_passes_without_count(zoom_factor=100.0, request_scale=mock_req_scale)
+
+
+def test_resource_limit_cost_model(minimal_layer_cfg, minimal_global_cfg):
+    minimal_layer_cfg["resource_limits"] = {
+        "wms": {"min_zoom_factor": 300.0, "target_latency": 2.0, "cost_model_min_samples": 4},
+    }
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    limits = lyr.resource_limits
+    mock_req_scale = MagicMock()
+    mock_req_scale.data_bytes = 1000000
+    # Static limits apply until the cost model is trained.
+    assert limits.predict_wms_cost(10, mock_req_scale) is None
+    with pytest.raises(ResourceLimited) as e:
+        limits.check_wms(n_datasets=30, zoom_factor=100.0, request_scale=mock_req_scale)
+    assert "zoomed out too far" in str(e.value)
+    assert limits.wms_passes_without_count(zoom_factor=400.0, request_scale=mock_req_scale)
+    for n in range(1, 9):
+        limits.record_wms_cost(n, mock_req_scale, 0.25 * n)
+    assert limits.predict_wms_cost(4, mock_req_scale) == pytest.approx(1.0)
+    # Once trained, the predicted cost (and so the dataset count) can cause refusal.
+    assert not limits.wms_passes_without_count(zoom_factor=400.0, request_scale=mock_req_scale)
+    # The trained model replaces the zoom limits.
+    limits.check_wms(n_datasets=4, zoom_factor=100.0, request_scale=mock_req_scale)
+    with pytest.raises(ResourceLimited) as e:
+        limits.check_wms(n_datasets=30, zoom_factor=400.0, request_scale=mock_req_scale)
+    assert "exceeds target latency" in str(e.value)
+    assert "zoomed out too far" not in str(e.value)
+    # One in every explore_interval refused requests is served anyway, so the model can correct itself.
+    served = 0
+    for _ in range(limits.cost_model.explore_interval - 1):
+        try:
+            limits.check_wms(n_datasets=30, zoom_factor=400.0, request_scale=mock_req_scale)
+            served += 1
+        except ResourceLimited:
+            pass
+    assert served == 1
+    # Low-res model is trained separately
+    assert limits.low_res_within_target(30, mock_req_scale)
+    for n in range(1, 9):
+        limits.record_wms_cost(n, mock_req_scale, 0.5 * n, low_res=True)
+    assert limits.low_res_within_target(4, mock_req_scale)
+    assert not limits.low_res_within_target(30, mock_req_scale)
+
+    minimal_global_cfg.product_index = {}
+    minimal_layer_cfg["resource_limits"]["wms"]["target_latency"] = 0
+    with pytest.raises(ConfigException) as excinfo:
+        lyr = parse_ows_layer(minimal_layer_cfg,
+                              global_cfg=minimal_global_cfg)
+    assert "target_latency must be a positive number" in str(excinfo.value)
 
 
 
@@ -457,6 +546,41 @@ def test_manual_merge(minimal_layer_cfg, minimal_global_cfg):
     assert "Solar correction requires manual_merge" in str(excinfo.value)
 
 
+def test_png_encoding(minimal_layer_cfg, minimal_global_cfg):
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    assert lyr.png_compress_level is None
+    assert lyr.png_strategy == "default"
+    assert lyr.png_palette
+    minimal_global_cfg.product_index = {}
+    minimal_layer_cfg["image_processing"]["png_encoding"] = {
+        "compress_level": 2,
+        "strategy": "rle",
+        "palette": False,
+    }
+    lyr = parse_ows_layer(minimal_layer_cfg,
+                          global_cfg=minimal_global_cfg)
+    assert lyr.png_compress_level == 2
+    assert lyr.png_strategy == "rle"
+    assert not lyr.png_palette
+    minimal_layer_cfg["image_processing"]["png_encoding"]["compress_level"] = 11
+    with pytest.raises(ConfigException) as excinfo:
+        lyr = parse_ows_layer(minimal_layer_cfg,
+                              global_cfg=minimal_global_cfg)
+    assert "must be between 0 and 9" in str(excinfo.value)
+    minimal_layer_cfg["image_processing"]["png_encoding"]["compress_level"] = "max"
+    with pytest.raises(ConfigException) as excinfo:
+        lyr = parse_ows_layer(minimal_layer_cfg,
+                              global_cfg=minimal_global_cfg)
+    assert "must be an integer" in str(excinfo.value)
+    minimal_layer_cfg["image_processing"]["png_encoding"]["compress_level"] = 1
+    minimal_layer_cfg["image_processing"]["png_encoding"]["strategy"] = "squeeze"
+    with pytest.raises(ConfigException) as excinfo:
+        lyr = parse_ows_layer(minimal_layer_cfg,
+                              global_cfg=minimal_global_cfg)
+    assert "Invalid strategy" in str(excinfo.value)
+
+
 def test_bad_timeres(minimal_layer_cfg, minimal_global_cfg):
     minimal_layer_cfg["time_resolution"] = "prime_ministers"
     with pytest.raises(ConfigException) as excinfo:
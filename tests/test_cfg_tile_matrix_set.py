@@ -179,3 +179,82 @@ def test_tms_wms_bbox(wwwm_tms_cfg, tmsmin_global_cfg):
     assert a == pytest.approx(9705668.103538, 0.001)
     assert d == pytest.approx(-12210356.64638, 0.001)
     assert c == pytest.approx(10018754.17139, 0.001)
+
+
+def test_matrix_dimensions(wwwm_tms_cfg, tmsmin_global_cfg):
+    wwwm_tms_cfg["matrix_exponent_initial_offsets"] = (1, 0)
+    tms = TileMatrixSet("test", wwwm_tms_cfg, tmsmin_global_cfg)
+    assert tms.matrix_width(0) == 2
+    assert tms.matrix_height(0) == 1
+    assert tms.matrix_width(3) == 16
+    assert tms.matrix_height(3) == 8
+
+
+@pytest.mark.parametrize("row, col, expected_tiles, expected_idx, expected_shape", [
+    (5, 6, [(4, 4), (4, 5), (4, 6), (4, 7), (5, 4), (5, 5), (5, 6), (5, 7),
+            (6, 4), (6, 5), (6, 6), (6, 7), (7, 4), (7, 5), (7, 6), (7, 7)], 6, (4, 4)),
+    (0, 0, [(0, 0), (0, 1), (0, 2), (0, 3), (1, 0), (1, 1), (1, 2), (1, 3),
+            (2, 0), (2, 1), (2, 2), (2, 3), (3, 0), (3, 1), (3, 2), (3, 3)], 0, (4, 4)),
+])
+def test_wmts_metatile_args(wwwm_tms_cfg, tmsmin_global_cfg, row, col, expected_tiles, expected_idx, expected_shape):
+    from datacube_ows.wmts import wmts_args_to_wms, wmts_metatile_args
+    tms = TileMatrixSet("WholeWorld_WebMercator", wwwm_tms_cfg, tmsmin_global_cfg)
+    tmsmin_global_cfg.tile_matrix_sets = {"WholeWorld_WebMercator": tms}
+    args = {
+        "layer": "a_layer",
+        "style": "",
+        "format": "image/png",
+        "tilematrixset": "WholeWorld_WebMercator",
+        "tilematrix": "3",
+        "tilerow": str(row),
+        "tilecol": str(col),
+        "requestid": "abc",
+    }
+    tile_args, idx, shape = wmts_metatile_args(args, tmsmin_global_cfg, 4)
+    assert shape == expected_shape
+    assert idx == expected_idx
+    assert len(tile_args) == len(expected_tiles)
+    for targs, (r, c) in zip(tile_args, expected_tiles):
+        assert targs["bbox"] == "%f,%f,%f,%f" % tms.wms_bbox_coords(3, r, c)
+    assert tile_args[idx] == wmts_args_to_wms(args, tmsmin_global_cfg)
+
+
+def test_wmts_metatile_args_clipped(wwwm_tms_cfg, tmsmin_global_cfg):
+    from datacube_ows.wmts import wmts_metatile_args
+    tms = TileMatrixSet("WholeWorld_WebMercator", wwwm_tms_cfg, tmsmin_global_cfg)
+    tmsmin_global_cfg.tile_matrix_sets = {"WholeWorld_WebMercator": tms}
+    args = {
+        "layer": "a_layer",
+        "style": "",
+        "format": "image/png",
+        "tilematrixset": "WholeWorld_WebMercator",
+        "tilematrix": "1",
+        "tilerow": "1",
+        "tilecol": "0",
+        "requestid": "abc",
+    }
+    tile_args, idx, shape = wmts_metatile_args(args, tmsmin_global_cfg, 4)
+    assert shape == (2, 2)
+    assert idx == 2
+    args["tilerow"] = "2"
+    assert wmts_metatile_args(args, tmsmin_global_cfg, 4) is None
+
+
+def test_tile_ranges(wwwm_tms_cfg, tmsmin_global_cfg):
+    tms = TileMatrixSet("test", wwwm_tms_cfg, tmsmin_global_cfg)
+    world = {
+        "left": -20037508.3427892, "right": 20037508.3427892,
+        "bottom": -20037508.3427892, "top": 20037508.3427892,
+    }
+    assert tms.tile_ranges(0, world) == (range(0, 1), range(0, 1))
+    assert tms.tile_ranges(3, world) == (range(0, 8), range(0, 8))
+    # North-east quadrant
+    ne = {"left": 1000.0, "right": 20000000.0, "bottom": 1000.0, "top": 20000000.0}
+    assert tms.tile_ranges(2, ne) == (range(0, 2), range(2, 4))
+    # A bbox smaller than a tile still intersects one tile
+    point = {"left": 1000.0, "right": 1000.0, "bottom": 1000.0, "top": 1000.0}
+    assert tms.tile_ranges(2, point) == (range(1, 2), range(2, 3))
+    # A bbox outside the tile matrix intersects no tiles
+    outside = {"left": 30000000.0, "right": 40000000.0, "bottom": 1000.0, "top": 2000.0}
+    rows, cols = tms.tile_ranges(2, outside)
+    assert len(cols) == 0
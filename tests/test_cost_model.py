@@ -0,0 +1,55 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import pytest
+
+from datacube_ows.cost_model import LayerCostModel
+
+
+def test_cost_model_untrained():
+    model = LayerCostModel(min_samples=3)
+    assert not model.trained
+    model.record(4, 1e6, 1.0)
+    model.record(8, 1e6, 1.5)
+    assert model.predict(4, 1e6) is None
+    assert model.stats()["samples"] == 2
+
+
+def test_cost_model_fit():
+    model = LayerCostModel(min_samples=5)
+    for n_datasets in range(1, 30):
+        for mb in (0.5, 2.0):
+            model.record(n_datasets, mb * 1e6, 0.2 + 0.1 * n_datasets + 0.05 * mb)
+    assert model.trained
+    assert model.predict(40, 1e6) == pytest.approx(0.2 + 4.0 + 0.05, rel=1e-6)
+    assert model.stats()["coefficients"] == pytest.approx([0.2, 0.1, 0.05], rel=1e-6)
+
+
+def test_cost_model_fixed_tile_size():
+    # Collinear features (constant data volume) still give sensible predictions.
+    model = LayerCostModel(min_samples=5)
+    for n_datasets in range(1, 20):
+        model.record(n_datasets, 256 * 256 * 4, 0.5 + 0.2 * n_datasets)
+    assert model.predict(30, 256 * 256 * 4) == pytest.approx(6.5, rel=1e-6)
+
+
+def test_cost_model_tracks_changes():
+    model = LayerCostModel(min_samples=5)
+    for _ in range(50):
+        for n_datasets in (1, 10):
+            model.record(n_datasets, 1e6, 0.1 * n_datasets)
+    for _ in range(300):
+        for n_datasets in (1, 10):
+            model.record(n_datasets, 1e6, 0.3 * n_datasets)
+    assert model.predict(10, 1e6) == pytest.approx(3.0, rel=0.01)
+    assert model.predict(0, 0) >= 0.0
+
+
+def test_cost_model_explore():
+    model = LayerCostModel()
+    explored = [model.explore() for _ in range(3 * model.explore_interval)]
+    assert explored.count(True) == 3
+    assert explored[model.explore_interval - 1]
+    assert model.stats()["refused"] == 3 * model.explore_interval
@@ -0,0 +1,119 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from threading import Thread
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from datacube_ows.cube_pool import CubePool, ODCInitException, cube
+
+
+@pytest.fixture
+def pool_cfg():
+    with patch("datacube_ows.cube_pool.Datacube", side_effect=lambda app: MagicMock()):
+        yield CubePool
+    CubePool.configure()
+    for app in [app for app in CubePool._instances if app.startswith("test_pool")]:
+        del CubePool._instances[app]
+
+
+def test_unbounded_pool(pool_cfg):
+    with cube("test_pool_unbounded") as dc1:
+        with cube("test_pool_unbounded") as dc2:
+            assert dc1 is dc2
+    assert CubePool("test_pool_unbounded").stats()["size"] == 0
+
+
+def test_bounded_pool(pool_cfg):
+    CubePool.configure(min_size=1, max_size=2)
+    pool = CubePool("test_pool_bounded")
+    with cube("test_pool_bounded") as dc1:
+        assert pool.stats()["size"] == 1
+        dc2 = pool.checkout()
+        assert dc1 is not dc2
+        assert dc1 is not pool.get_cube()
+        assert pool.stats()["in_use"] == 2
+        assert pool.checkout(timeout=0.01) is None
+        assert pool.stats()["timeouts"] == 1
+        pool.checkin(dc2)
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 2
+    with cube("test_pool_bounded") as dc3:
+        assert dc3 in (dc1, dc2)
+
+
+def test_bounded_pool_reentrant(pool_cfg):
+    CubePool.configure(max_size=1, checkout_timeout=0.01)
+    pool = CubePool("test_pool_reentrant")
+    with cube("test_pool_reentrant") as dc1:
+        with cube("test_pool_reentrant") as dc2:
+            # Nested calls in the same thread share the checked-out cube, and do not need a second slot.
+            assert dc2 is dc1
+            assert pool.stats()["in_use"] == 1
+        assert pool.stats()["in_use"] == 1
+        # Other threads still have to wait for it.
+        results = []
+        other = Thread(target=lambda: results.append(pool.checkout()))
+        other.start()
+        other.join()
+        assert results == [None]
+    assert pool.stats()["in_use"] == 0
+    with cube("test_pool_reentrant") as dc3:
+        assert dc3 is dc1
+
+
+def test_bounded_pool_wait(pool_cfg):
+    CubePool.configure(max_size=1, checkout_timeout=5)
+    pool = CubePool("test_pool_wait")
+    dc = pool.checkout()
+    results = []
+    waiter = Thread(target=lambda: results.append(pool.checkout()))
+    waiter.start()
+    pool.checkin(dc)
+    waiter.join()
+    assert results == [dc]
+
+
+def test_bounded_pool_prefill_unlocked(pool_cfg):
+    CubePool.configure(min_size=2, max_size=2)
+    pool = CubePool("test_pool_prefill")
+    locked = []
+
+    def new_cube(app):
+        # pylint: disable=protected-access
+        locked.append(pool._pool_cond._is_owned())
+        return MagicMock()
+
+    with patch("datacube_ows.cube_pool.Datacube", side_effect=new_cube):
+        with cube("test_pool_prefill"):
+            assert pool.stats()["size"] == 2
+    assert locked == [False, False]
+
+
+def test_bounded_pool_liveness(pool_cfg):
+    CubePool.configure(max_size=1)
+    pool = CubePool("test_pool_liveness")
+    with cube("test_pool_liveness") as dc1:
+        pass
+    dc1.index._db._engine.connect.side_effect = Exception("Connection lost")
+    with cube("test_pool_liveness") as dc2:
+        assert dc2 is not dc1
+    dc1.close.assert_called()
+    assert pool.stats()["size"] == 1
+
+
+def test_bounded_pool_init_failure(pool_cfg):
+    CubePool.configure(max_size=1)
+    pool = CubePool("test_pool_fail")
+    with patch("datacube_ows.cube_pool.Datacube", side_effect=Exception("No database")):
+        with pytest.raises(ODCInitException):
+            pool.checkout()
+    stats = pool.stats()
+    assert stats["size"] == 0
+    assert stats["in_use"] == 0
+    with cube("test_pool_fail") as dc:
+        assert dc is not None
@@ -319,6 +319,461 @@ def test_create_nodata(dummy_raw_calc_data):
     data_out = ds.create_nodata_filled_flag_bands(data_in, pbq)
     assert data_out["flagband"][0] == 1
     assert data_out["flagband"][5] == 1
+    # Constant value is not materialised per pixel.
+    assert not any(data_out["flagband"].values.strides)
     with pytest.raises(WMSException) as e:
         data_out = ds.create_nodata_filled_flag_bands(Dataset(), pbq)
     assert "Cannot add default flag data as there is no non-flag data available" in str(e.value)
+
+
+def test_datastacker_search_cache(monkeypatch):
+    from datacube_ows.data import DataStacker
+    from datacube_ows.mv_index import MVSelectOpts
+    calls = []
+
+    def fake_mv_search(index, sel=MVSelectOpts.IDS, times=None, geom=None, products=None):
+        calls.append(sel)
+        if sel == MVSelectOpts.COUNT:
+            return 2
+        if sel == MVSelectOpts.EXTENT:
+            return None
+        return ["id1", "id2"]
+
+    monkeypatch.setattr(datacube_ows.data, "mv_search", fake_mv_search)
+    product = MagicMock()
+    prod = MagicMock()
+    prod.id = 1
+    product.products = [prod]
+    product.mosaic_date_func = None
+    stacker = DataStacker(product, MagicMock(), [datetime.date(2020, 1, 1)])
+    index = MagicMock()
+    index.datasets.bulk_get.return_value = ["ds1", "ds2"]
+    monkeypatch.setattr(datacube_ows.data.datacube.Datacube, "group_datasets", lambda dss, grp: dss)
+
+    # Counts do not fetch ids
+    assert stacker.datasets(index, mode=MVSelectOpts.COUNT) == 2
+    assert stacker.datasets(index, mode=MVSelectOpts.COUNT) == 2
+    assert calls == [MVSelectOpts.COUNT]
+    assert list(stacker.datasets(index, mode=MVSelectOpts.IDS).values()) == [["id1", "id2"]]
+    dss = stacker.datasets(index)
+    assert list(dss.values()) == [["ds1", "ds2"]]
+    stacker.datasets(index)
+    assert calls == [MVSelectOpts.COUNT, MVSelectOpts.IDS]
+    assert index.datasets.bulk_get.call_count == 1
+    stacker.datasets(index, mode=MVSelectOpts.EXTENT)
+    stacker.datasets(index, mode=MVSelectOpts.EXTENT)
+    assert calls == [MVSelectOpts.COUNT, MVSelectOpts.IDS, MVSelectOpts.EXTENT]
+
+
+def test_datastacker_search_cache_ids_first(monkeypatch):
+    from datacube_ows.data import DataStacker
+    from datacube_ows.mv_index import MVSelectOpts
+    calls = []
+
+    def fake_mv_search(index, sel=MVSelectOpts.IDS, times=None, geom=None, products=None):
+        calls.append(sel)
+        return ["id1", "id2", "id3"]
+
+    monkeypatch.setattr(datacube_ows.data, "mv_search", fake_mv_search)
+    product = MagicMock()
+    prod = MagicMock()
+    prod.id = 1
+    product.products = [prod]
+    product.mosaic_date_func = None
+    stacker = DataStacker(product, MagicMock(), [datetime.date(2020, 1, 1)])
+    stacker.datasets(MagicMock(), mode=MVSelectOpts.IDS)
+    # Counts are served from the fetched ids
+    assert stacker.datasets(MagicMock(), mode=MVSelectOpts.COUNT) == 3
+    assert calls == [MVSelectOpts.IDS]
+
+
+def test_datastacker_search_cache_count_with_ids(monkeypatch):
+    from datacube_ows.data import DataStacker
+    from datacube_ows.mv_index import MVSearchResult, MVSelectOpts
+    calls = []
+
+    def fake_mv_search(index, sel=MVSelectOpts.IDS, times=None, geom=None, products=None):
+        calls.append(sel)
+        return MVSearchResult(count=2, ids=["id1", "id2"])
+
+    monkeypatch.setattr(datacube_ows.data, "mv_search", fake_mv_search)
+    product = MagicMock()
+    prod = MagicMock()
+    prod.id = 1
+    product.products = [prod]
+    product.mosaic_date_func = None
+    stacker = DataStacker(product, MagicMock(), [datetime.date(2020, 1, 1)])
+    stacker.count_with_ids = True
+    # Count and ids are fetched with a single query
+    assert stacker.datasets(MagicMock(), mode=MVSelectOpts.COUNT) == 2
+    assert list(stacker.datasets(MagicMock(), mode=MVSelectOpts.IDS).values()) == [["id1", "id2"]]
+    assert calls == [MVSelectOpts.COUNT_IDS]
+
+
+@pytest.fixture
+def manual_merge_stacker():
+    import xarray as xr
+
+    from datacube_ows.data import DataStacker
+    times = [np.datetime64("2020-01-01", "ns"), np.datetime64("2020-01-02", "ns")]
+    dss = np.empty(2, dtype=object)
+    dss[0] = ("a", "b")
+    dss[1] = ("c",)
+    datasets = xr.DataArray(dss, dims=["time"], coords={"time": times})
+    ds_dt = {"a": times[0], "b": times[0], "c": times[1]}
+    ds_vals = {
+        "a": [[np.nan, 1.0], [np.nan, np.nan]],
+        "b": [[2.0, 2.0], [2.0, np.nan]],
+        "c": [[3.0, 3.0], [3.0, 3.0]],
+    }
+
+    def fake_read(ds, measurements, geobox, fuse_func=None):
+        return xr.Dataset({
+            "red": xr.DataArray([ds_vals[ds]], dims=["time", "y", "x"],
+                                coords={"time": [ds_dt[ds]], "y": [0, 1], "x": [0, 1]})
+        })
+
+    stacker = DataStacker.__new__(DataStacker)
+    stacker.style = None
+    stacker._geobox = None
+    stacker._product = MagicMock()
+    stacker._product.extent_mask_func = [lambda d, b: ~np.isnan(d[b])]
+    stacker._product.solar_correction = False
+    stacker.cfg = MagicMock()
+    stacker.read_data_for_single_dataset = fake_read
+    return stacker, datasets
+
+
+@pytest.mark.parametrize("threads", [0, 4])
+def test_manual_data_stack(manual_merge_stacker, threads):
+    stacker, datasets = manual_merge_stacker
+    stacker.cfg.concurrent_read_threads = threads
+    stacker.cfg.concurrent_reads_in_flight = 2
+    result = stacker.manual_data_stack(datasets, {}, ["red"], False, None)
+    np.testing.assert_array_equal(
+        result["red"].values,
+        [
+            [[2.0, 1.0], [2.0, np.nan]],
+            [[3.0, 3.0], [3.0, 3.0]],
+        ]
+    )
+
+
+def test_read_executor_order():
+    import time
+
+    from datacube_ows.data import ReadExecutor
+    in_flight = []
+    max_in_flight = []
+
+    def slow(i):
+        in_flight.append(i)
+        max_in_flight.append(len(in_flight))
+        time.sleep(0.01 * (5 - i))
+        in_flight.remove(i)
+        return i * 10
+
+    assert list(ReadExecutor.map(slow, range(5), threads=4, max_in_flight=2)) == [0, 10, 20, 30, 40]
+    assert max(max_in_flight) <= 2
+    assert list(ReadExecutor.map(slow, range(5))) == [0, 10, 20, 30, 40]
+
+
+@pytest.mark.parametrize("threads", [0, 4])
+def test_read_executor_deadline(threads):
+    import time
+
+    from datacube_ows.data import ReadExecutor
+    from datacube_ows.deadline import Deadline, RequestTimeout
+    started = []
+
+    def slow(i):
+        started.append(i)
+        time.sleep(0.05)
+        return i
+
+    with pytest.raises(RequestTimeout):
+        list(ReadExecutor.map(slow, range(20), threads=threads, max_in_flight=2, deadline=Deadline(0.12)))
+    time.sleep(0.1)
+    # Reads not yet started when the deadline passed are never started.
+    assert len(started) < 8
+
+
+def test_datastacker_deadline():
+    from datacube_ows.data import DataStacker
+    from datacube_ows.deadline import Deadline, RequestTimeout
+    product = MagicMock()
+    product.mosaic_date_func = None
+    stacker = DataStacker(product, MagicMock(), [datetime.date(2020, 1, 1)], deadline=Deadline(-1))
+    with pytest.raises(RequestTimeout) as e:
+        stacker.datasets(MagicMock())
+    assert "dataset search" in str(e.value)
+    with pytest.raises(RequestTimeout):
+        stacker.data({})
+
+
+@pytest.mark.parametrize("threads", [0, 4])
+def test_data_concurrent_queries(threads):
+    import threading
+
+    import xarray as xr
+
+    from datacube_ows.data import DataStacker
+    times = [np.datetime64("2020-01-01", "ns"), np.datetime64("2020-01-02", "ns")]
+    main_pbq = MagicMock()
+    main_pbq.ignore_time = False
+    flag_pbq = MagicMock()
+    flag_pbq.ignore_time = False
+    both_loading = threading.Barrier(2, timeout=1)
+
+    def fake_read(pbq, datasets, skip_corrections=False):
+        if threads:
+            # Both queries must be in flight at once
+            both_loading.wait()
+        band = "red" if pbq is main_pbq else "flags"
+        return xr.Dataset({
+            band: xr.DataArray(np.ones((2, 2, 2)), dims=["time", "y", "x"],
+                               coords={"time": times, "y": [0, 1], "x": [0, 1]})
+        })
+
+    stacker = DataStacker.__new__(DataStacker)
+    stacker.cfg = MagicMock()
+    stacker.cfg.concurrent_query_threads = threads
+    stacker.read_query_data = fake_read
+    result = stacker.data({main_pbq: "main_dss", flag_pbq: "flag_dss"})
+    assert set(result.data_vars) == {"red", "flags"}
+    assert list(result.time.values) == times
+
+
+def test_data_ignore_time_broadcast():
+    import xarray as xr
+
+    from datacube_ows.data import DataStacker
+    times = [np.datetime64(f"2020-01-0{d}", "ns") for d in (1, 2, 3)]
+    coords = {"y": [0, 1], "x": [0, 1]}
+    main_pbq = MagicMock()
+    main_pbq.ignore_time = False
+    flag_pbq = MagicMock()
+    flag_pbq.ignore_time = True
+    flag_pbq.bands = ("pq",)
+    reads = {
+        "main": xr.Dataset({
+            "red": xr.DataArray(np.ones((3, 2, 2)), dims=["time", "y", "x"],
+                                coords=dict(time=times, **coords))
+        }),
+        "flag": xr.Dataset({
+            "pq": xr.DataArray(np.array([[[1, 2], [4, 8]]], dtype="uint8"), dims=["time", "y", "x"],
+                               coords=dict(time=[np.datetime64("2019-06-01", "ns")], **coords),
+                               attrs={"flags_definition": {}})
+        }),
+    }
+    stacker = DataStacker.__new__(DataStacker)
+    stacker.cfg = MagicMock()
+    stacker.cfg.concurrent_query_threads = 0
+    stacker.read_query_data = lambda pbq, dss, skip_corrections=False: reads[dss]
+    result = stacker.data({main_pbq: "main", flag_pbq: "flag"})
+    assert result["pq"].dims == ("time", "y", "x")
+    assert list(result["pq"].time.values) == times
+    assert result["pq"].attrs["flags_definition"] == {}
+    # Zero-copy: stride-0 along time
+    assert result["pq"].values.strides[0] == 0
+    for i in range(3):
+        np.testing.assert_array_equal(result["pq"].values[i], [[1, 2], [4, 8]])
+
+
+def test_fuse_into_matches_combine_first(monkeypatch):
+    import xarray as xr
+
+    from datacube_ows.data import _fuse_into
+    monkeypatch.setattr(datacube_ows.data, "solar_correct_data", lambda data, ds: data / 2.0)
+    rng = np.random.default_rng(42)
+
+    def read(nodata_frac):
+        vals = rng.integers(0, 1000, size=(1, 16, 16), dtype="int16")
+        vals[rng.random(vals.shape) < nodata_frac] = -999
+        return xr.Dataset({
+            band: xr.DataArray(vals.copy(), dims=["time", "y", "x"],
+                               coords={"time": [np.datetime64("2020-01-01", "ns")],
+                                       "y": range(16), "x": range(16)},
+                               attrs={"nodata": -999})
+            for band in ("red", "green")
+        })
+
+    reads = [read(0.6), read(0.5), read(0.2)]
+    expected = None
+    merged = None
+    for d in reads:
+        mask = d["red"] != -999
+        corrected = d.where(mask)
+        corrected["red"] = corrected["red"] / 2.0
+        expected = corrected if expected is None else expected.combine_first(corrected)
+        if merged is None:
+            merged = corrected
+        else:
+            _fuse_into(merged, d, mask, None, ["red"])
+    for band in ("red", "green"):
+        assert merged[band].dtype == expected[band].dtype
+        np.testing.assert_array_equal(merged[band].values, expected[band].values)
+
+
+@pytest.mark.parametrize("manual_merge", [False, True])
+def test_build_extent_mask(manual_merge):
+    import xarray as xr
+
+    import datacube_ows.ogc_utils
+    from datacube_ows.data import _build_extent_mask
+    from datacube_ows.ogc_utils import FunctionWrapper
+    from datacube_ows.query_profiler import QueryProfiler
+    rng = np.random.default_rng(7)
+    times = [np.datetime64(f"2020-01-0{d}", "ns") for d in (1, 2, 3)]
+    coords = {"time": times, "y": range(8), "x": range(8)}
+
+    def band(nodata):
+        vals = rng.integers(0, 4, size=(3, 8, 8)).astype("float32")
+        if manual_merge:
+            vals[vals == nodata] = np.nan
+        return xr.DataArray(vals, dims=["time", "y", "x"], coords=coords, attrs={"nodata": nodata})
+
+    data = xr.Dataset({"red": band(0), "green": band(1), "pq": band(0)})
+    style = MagicMock()
+    style.needed_bands = ["red", "green", "pq"]
+    style.flag_bands = ["pq"]
+    product = MagicMock()
+    product.data_manual_merge = manual_merge
+
+    def per_date_mask_by_val(data, band):
+        assert "time" not in data.dims
+        return datacube_ows.ogc_utils.mask_by_val(data, band)
+
+    product.extent_mask_func = [FunctionWrapper(product, "datacube_ows.ogc_utils.mask_by_val")]
+    qprof = QueryProfiler(True)
+    vectorised = _build_extent_mask(data, product, style, qprof)
+    assert "build-masks-vectorised" in qprof.profile()["profile"]
+    product.extent_mask_func = [FunctionWrapper(product, per_date_mask_by_val, stand_alone=True)]
+    qprof = QueryProfiler(True)
+    per_date = _build_extent_mask(data, product, style, qprof)
+    if manual_merge:
+        assert "build-masks-vectorised" in qprof.profile()["profile"]
+    else:
+        assert "build-masks-per-date" in qprof.profile()["profile"]
+    assert vectorised.dims == per_date.dims == ("time", "y", "x")
+    np.testing.assert_array_equal(vectorised.values, per_date.values)
+
+    product.extent_mask_func = []
+    all_in = _build_extent_mask(data, product, style, QueryProfiler(False))
+    if manual_merge:
+        np.testing.assert_array_equal(all_in.values, vectorised.values)
+    else:
+        assert all_in.shape == data["red"].shape
+        assert all_in.values.all()
+
+
+def test_write_empty():
+    import io
+
+    from PIL import Image
+
+    from datacube_ows.data import _empty_png, _write_empty
+    from datacube_ows.query_profiler import QueryProfiler
+    _empty_png.cache_clear()
+    geobox = MagicMock()
+    geobox.width = 256
+    geobox.height = 128
+    qprof = QueryProfiler(True)
+    body = _write_empty(geobox, qprof)
+    img = Image.open(io.BytesIO(body))
+    assert img.size == (256, 128)
+    assert img.info["transparency"] == 0
+    assert not np.asarray(img).any()
+    assert qprof["empty_png_cache"]["misses"] == 1
+    assert _write_empty(geobox, qprof) is body
+    assert qprof["empty_png_cache"]["hits"] == 1
+
+
+def test_write_png_windows():
+    import io
+
+    import xarray as xr
+    from PIL import Image
+
+    from datacube_ows.data import _write_png
+    from datacube_ows.ogc_utils import xarray_image_as_png
+    from datacube_ows.query_profiler import QueryProfiler
+    rng = np.random.default_rng(3)
+    coords = {"y": range(8), "x": range(8)}
+    img_data = xr.Dataset({
+        band: xr.DataArray(rng.integers(0, 256, size=(8, 8)).astype("uint8"), dims=["y", "x"], coords=coords)
+        for band in ("red", "green", "blue")
+    })
+    extent_mask = xr.DataArray(np.ones((1, 8, 8), dtype=bool), dims=["time", "y", "x"],
+                               coords={"time": [np.datetime64("2020-01-01", "ns")], **coords})
+    style = MagicMock()
+    style.transform_data.return_value = img_data
+    style.get_multi_date_handler.return_value = None
+    style.product.png_compress_level = None
+    style.product.png_strategy = None
+    style.product.png_palette = False
+    windows = [
+        (slice(r, r + 4), slice(c, c + 4))
+        for r in (0, 4)
+        for c in (0, 4)
+    ]
+    qprof = QueryProfiler(False)
+    tiles = _write_png(MagicMock(), style, extent_mask, qprof, windows=windows)
+    assert len(tiles) == 4
+    for tile, (ywin, xwin) in zip(tiles, windows):
+        assert Image.open(io.BytesIO(tile)).size == (4, 4)
+        assert tile == xarray_image_as_png(img_data.isel(y=ywin, x=xwin))
+    whole = _write_png(MagicMock(), style, extent_mask, qprof)
+    assert Image.open(io.BytesIO(whole)).size == (8, 8)
+
+
+def test_write_png_deadline():
+    from datacube_ows.data import _write_png
+    from datacube_ows.deadline import Deadline, RequestTimeout
+    from datacube_ows.query_profiler import QueryProfiler
+    style = MagicMock()
+    with pytest.raises(RequestTimeout) as e:
+        _write_png(MagicMock(), style, MagicMock(), QueryProfiler(False), deadline=Deadline(-1))
+    assert "render" in str(e.value)
+    style.to_mask.assert_not_called()
+
+
+def test_get_metatile_resource_limited_fallback(monkeypatch):
+    from contextlib import contextmanager
+    held = []
+
+    @contextmanager
+    def fake_cube():
+        held.append(True)
+        try:
+            yield MagicMock()
+        finally:
+            held.pop()
+
+    def fake_get_map(args):
+        # The fallback must not need a second cube while the first is still checked out.
+        assert not held
+        return "single tile"
+
+    params = MagicMock()
+    params.ows_stats = False
+    params.style.user_defined = False
+    params.geobox.shape = (256, 256)
+    params.times = [datetime.date(2020, 1, 1)]
+    monkeypatch.setattr(datacube_ows.data, "GetMapParameters", lambda args: params)
+    monkeypatch.setattr(datacube_ows.data, "_check_multi_date", lambda p: None)
+    monkeypatch.setattr(datacube_ows.data, "RequestScale", MagicMock())
+    monkeypatch.setattr(datacube_ows.data.geometry, "GeoBox", MagicMock())
+    monkeypatch.setattr(datacube_ows.data.geometry, "CRS", MagicMock())
+    monkeypatch.setattr(datacube_ows.data, "cube", fake_cube)
+    monkeypatch.setattr(datacube_ows.data, "_map_cache_key", lambda dc, p: "key")
+    monkeypatch.setattr(datacube_ows.data, "_render_map", lambda *args, **kwargs: (100, None))
+    monkeypatch.setattr(datacube_ows.data, "get_map", fake_get_map)
+    monkeypatch.setattr(datacube_ows.data.Deadline, "for_request", MagicMock())
+    response_cache = MagicMock()
+    response_cache.enabled = True
+    response_cache.get.return_value = None
+    monkeypatch.setattr(datacube_ows.data, "response_cache", response_cache)
+    tile_args = [{"requestid": str(i)} for i in range(4)]
+    assert datacube_ows.data.get_metatile(tile_args, 1, (2, 2)) == "single tile"
+    response_cache.put.assert_not_called()
@@ -0,0 +1,42 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import MagicMock
+
+import pytest
+
+from datacube_ows.deadline import NO_DEADLINE, Deadline, RequestTimeout
+
+
+def test_no_deadline():
+    assert NO_DEADLINE.remaining() is None
+    assert not NO_DEADLINE.expired
+    NO_DEADLINE.check("anything")
+
+
+def test_deadline():
+    deadline = Deadline(60)
+    assert 59 < deadline.remaining() <= 60
+    deadline.check("load")
+    expired = Deadline(-1)
+    assert expired.expired
+    with pytest.raises(RequestTimeout) as e:
+        expired.check("load")
+    assert e.value.stage == "load"
+    assert str(e.value) == "Request timed out (load)"
+
+
+def test_deadline_for_request():
+    cfg = MagicMock()
+    cfg.request_timeout = 0
+    assert Deadline.for_request(cfg, {}).remaining() is None
+    assert 9 < Deadline.for_request(cfg, {"request_timeout": "10"}).remaining() <= 10
+    assert Deadline.for_request(cfg, {"request_timeout": "soon"}).remaining() is None
+    assert Deadline.for_request(cfg, {"request_timeout": "-5"}).remaining() is None
+    cfg.request_timeout = 30
+    assert 29 < Deadline.for_request(cfg, {"request_timeout": None}).remaining() <= 30
+    assert 4 < Deadline.for_request(cfg, {"request_timeout": "5"}).remaining() <= 5
+    # The header cannot extend the configured timeout
+    assert Deadline.for_request(cfg, {"request_timeout": "300"}).remaining() <= 30
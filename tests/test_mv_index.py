@@ -0,0 +1,195 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import MagicMock
+
+import pytest
+
+from datacube_ows.mv_index import (DatasetCache, MVQueryCache, MVSelectOpts,
+                                   get_st_view, mv_search_query)
+
+
+class FakeDataset:
+    def __init__(self, id_):
+        self.id = id_
+        self.metadata_doc = {"id": id_, "padding": "x" * 100}
+
+
+@pytest.fixture
+def fake_index():
+    index = MagicMock()
+    index.datasets.bulk_get.side_effect = lambda ids: [FakeDataset(i) for i in ids]
+    return index
+
+
+def test_dataset_cache_disabled(fake_index):
+    cache = DatasetCache()
+    assert not cache.enabled
+    dss = cache.get_datasets(fake_index, ["a", "b"])
+    assert [ds.id for ds in dss] == ["a", "b"]
+    dss = cache.get_datasets(fake_index, ["a", "b"])
+    assert fake_index.datasets.bulk_get.call_count == 2
+    assert cache.stats()["datasets"] == 0
+
+
+def test_dataset_cache_hits(fake_index):
+    cache = DatasetCache(max_datasets=10)
+    dss = cache.get_datasets(fake_index, ["a", "b"])
+    assert [ds.id for ds in dss] == ["a", "b"]
+    dss = cache.get_datasets(fake_index, ["b", "c", "a"])
+    assert [ds.id for ds in dss] == ["b", "c", "a"]
+    fake_index.datasets.bulk_get.assert_called_with(["c"])
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+    assert stats["datasets"] == 3
+    # Memory use is only estimated if there is a memory limit.
+    assert stats["bytes"] == 0
+    cache.clear()
+    assert cache.stats()["datasets"] == 0
+
+
+def test_dataset_cache_eviction(fake_index):
+    cache = DatasetCache(max_datasets=2)
+    cache.get_datasets(fake_index, ["a", "b"])
+    cache.get_datasets(fake_index, ["a"])
+    cache.get_datasets(fake_index, ["c"])
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["datasets"] == 2
+    # "b" was least recently used
+    cache.get_datasets(fake_index, ["a", "b", "c"])
+    fake_index.datasets.bulk_get.assert_called_with(["b"])
+
+
+def test_dataset_cache_memory_limit(fake_index):
+    cache = DatasetCache(max_datasets=100, max_bytes=300)
+    cache.get_datasets(fake_index, ["a", "b", "c", "d"])
+    stats = cache.stats()
+    assert stats["datasets"] == 2
+    assert stats["bytes"] <= 300
+
+
+def test_dataset_cache_refresh(fake_index, monkeypatch):
+    import datetime
+    stamps = [None]
+    reads = []
+
+    def read_stamp(index):
+        reads.append(stamps[0])
+        return stamps[0]
+
+    cache = DatasetCache(max_datasets=10, refresh_check_interval=0)
+    monkeypatch.setattr(cache, "_read_refresh_stamp", read_stamp)
+    cache.get_datasets(fake_index, ["a", "b"])
+    cache.get_datasets(fake_index, ["a", "b"])
+    assert cache.stats()["hits"] == 2
+    # Refresh recorded by datacube-ows-update --views in another process
+    stamps[0] = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+    cache.get_datasets(fake_index, ["a", "b"])
+    stats = cache.stats()
+    assert stats["invalidations"] == 1
+    assert stats["hits"] == 2
+    fake_index.datasets.bulk_get.assert_called_with(["a", "b"])
+    cache.get_datasets(fake_index, ["a"])
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["hits"] == 3
+    # The refresh time is re-used within the check interval
+    cache.configure(max_datasets=10, refresh_check_interval=3600)
+    reads.clear()
+    cache.get_datasets(fake_index, ["a"])
+    cache.get_datasets(fake_index, ["a"])
+    assert len(reads) == 1
+
+
+def test_dataset_cache_no_refresh_table(fake_index):
+    from sqlalchemy.exc import ProgrammingError
+    conn = fake_index._db._engine.connect.return_value.__enter__.return_value
+    conn.execute.side_effect = ProgrammingError("SELECT", {}, Exception("relation does not exist"))
+    cache = DatasetCache(max_datasets=10)
+    assert [ds.id for ds in cache.get_datasets(fake_index, ["a"])] == ["a"]
+
+
+def test_mv_search_query():
+    import datetime
+
+    from datacube.utils import geometry
+    from sqlalchemy import MetaData
+    from sqlalchemy.dialects import postgresql
+
+    product = MagicMock()
+    product.id = 7
+    stv = get_st_view(MetaData(), "space_time_index")
+    geom = geometry.box(1000000, -4000000, 1100000, -3900000, "EPSG:3577")
+    s, geom_4326, orig_crs = mv_search_query(stv, MVSelectOpts.IDS, [datetime.date(2020, 1, 1)], geom, [product])
+    assert str(orig_crs) == "EPSG:3577"
+    assert str(geom_4326.crs) == "EPSG:4326"
+    sql = str(s.compile(dialect=postgresql.dialect()))
+    assert "FROM space_time_index" in sql
+    assert "lower(space_time_index.temporal_extent) >=" in sql
+    assert "spatial_extent && ST_GeomFromGeoJSON" in sql
+
+
+def test_mv_query_cache_shapes():
+    import datetime
+
+    cache = MVQueryCache(relation="space_time_index")
+    day = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    point = (day, day + datetime.timedelta(days=1))
+    key = cache.shape(MVSelectOpts.IDS, [point, point], True)
+    assert cache.shape(MVSelectOpts.IDS, [point, point], True) == key
+    assert cache.shape(MVSelectOpts.COUNT, [point, point], True) != key
+    assert cache.shape(MVSelectOpts.IDS, [point], True) != key
+    assert cache.shape(MVSelectOpts.IDS, [point, point], False) != key
+    query = cache.query(key)
+    assert cache.query(key) is query
+    assert len(cache) == 1
+    assert query.sql.startswith("SELECT CAST(id AS TEXT) FROM space_time_index WHERE ")
+    assert "dataset_type_ref = ANY(%s::smallint[])" in query.sql
+    assert query.sql.count("lower(temporal_extent) >= %s::timestamptz") == 2
+    assert "spatial_extent && ST_GeomFromWKB(%s::bytea, 4326)" in query.sql
+    assert query.prepare_sql.startswith(
+        f"PREPARE {query.name} (smallint[], timestamptz, timestamptz, timestamptz, timestamptz, bytea) AS SELECT"
+    )
+    assert "ST_GeomFromWKB($6, 4326)" in query.prepare_sql
+    assert query.execute_sql == f"EXECUTE {query.name} (%s, %s, %s, %s, %s, %s)"
+    cache.configure(relation="space_time_index")
+    assert len(cache) == 0
+    assert cache.query(key).name != query.name
+
+
+def test_mv_query_cache_execute():
+    import datetime
+
+    from datacube.utils import geometry
+    from psycopg2.extras import DateTimeTZRange
+
+    conn = MagicMock()
+    conn.connection.info = {}
+    geom = geometry.box(100, -30, 101, -29, "EPSG:4326")
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2020, 2, 1, tzinfo=datetime.timezone.utc)
+    cache = MVQueryCache()
+    cache.execute(conn, MVSelectOpts.COUNT, [datetime.date(2020, 1, 1), (start, end)], geom, [3, 4])
+    sql, params = conn.exec_driver_sql.call_args[0]
+    assert "temporal_extent && %s::tstzrange" in sql
+    assert params[0] == [3, 4]
+    assert params[1:3] == (start, start + datetime.timedelta(days=1))
+    assert params[3] == DateTimeTZRange(start, end)
+    assert bytes(params[4].adapted) == geom.geom.wkb
+
+    cache.configure(prepare=True)
+    cache.execute(conn, MVSelectOpts.IDS, None, None, [3])
+    assert conn.exec_driver_sql.call_count == 3
+    assert conn.exec_driver_sql.call_args_list[1][0][0].startswith("PREPARE ")
+    assert conn.exec_driver_sql.call_args[0][0].startswith("EXECUTE ")
+    assert conn.exec_driver_sql.call_args[0][1] == ([3],)
+    # Already prepared on this connection
+    cache.execute(conn, MVSelectOpts.IDS, None, None, [4])
+    assert conn.exec_driver_sql.call_count == 4
+    # New connection
+    conn.connection.info = {}
+    cache.execute(conn, MVSelectOpts.IDS, None, None, [4])
+    assert conn.exec_driver_sql.call_count == 6
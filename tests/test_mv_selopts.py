@@ -38,3 +38,12 @@ def test_count():
     sel = MVSelectOpts.COUNT.sel(stv)
     assert len(sel) == 1
     assert str(sel[0]) == "count(foo)"
+
+
+def test_count_ids():
+    from sqlalchemy import column
+    stv = MockSTV(id=column("foo"))
+    sel = MVSelectOpts.COUNT_IDS.sel(stv)
+    assert len(sel) == 2
+    assert str(sel[0]) == "count(foo)"
+    assert str(sel[1]) == "array_agg(CAST(foo AS TEXT))"
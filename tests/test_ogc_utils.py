@@ -6,6 +6,7 @@
 import datetime
 from unittest.mock import MagicMock
 
+import numpy
 import pytest
 import xarray
 from datacube.utils import geometry
@@ -306,6 +307,30 @@ def test_png_loop_over_anim():
     assert imgs.find(b"\x89PNG") == 0
 
 
+def test_png_palette():
+    import io
+
+    from PIL import Image
+    colours = numpy.array([[255, 0, 0, 255], [0, 255, 0, 128], [0, 0, 0, 0]], dtype="uint8")
+    idx = numpy.array([[0, 1, 2, 1, 0], [2, 2, 1, 0, 0]])
+    data = xarray.Dataset({
+        band: xarray.DataArray(colours[idx, i].T, dims=["x", "y"], coords=dict(xy_coords))
+        for i, band in enumerate(("red", "green", "blue", "alpha"))
+    })
+    rgba = datacube_ows.ogc_utils.xarray_image_as_png(data)
+    pal = datacube_ows.ogc_utils.xarray_image_as_png(data, palette=True, compress_level=9, strategy="rle")
+    assert Image.open(io.BytesIO(rgba)).mode == "RGBA"
+    pal_img = Image.open(io.BytesIO(pal))
+    assert pal_img.mode == "P"
+    numpy.testing.assert_array_equal(numpy.asarray(pal_img.convert("RGBA")), colours[idx])
+    numpy.testing.assert_array_equal(numpy.asarray(Image.open(io.BytesIO(rgba))), colours[idx])
+    # Too many colours for a palette
+    many = numpy.arange(300 * 4, dtype="uint32").astype("uint8").reshape(10, 30, 4)
+    many[:, :, 0] = numpy.arange(300).reshape(10, 30) % 256
+    many[:, :, 1] = numpy.arange(300).reshape(10, 30) // 256
+    assert datacube_ows.ogc_utils.palette_image(many) is None
+
+
 def test_render_frame():
     data = xarray.Dataset({
         "red": dummy_da(100, "red", xy_coords, dtype="uint8"),
@@ -384,3 +409,15 @@ def test_log_call(monkeypatch):
     assert "timed_func" in FakeLogger._instance.slot
     assert "args" in FakeLogger._instance.slot
     assert "7" in FakeLogger._instance.slot
+
+
+def test_constant_band():
+    template = xarray.DataArray(numpy.zeros((2, 3, 3)), dims=["time", "y", "x"],
+                                coords={"time": [1, 2], "y": range(3), "x": range(3)})
+    band = datacube_ows.ogc_utils.constant_band(template, 4)
+    assert band.dtype == "uint8"
+    assert band.shape == template.shape
+    assert (band.values == 4).all()
+    assert datacube_ows.ogc_utils.constant_band_value(band) == 4
+    assert datacube_ows.ogc_utils.constant_band_value(template) is None
+    assert datacube_ows.ogc_utils.constant_band_value(template.copy(data=band.values.copy())) is None
@@ -0,0 +1,205 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from datacube_ows.product_ranges import (RANGE_MARK_LOOK_BACK, RangeSnapshot,
+                                         add_ranges, get_ranges,
+                                         update_range_entry)
+
+
+def range_row(**kwargs):
+    row = {
+        "lat_min": -1.0, "lat_max": 1.0, "lon_min": 10.0, "lon_max": 12.0,
+        "dates": ["2020-01-01", "2020-01-05"],
+        "bboxes": {"EPSG:4326": {"left": 10.0, "right": 12.0, "bottom": -1.0, "top": 1.0}},
+        "last_updated": datetime.datetime(2023, 1, 1),
+    }
+    row.update(kwargs)
+    return row
+
+
+@pytest.fixture
+def range_conn():
+    tables = {
+        "wms.product_ranges": [range_row(id=1), range_row(id=2, dates=[])],
+        "wms.multiproduct_ranges": [range_row(wms_product_name="multi", dates=["2021-02-03"])],
+        "wms.sub_product_ranges": [range_row(product_id=1, sub_product_id="sub")],
+    }
+    conn = MagicMock()
+    conn.execute.side_effect = lambda sql: tables[str(sql).split()[-1]]
+    return conn
+
+
+@pytest.fixture
+def range_layer():
+    layer = MagicMock()
+    layer.multi_product = False
+    layer.product.id = 1
+    layer.time_resolution.is_subday.return_value = False
+    layer.global_cfg.alias_bboxes.side_effect = lambda bboxes: bboxes
+    return layer
+
+
+def test_range_snapshot(range_conn, range_layer):
+    with patch("datacube_ows.product_ranges.get_sqlconn") as get_conn:
+        get_conn.return_value = range_conn
+        snapshot = RangeSnapshot(MagicMock())
+    assert range_conn.execute.call_count == 3
+    range_conn.close.assert_called_once()
+    ranges = get_ranges(None, range_layer, snapshot=snapshot)
+    assert ranges["times"] == [datetime.date(2020, 1, 1), datetime.date(2020, 1, 5)]
+    assert ranges["end_time"] == datetime.date(2020, 1, 5)
+    assert ranges["lon"]["max"] == 12.0
+    # Parsed once, shared by all layers using the product
+    assert get_ranges(None, range_layer, snapshot=snapshot) is ranges
+    assert range_layer.global_cfg.alias_bboxes.call_count == 1
+    assert get_ranges(None, range_layer, path="sub", snapshot=snapshot)["times"][0] == datetime.date(2020, 1, 1)
+    assert get_ranges(None, range_layer, path="nosuchsub", snapshot=snapshot) is None
+    range_layer.product.id = 2
+    assert get_ranges(None, range_layer, snapshot=snapshot) is None
+    range_layer.product.id = 3
+    assert get_ranges(None, range_layer, snapshot=snapshot) is None
+    range_layer.multi_product = True
+    range_layer.name = "multi"
+    assert get_ranges(None, range_layer, snapshot=snapshot)["times"] == [datetime.date(2021, 2, 3)]
+    dc_product = MagicMock()
+    dc_product.id = 1
+    dc_product.time_resolution.is_subday.return_value = False
+    dc_product.global_cfg = range_layer.global_cfg
+    assert get_ranges(None, dc_product, is_dc_product=True, snapshot=snapshot) is ranges
+
+
+def incremental_conn(mark, archived=False, new=(None, None, None, None, 0), new_dates=()):
+    executed = []
+
+    def execute(sql, params=None):
+        sql = str(sql)
+        executed.append((sql, params))
+        result = MagicMock()
+        if "FROM wms.product_range_marks m" in sql:
+            result.first.return_value = mark
+        elif "archived >=" in sql:
+            result.scalar.return_value = archived
+        elif "st_extent" in sql:
+            result.first.return_value = new
+        elif "array_agg" in sql:
+            result.__iter__.return_value = iter([(list(new_dates),)])
+        return result
+    conn = MagicMock()
+    conn.execute.side_effect = execute
+    conn.executed = executed
+    return conn
+
+
+def incremental_update(conn):
+    product = MagicMock()
+    product.id = 1
+    product.name = "prod"
+    time_res = MagicMock()
+    time_res.is_solar.return_value = False
+    time_res.is_subday.return_value = False
+    with patch("datacube_ows.product_ranges.get_sqlconn") as get_conn:
+        get_conn.return_value = conn
+        return update_range_entry(MagicMock(), product, {}, time_res)
+
+
+def range_mark():
+    return range_row(last_added=datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc),
+                     last_checked=datetime.datetime(2023, 1, 2, tzinfo=datetime.timezone.utc),
+                     checked=datetime.datetime(2023, 1, 3, tzinfo=datetime.timezone.utc))
+
+
+def test_incremental_update_needs_mark():
+    conn = incremental_conn(None)
+    assert not incremental_update(conn)
+    conn.begin.return_value.rollback.assert_called_once()
+    conn.close.assert_called_once()
+
+
+def test_incremental_update_archived():
+    conn = incremental_conn(range_mark(), archived=True)
+    assert not incremental_update(conn)
+    conn.begin.return_value.rollback.assert_called_once()
+    assert not any("UPDATE wms.product_ranges" in sql for sql, _ in conn.executed)
+
+
+def test_incremental_update_no_new_datasets():
+    conn = incremental_conn(range_mark())
+    assert incremental_update(conn)
+    conn.begin.return_value.commit.assert_called_once()
+    assert not any("UPDATE wms.product_ranges" in sql for sql, _ in conn.executed)
+    assert any("INSERT INTO wms.product_range_marks" in sql for sql, _ in conn.executed)
+
+
+def test_incremental_update_merge():
+    new_dates = [MagicMock(lower=datetime.datetime(2020, 1, 3)), MagicMock(lower=datetime.datetime(2020, 1, 5))]
+    conn = incremental_conn(range_mark(), new=(-2.0, 0.5, 11.0, 13.0, 2), new_dates=new_dates)
+    assert incremental_update(conn)
+    conn.begin.return_value.commit.assert_called_once()
+    update = [params for sql, params in conn.executed if "UPDATE wms.product_ranges" in sql][0]
+    assert update["lat_min"] == -2.0
+    assert update["lat_max"] == 1.0
+    assert update["lon_min"] == 10.0
+    assert update["lon_max"] == 13.0
+    assert update["dates"].adapted == ["2020-01-01", "2020-01-03", "2020-01-05"]
+    since = [params for sql, params in conn.executed if "array_agg" in sql][0]["since"]
+    assert since == range_mark()["last_added"] - RANGE_MARK_LOOK_BACK
+    since = [params for sql, params in conn.executed if "st_extent" in sql][0]["since"]
+    assert since == range_mark()["last_added"] - RANGE_MARK_LOOK_BACK
+
+
+def test_add_ranges_jobs(capsys):
+    import threading
+    import time
+
+    def layer(name, products, multi=False):
+        lyr = MagicMock()
+        lyr.name = name
+        lyr.product_names = products
+        lyr.multi_product = multi
+        return lyr
+    cfg = MagicMock()
+    cfg.product_index = {
+        "a": layer("a", ["prod_a"]),
+        "b": layer("b", ["prod_b"]),
+        "ab": layer("ab", ["prod_a", "prod_b"], multi=True),
+    }
+    lock = threading.Lock()
+    updated = []
+    merged = []
+
+    def update(dc, pname, ows_prods, incremental):
+        time.sleep(0.05 if pname == "prod_a" else 0.01)
+        with lock:
+            updated.append(pname)
+        return pname == "prod_b"
+
+    def merge(dc, mp, crses):
+        with lock:
+            # Underlying products must all be updated before the merge.
+            merged.append((mp.name, sorted(updated)))
+
+    with patch("datacube_ows.product_ranges.get_config") as get_cfg, \
+            patch("datacube_ows.product_ranges.get_crses"), \
+            patch("datacube_ows.product_ranges.update_odc_product", side_effect=update), \
+            patch("datacube_ows.product_ranges.create_multiprod_range_entry", side_effect=merge):
+        get_cfg.return_value = cfg
+        errors = add_ranges(MagicMock(), ["a", "b", "ab"], jobs=2)
+        assert errors
+        assert merged == [("ab", ["prod_a", "prod_b"])]
+        output = capsys.readouterr().out
+        assert "ODC product prod_a:" in output
+        assert "Multiproduct layer ab:" in output
+        assert "3 updates (2 jobs)" in output
+
+        updated.clear()
+        merged.clear()
+        assert not add_ranges(MagicMock(), ["ab"], merge_only=True, jobs=2)
+        assert updated == []
+        assert merged == [("ab", [])]
@@ -34,3 +34,13 @@ def test_qpf_info():
     qp["foo"] = "splunge"
     prof = qp.profile()
     assert prof["info"]["foo"] == "splunge"
+
+
+def test_qpf_duration():
+    qp = QueryProfiler(False)
+    assert qp.duration("foo") is None
+    qp.start_event("foo")
+    assert qp.duration("foo") is None
+    qp.end_event("foo")
+    assert qp.duration("foo") >= 0.0
+    assert qp.profile() == {}
@@ -0,0 +1,77 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from datacube_ows.range_refresher import RangeRefresher
+
+
+@pytest.fixture
+def refresh_cfg():
+    cfg = MagicMock()
+    dynamic = MagicMock()
+    dynamic.dynamic = True
+    dynamic.ready = True
+    static = MagicMock()
+    static.dynamic = False
+    static.ready = True
+    cfg.product_index = {"dynamic": dynamic, "static": static}
+    return cfg
+
+
+@contextmanager
+def fake_cube():
+    yield MagicMock()
+
+
+def test_refresher_disabled(refresh_cfg):
+    refresher = RangeRefresher()
+    assert not refresher.enabled
+    assert not refresher.ensure_running(refresh_cfg)
+
+
+def test_refresh(refresh_cfg):
+    refresher = RangeRefresher()
+    refresher.configure(60)
+    refresher.metrics = {"duration": MagicMock(), "timestamp": MagicMock()}
+    with patch("datacube_ows.range_refresher.cube", fake_cube), \
+            patch("datacube_ows.product_ranges.RangeSnapshot") as snapshot:
+        refresher.refresh(refresh_cfg)
+    refresh_cfg.product_index["dynamic"].force_range_update.assert_called_once()
+    assert refresh_cfg.product_index["dynamic"].force_range_update.call_args.kwargs["snapshot"] is snapshot.return_value
+    refresh_cfg.product_index["static"].force_range_update.assert_not_called()
+    stats = refresher.stats()
+    assert stats["refreshes"] == 1
+    assert stats["failures"] == 0
+    assert stats["staleness"] < 60
+    refresher.metrics["duration"].set.assert_called_once_with(refresher.last_duration)
+    refresher.metrics["timestamp"].set.assert_called_once_with(refresher.last_refresh)
+
+
+def test_refresh_failure(refresh_cfg):
+    refresher = RangeRefresher()
+    refresher.configure(60)
+    with patch("datacube_ows.range_refresher.cube", fake_cube), \
+            patch("datacube_ows.product_ranges.RangeSnapshot") as snapshot:
+        snapshot.side_effect = Exception("No database")
+        refresher.refresh(refresh_cfg)
+    assert refresher.stats()["failures"] == 1
+    assert refresher.stats()["staleness"] is None
+
+
+def test_refresher_thread(refresh_cfg):
+    refresher = RangeRefresher()
+    refresher.configure(3600)
+    assert refresher.ensure_running(refresh_cfg)
+    thread = refresher._thread
+    assert thread.is_alive()
+    assert refresher.ensure_running(refresh_cfg)
+    assert refresher._thread is thread
+    refresher.configure(0)
+    thread.join(timeout=5)
+    assert not thread.is_alive()
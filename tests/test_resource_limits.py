@@ -31,6 +31,7 @@ def test_request_scale():
                                                     stdtile, 4,
                                                     total_band_size=6)
     assert pytest.approx(rs2.zoom_lvl_offset, 1e-8) == 1.0
+    assert rs2.data_bytes == 256 * 256 * 4 * 6
     rs3 = datacube_ows.resource_limits.RequestScale(geom.CRS("EPSG:3857"), (25.0, 25.0),
                                                    stdtile, 64,
                                                    total_band_size=6)
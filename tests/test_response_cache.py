@@ -0,0 +1,135 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+import fnmatch
+from unittest.mock import MagicMock
+
+from datacube_ows.response_cache import (DiskCacheBackend, MemoryCacheBackend,
+                                         RedisCacheBackend, ResponseCache,
+                                         get_map_cache_key)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.expiries = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.expiries[key] = ex
+
+    def scan_iter(self, match="*"):
+        return [k for k in list(self.store) if fnmatch.fnmatch(k, match)]
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+def test_memory_backend_lru():
+    backend = MemoryCacheBackend(max_entries=2, max_bytes=10)
+    backend.put("a", b"1234")
+    backend.put("b", b"5678")
+    assert backend.get("a") == b"1234"
+    backend.put("c", b"9")
+    # b was least recently used
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1234"
+    backend.put("d", b"abcdefg")
+    assert backend.bytes <= 10
+    assert backend.get("c") is None
+    backend.clear()
+    assert backend.get("d") is None
+    assert backend.bytes == 0
+
+
+def test_memory_backend_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("datacube_ows.response_cache.monotonic", lambda: now[0])
+    backend = MemoryCacheBackend(max_age=10)
+    backend.put("a", b"1")
+    now[0] += 5
+    assert backend.get("a") == b"1"
+    now[0] += 10
+    assert backend.get("a") is None
+
+
+def test_disk_backend(tmp_path):
+    backend = DiskCacheBackend(str(tmp_path / "cache"))
+    assert backend.get("abcdef") is None
+    backend.put("abcdef", b"png bytes")
+    assert backend.get("abcdef") == b"png bytes"
+    assert (tmp_path / "cache" / "ab" / "abcdef").exists()
+    # Shared between backend instances (e.g. worker processes)
+    assert DiskCacheBackend(str(tmp_path / "cache")).get("abcdef") == b"png bytes"
+    assert DiskCacheBackend(str(tmp_path / "cache"), max_age=1).get("abcdef") == b"png bytes"
+    backend.clear()
+    assert backend.get("abcdef") is None
+
+
+def test_redis_backend():
+    client = FakeRedis()
+    backend = RedisCacheBackend(client=client, key_prefix="test:", max_age=60)
+    backend.put("a", b"1")
+    assert client.store == {"test:a": b"1"}
+    assert client.expiries == {"test:a": 60}
+    assert backend.get("a") == b"1"
+    client.store["other:a"] = b"2"
+    backend.clear()
+    assert client.store == {"other:a": b"2"}
+
+
+def test_response_cache():
+    cache = ResponseCache()
+    assert not cache.enabled
+    assert cache.get("key") is None
+    cache.configure(MemoryCacheBackend())
+    assert cache.enabled
+    assert cache.get("key") is None
+    cache.put("key", b"body", 42)
+    assert cache.get("key") == (b"body", 42)
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    cache.clear()
+    assert cache.get("key") is None
+    cache.configure(None)
+    assert not cache.enabled
+
+
+def test_range_stamp(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("datacube_ows.response_cache.monotonic", lambda: now[0])
+    cache = ResponseCache()
+    cache.configure(MemoryCacheBackend(), range_check_interval=30)
+    stamps = [datetime.datetime(2023, 1, 1), datetime.datetime(2023, 2, 1)]
+    lookup = MagicMock(side_effect=stamps)
+    assert cache.range_stamp("layer", lookup) == "2023-01-01T00:00:00"
+    now[0] += 10
+    assert cache.range_stamp("layer", lookup) == "2023-01-01T00:00:00"
+    assert lookup.call_count == 1
+    now[0] += 30
+    assert cache.range_stamp("layer", lookup) == "2023-02-01T00:00:00"
+    assert lookup.call_count == 2
+
+
+def test_get_map_cache_key():
+    from datacube.utils.geometry import CRS
+
+    from datacube_ows.ogc_utils import create_geobox
+    layer = MagicMock()
+    layer.name = "a_layer"
+    style = MagicMock()
+    style.name = "a_style"
+    times = [datetime.date(2021, 1, 1)]
+    geobox = create_geobox(CRS("EPSG:3857"), 0, 0, 1000, 1000, width=256, height=256)
+    same_geobox = create_geobox(CRS("EPSG:3857"), 0.0, 0.0, 1000.0, 1000.0, width=256, height=256)
+    key = get_map_cache_key(layer, style, times, geobox, "image/png", "stamp1")
+    assert key == get_map_cache_key(layer, style, times, same_geobox, "image/png", "stamp1")
+    assert key != get_map_cache_key(layer, style, times, geobox, "image/png", "stamp2")
+    assert key != get_map_cache_key(layer, style, [datetime.date(2021, 1, 2)], geobox, "image/png", "stamp1")
+    other_geobox = create_geobox(CRS("EPSG:3857"), 0, 0, 1000, 1000, width=512, height=512)
+    assert key != get_map_cache_key(layer, style, times, other_geobox, "image/png", "stamp1")
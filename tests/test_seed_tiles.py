@@ -0,0 +1,62 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+from unittest.mock import MagicMock
+
+import pytest
+
+import datacube_ows.seed_tiles_impl
+from datacube_ows.seed_tiles_impl import (FAILED, RENDERED, SKIPPED,
+                                          progress_key, read_progress, seed,
+                                          tile_requests)
+
+
+@pytest.fixture
+def tms():
+    tms = MagicMock()
+    tms.identifier = "a_tms"
+    tms.tile_ranges.side_effect = lambda zoom, bbox: (range(0, zoom + 1), range(0, 2 ** zoom))
+    return tms
+
+
+def test_tile_requests(tms):
+    tiles = tile_requests("a_layer", "a_style", tms, range(0, 3), {}, ["2020-01-01", "2020-02-01"])
+    assert len(tiles) == 2 * (1 + 2 * 2 + 3 * 4)
+    assert tiles[0]["tilematrix"] == "0"
+    assert tiles[-1]["time"] == "2020-02-01"
+    assert tiles[-1]["tilematrix"] == "2"
+    assert tiles[-1]["tilerow"] == "2"
+    assert tiles[-1]["tilecol"] == "3"
+    assert len(set(progress_key(t) for t in tiles)) == len(tiles)
+
+
+def test_seed_resume(tms, tmp_path, monkeypatch):
+    def fake_seed_map(wms_args):
+        if wms_args["bbox"] == "failing":
+            raise Exception("Boom")
+        return 0 if wms_args["bbox"] == "empty" else 3
+
+    def fake_args_to_wms(tile, cfg):
+        return {"bbox": {"0": "failing", "1": "empty"}.get(tile["tilecol"], "full")}
+
+    monkeypatch.setattr(datacube_ows.seed_tiles_impl, "seed_map", fake_seed_map)
+    monkeypatch.setattr(datacube_ows.seed_tiles_impl, "wmts_args_to_wms", fake_args_to_wms)
+    monkeypatch.setattr(datacube_ows.seed_tiles_impl, "get_config", MagicMock)
+    progress_file = str(tmp_path / "progress.txt")
+    tiles = tile_requests("a_layer", "a_style", tms, range(0, 3), {}, ["2020-01-01"])
+    stats = seed(tiles, progress_file=progress_file, report_every=0)
+    assert stats[FAILED] == 6
+    assert stats[SKIPPED] == 5
+    assert stats[RENDERED] == 6
+    done = read_progress(progress_file)
+    assert len(done) == 11
+    remaining = [t for t in tiles if progress_key(t) not in done]
+    assert len(remaining) == 6
+    assert all(t["tilecol"] == "0" for t in remaining)
+
+
+def test_read_progress_missing(tmp_path):
+    assert read_progress(None) == set()
+    assert read_progress(str(tmp_path / "no_such_file")) == set()
@@ -11,8 +11,8 @@ import pytest
 from xarray import DataArray, Dataset, concat
 
 import datacube_ows.styles
-from datacube_ows.config_utils import OWSEntryNotFound
-from datacube_ows.ogc_utils import ConfigException
+from datacube_ows.config_utils import AbstractMaskRule, OWSEntryNotFound
+from datacube_ows.ogc_utils import ConfigException, constant_band
 from datacube_ows.ows_configuration import BandIndex, OWSProductLayer
 
 
@@ -279,6 +279,30 @@ def style_cfg_map_alpha_3():
     return cfg
 
 
+@pytest.mark.parametrize("rule_cfg", [
+    {"values": [3]},
+    {"values": [1, 2]},
+    {"flags": {"nodata": True}},
+    {"flags": {"or": {"nodata": False, "cloud": True}}},
+    {"flags": {"nodata": True}, "invert": True},
+])
+def test_mask_rule_constant_band(rule_cfg):
+    template = DataArray(np.zeros((2, 3, 3)), dims=["time", "y", "x"],
+                         coords={"time": [1, 2], "y": range(3), "x": range(3)})
+    const = constant_band(template, 3)
+    const.attrs["flags_definition"] = {
+        "nodata": {"bits": 0, "values": {"0": False, "1": True}},
+        "cloud": {"bits": 1, "values": {"0": False, "1": True}},
+    }
+    rule = AbstractMaskRule("pq", rule_cfg)
+    mask = rule.create_mask(const)
+    # Evaluated symbolically - no per-pixel mask is materialised
+    assert not any(mask.values.strides)
+    assert mask.dims == const.dims
+    expected = rule.create_mask(const.copy(data=np.array(const.values)))
+    assert (mask.values == expected.values).all()
+
+
 def test_valuemap_ctor():
     style = MagicMock()
     style.name = "style_name"
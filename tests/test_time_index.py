@@ -0,0 +1,72 @@
+# This file is part of datacube-ows, part of the Open Data Cube project.
+# See https://opendatacube.org for more information.
+#
+# Copyright (c) 2017-2023 OWS Contributors
+# SPDX-License-Identifier: Apache-2.0
+import datetime
+
+import pytz
+
+from datacube_ows.time_index import TimeIndex, as_time_index
+
+
+def test_date_index():
+    dates = [datetime.date(2020, 1, 1), datetime.date(2020, 1, 5), datetime.date(2020, 2, 1)]
+    index = TimeIndex(dates)
+    assert not index.subday
+    assert len(index) == 3
+    assert index[0] == dates[0]
+    assert index[-1] == dates[-1]
+    assert index[1:] == dates[1:]
+    assert list(index) == dates
+    assert index == dates
+    assert index.nbytes == 24
+    assert datetime.date(2020, 1, 5) in index
+    assert datetime.date(2020, 1, 6) not in index
+    assert datetime.datetime(2020, 1, 5) not in index
+    assert "2020-01-05" not in index
+    assert as_time_index(index) is index
+    assert as_time_index(dates) == index
+
+
+def test_date_index_from_strings():
+    index = TimeIndex.from_strings(["2020-01-01", None, "2020-01-05"], False)
+    assert index == [datetime.date(2020, 1, 1), datetime.date(2020, 1, 5)]
+    assert isinstance(index[0], datetime.date)
+
+
+def test_date_index_lookups():
+    index = TimeIndex([datetime.date(2020, 1, 1), datetime.date(2020, 1, 5), datetime.date(2020, 2, 1)])
+    assert index.between(datetime.date(2020, 1, 2), datetime.date(2020, 2, 1)) == [
+        datetime.date(2020, 1, 5), datetime.date(2020, 2, 1)
+    ]
+    assert index.between(datetime.date(2021, 1, 1), datetime.date(2021, 2, 1)) == []
+    assert index.first_between(datetime.date(2019, 1, 1), datetime.date(2020, 1, 3)) == datetime.date(2020, 1, 1)
+    assert index.first_between(datetime.date(2020, 1, 2), datetime.date(2020, 1, 3)) is None
+    assert index.nearest(datetime.date(2019, 1, 1)) == datetime.date(2020, 1, 1)
+    assert index.nearest(datetime.date(2020, 1, 3)) == datetime.date(2020, 1, 1)
+    assert index.nearest(datetime.date(2020, 1, 4)) == datetime.date(2020, 1, 5)
+    assert index.nearest(datetime.date(2021, 1, 1)) == datetime.date(2020, 2, 1)
+    assert TimeIndex([]).nearest(datetime.date(2021, 1, 1)) is None
+
+
+def test_subday_index():
+    index = TimeIndex.from_strings([
+        "1996-01-23T12:15:25.723411+00:00",
+        "1996-01-23T12:15:27.523410+00:00",
+        "1999-12-31T22:22:22.222222+00:00",
+    ], True)
+    assert index.subday
+    assert index[0] == datetime.datetime(1996, 1, 23, 12, 15, 25, 723411, tzinfo=pytz.utc)
+    assert index[0].tzinfo is not None
+    assert index[0].isoformat() == "1996-01-23T12:15:25.723411+00:00"
+    assert datetime.datetime(1996, 1, 23, 12, 15, 27, 523410, tzinfo=pytz.utc) in index
+    assert datetime.date(1996, 1, 23) not in index
+    assert index.matches_second(datetime.datetime(1996, 1, 23, 12, 15, 25, 1, tzinfo=pytz.utc))
+    assert index.matches_second(datetime.datetime(1996, 1, 23, 12, 15, 25))
+    assert not index.matches_second(datetime.datetime(1996, 1, 23, 12, 15, 26, 723411, tzinfo=pytz.utc))
+    assert index.first_between(
+        datetime.datetime(1996, 1, 23, 12, 15, 26, tzinfo=pytz.utc),
+        datetime.datetime(2000, 1, 1, tzinfo=pytz.utc),
+    ) == datetime.datetime(1996, 1, 23, 12, 15, 27, 523410, tzinfo=pytz.utc)
+    assert not TimeIndex([datetime.date(2020, 1, 1)]).matches_second(datetime.datetime(2020, 1, 1))